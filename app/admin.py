@@ -0,0 +1,72 @@
+import asyncio
+import hmac
+from typing import Optional
+
+from fastapi import APIRouter, Depends, Header, HTTPException
+from fastapi.responses import JSONResponse, PlainTextResponse
+
+from app.config import ADMIN_TOKEN, PROFILE_INTERVAL_MS, PROFILE_MAX_SECONDS
+from app.tracing import ProfilerBusy, SamplingProfiler, Tracer
+
+
+def admin_router(tracer: Tracer, profiler: Optional[SamplingProfiler] = None,
+                 token: Optional[str] = ADMIN_TOKEN) -> APIRouter:
+    """
+    /admin endpoints shared by app/main.py and real_backend.py: tracing toggles, recent
+    traces, the slow-request log and the sampling profiler. Every call needs the
+    X-Admin-Token header; without a configured token they all answer 404.
+    """
+    profiler = profiler or SamplingProfiler()
+
+    def require_admin(x_admin_token: Optional[str] = Header(None)):
+        if not token:
+            raise HTTPException(status_code=404, detail="Not Found")
+        if x_admin_token is None or not hmac.compare_digest(x_admin_token, token):
+            raise HTTPException(status_code=403, detail="invalid admin token")
+
+    router = APIRouter(prefix="/admin", dependencies=[Depends(require_admin)])
+
+    @router.get("/tracing")
+    def tracing_state():
+        return tracer.stats()
+
+    @router.post("/tracing")
+    def configure_tracing(sample_rate: Optional[float] = None, slow_k: Optional[int] = None):
+        """
+        Change the trace sample rate (0..1) and / or the slow-log size (0 = off) at runtime.
+        """
+        tracer.configure(sample_rate, slow_k)
+        return tracer.stats()
+
+    @router.get("/traces")
+    def traces(request_id: Optional[str] = None):
+        """
+        Recent sampled traces, newest first; request_id (the X-Request-ID the response
+        carried) picks one.
+        """
+        return {"traces": tracer.find(request_id)}
+
+    @router.get("/slow")
+    def slow_requests():
+        return {"slow_k": tracer.slow_k, "requests": tracer.slowest()}
+
+    @router.get("/profile")
+    async def profile(seconds: float = 10.0, interval_ms: float = PROFILE_INTERVAL_MS, thread: Optional[str] = None):
+        """
+        Sample every thread's stack for `seconds` (at most PROFILE_MAX_SECONDS) and return
+        collapsed stacks (text/plain), e.g. `flamegraph.pl profile.txt > profile.svg` or
+        drop the file on speedscope. thread: only threads whose name starts with this
+        (e.g. "inference").
+        """
+        seconds = min(max(seconds, 0.1), PROFILE_MAX_SECONDS)
+        interval = max(interval_ms, 1.0) / 1000.0
+        loop = asyncio.get_running_loop()
+        try:
+            # the loop's default executor: a profile must not take an inference slot
+            collapsed, summary = await loop.run_in_executor(None, profiler.profile, seconds, interval, thread)
+        except ProfilerBusy as e:
+            return JSONResponse(status_code=409, content={"error": str(e)})
+        return PlainTextResponse(collapsed, headers={"X-Profile-Samples": str(summary["samples"]),
+                                                     "X-Profile-Stacks": str(summary["stacks"])})
+
+    return router
@@ -0,0 +1,235 @@
+import os
+import threading
+import time
+from typing import Dict, List, Optional, Set
+
+import numpy as np
+
+from app.quantization import kmeans, nearest_centroid
+
+
+class IVFIndex:
+    kind = "ivf"
+
+    def __init__(self, path: str, nlist: int = 1024, nprobe: int = 16):
+        """
+        Inverted-file index: a k-means coarse quantizer splits the vectors into `nlist`
+        cells; a query only visits the `nprobe` cells whose centroids are closest.
+          - ivf_centroids.npy : trained (nlist, dim) centroids
+          - ivf_assign.bin    : int32 cell id per row, appended on every insert
+        Inverted lists are rebuilt in RAM from the assignment file on load.
+        """
+        self.path = path
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self._centroids_path = os.path.join(path, "ivf_centroids.npy")
+        self._assign_path = os.path.join(path, "ivf_assign.bin")
+        self.centroids: Optional[np.ndarray] = None
+        self._lists: List[List[int]] = []
+        self._size = 0
+        self._lock = threading.Lock()
+
+    @property
+    def trained(self) -> bool:
+        return self.centroids is not None
+
+    def __len__(self) -> int:
+        return self._size
+
+    def load(self, dim: int, limit: int, read_only: bool = False) -> bool:
+        """
+        Load a trained index; rows >= limit (written by an interrupted insert) are dropped
+        (and truncated from the file unless read_only).
+        """
+        if not os.path.exists(self._centroids_path):
+            return False
+        self.centroids = np.load(self._centroids_path)
+        assign = np.fromfile(self._assign_path, dtype=np.int32) if os.path.exists(self._assign_path) else []
+        if len(assign) > limit:
+            assign = assign[:limit]
+            if not read_only:
+                with open(self._assign_path, "r+b") as f:
+                    f.truncate(limit * 4)
+        self._lists = [[] for _ in range(len(self.centroids))]
+        for row, cell in enumerate(assign):
+            self._lists[cell].append(row)
+        self._size = len(assign)
+        return True
+
+    def train(self, sample: np.ndarray):
+        # ~40 training points per cell at least, or the cells are noise
+        nlist = max(1, min(self.nlist, len(sample) // 39))
+        centroids = kmeans(sample, nlist, iters=20)
+        centroids /= np.maximum(np.linalg.norm(centroids, axis=1, keepdims=True), 1e-12)
+        self.centroids = centroids.astype(np.float32)
+        self._lists = [[] for _ in range(len(self.centroids))]
+        self._size = 0
+        np.save(self._centroids_path, self.centroids)
+        if os.path.exists(self._assign_path):
+            os.remove(self._assign_path)
+
+    def add(self, start_row: int, vectors: np.ndarray):
+        """
+        Insert rows start_row .. start_row + len(vectors) - 1 (must follow the last row).
+        """
+        cells = nearest_centroid(np.asarray(vectors, dtype=np.float32), self.centroids).astype(np.int32)
+        with self._lock:
+            with open(self._assign_path, "ab") as f:
+                cells.tofile(f)
+            for offset, cell in enumerate(cells):
+                self._lists[cell].append(start_row + offset)
+            self._size = start_row + len(cells)
+
+    def candidates(self, query: np.ndarray, k: int, nprobe: Optional[int] = None, **kwargs) -> Optional[np.ndarray]:
+        """
+        Rows of the `nprobe` closest cells, plus the next closest ones while that is fewer
+        than k rows (small or skewed cells would otherwise starve a deep query).
+        """
+        nprobe = min(nprobe or self.nprobe, len(self.centroids))
+        order = np.argsort(-(self.centroids @ query))
+        cells, found = [], 0
+        for rank, cell in enumerate(order):
+            if rank >= nprobe and found >= k:
+                break
+            cells.append(cell)
+            found += len(self._lists[cell])
+        rows = [self._lists[c] for c in cells if self._lists[c]]
+        return np.concatenate([np.asarray(r, dtype=np.int64) for r in rows]) if rows else np.zeros(0, dtype=np.int64)
+
+    def delete(self, rows: List[int]):
+        pass  # deleted rows are filtered out by the caller's alive mask
+
+    def save(self):
+        pass  # every insert is already appended to disk
+
+    def stats(self) -> Dict[str, object]:
+        return {"index": self.kind, "nlist": 0 if self.centroids is None else len(self.centroids),
+                "nprobe": self.nprobe, "size": self._size}
+
+
+class HNSWIndex:
+    kind = "hnsw"
+
+    def __init__(self, path: str, m: int = 16, ef_construction: int = 200, ef: int = 64,
+                 save_interval: float = 30.0):
+        """
+        HNSW graph (inner product over normalized vectors) backed by the optional
+        `hnswlib` package. Saved to hnsw.bin at most every `save_interval` seconds; rows
+        added after the last save are re-inserted from the vector file on load.
+        """
+        self.path = path
+        self.m = m
+        self.ef_construction = ef_construction
+        self.ef = ef
+        self.save_interval = save_interval
+        self._index_path = os.path.join(path, "hnsw.bin")
+        self._index = None
+        self._dim: Optional[int] = None
+        self._last_save = 0.0
+        # labels marked deleted: hnswlib's get_current_count() still counts them, and does
+        # not tell which ones are (a set, so re-deleting a row after a reload is harmless)
+        self._dead: Set[int] = set()
+        self._lock = threading.Lock()
+
+    @property
+    def trained(self) -> bool:
+        return self._index is not None
+
+    def __len__(self) -> int:
+        # labels stored, deleted ones included (the next row to insert), like IVFIndex
+        return 0 if self._index is None else self._index.get_current_count()
+
+    @property
+    def live(self) -> int:
+        return len(self) - len(self._dead)
+
+    def _new(self, dim: int, capacity: int):
+        try:
+            import hnswlib
+        except ImportError as exc:
+            raise ImportError("NUMPY_ANN_INDEX = 'hnsw' needs the hnswlib package (pip install hnswlib)") from exc
+        index = hnswlib.Index(space="ip", dim=dim)
+        index.init_index(max_elements=max(capacity, 1024), ef_construction=self.ef_construction, M=self.m)
+        self._dim = dim
+        return index
+
+    def load(self, dim: int, limit: int, read_only: bool = False) -> bool:
+        """
+        Load a saved graph; labels >= limit (from an interrupted insert) are marked deleted
+        (in memory only, so read_only needs no special casing). Labels already deleted in
+        the saved graph are not known until the caller passes its deleted rows to delete().
+        """
+        if not os.path.exists(self._index_path):
+            return False
+        self._index = self._new(dim, 0)
+        self._index.load_index(self._index_path, max_elements=0)
+        self._dead = set()
+        for label in self._index.get_ids_list():
+            if label >= limit:
+                self._mark_deleted(label)
+        return True
+
+    def train(self, sample: np.ndarray):
+        # graph indexes need no training; the first insert creates the graph
+        self._index = self._new(sample.shape[1], len(sample))
+        self._dead = set()
+
+    def add(self, start_row: int, vectors: np.ndarray):
+        with self._lock:
+            needed = start_row + len(vectors)
+            if needed > self._index.get_max_elements():
+                self._index.resize_index(max(needed, 2 * self._index.get_max_elements()))
+            self._index.add_items(np.asarray(vectors, dtype=np.float32), np.arange(start_row, needed))
+            if self._dead:
+                # re-adding a label left by an interrupted insert revives it
+                self._dead.difference_update(range(start_row, needed))
+            if time.monotonic() - self._last_save > self.save_interval:
+                self.save()
+
+    def _mark_deleted(self, label: int):
+        if label >= len(self) or label in self._dead:
+            return  # never inserted, or already counted
+        try:
+            self._index.mark_deleted(label)
+        except RuntimeError:
+            pass  # already deleted in the saved graph: still dead, count it
+        self._dead.add(label)
+
+    def delete(self, rows: List[int]):
+        with self._lock:
+            for row in rows:
+                self._mark_deleted(int(row))
+
+    def candidates(self, query: np.ndarray, k: int, ef: Optional[int] = None, **kwargs) -> Optional[np.ndarray]:
+        """
+        Up to k nearest live rows; None when the graph cannot return them (hnswlib raises
+        when deletions leave fewer than k reachable labels), the caller then scans exactly.
+        """
+        with self._lock:
+            k = min(k, self.live)
+            if k <= 0:
+                return np.zeros(0, dtype=np.int64)
+            # ef is global to the hnswlib index, so set and query under the lock
+            self._index.set_ef(max(ef or self.ef, k))
+            try:
+                labels, _ = self._index.knn_query(query[None, :], k=k)
+            except RuntimeError:
+                return None
+        return labels[0].astype(np.int64)
+
+    def save(self):
+        self._index.save_index(self._index_path)
+        self._last_save = time.monotonic()
+
+    def stats(self) -> Dict[str, object]:
+        return {"index": self.kind, "M": self.m, "ef_construction": self.ef_construction,
+                "ef": self.ef, "size": self.live}
+
+
+def make_ann_index(kind: str, path: str, nlist: int = 1024, nprobe: int = 16, m: int = 16,
+                   ef_construction: int = 200, ef: int = 64):
+    if kind == "ivf":
+        return IVFIndex(path, nlist=nlist, nprobe=nprobe)
+    if kind == "hnsw":
+        return HNSWIndex(path, m=m, ef_construction=ef_construction, ef=ef)
+    raise ValueError(f"unknown ANN index {kind!r} (expected 'ivf' or 'hnsw')")
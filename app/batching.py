@@ -0,0 +1,97 @@
+import asyncio
+import contextvars
+import time
+from typing import Any, Callable, List, Optional
+
+
+class MicroBatcher:
+    def __init__(self, fn: Callable[[List[Any]], List[Any]], max_batch_size: int = 64,
+                 max_wait_ms: float = 3.0, executor=None):
+        """
+        Collects items submitted concurrently from the event loop and runs `fn` once per
+        batch instead of once per item.
+          - fn: takes a list of items, returns one result per item (in order)
+          - max_batch_size: a batch is dispatched as soon as it holds this many items
+          - max_wait_ms: how long the first item of a batch waits for company
+          - executor: where fn runs (None = the loop's default executor)
+        Only one batch runs at a time; items arriving meanwhile form the next batch,
+        so batches grow by themselves when the encoder is the bottleneck.
+        """
+        self.fn = fn
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max_wait_ms / 1000.0
+        self.executor = executor
+        self.batches = 0
+        self.items = 0
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+
+    async def submit(self, item: Any) -> Any:
+        """
+        Queue one item and wait for its result.
+        """
+        if self._worker is None or self._worker.done():
+            self._queue = asyncio.Queue()
+            # started in an empty context: the worker outlives the request that starts it
+            # and must not inherit its context (e.g. its trace)
+            self._worker = contextvars.Context().run(asyncio.get_running_loop().create_task, self._run())
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((item, future))
+        return await future
+
+    async def close(self):
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
+
+    async def _collect(self) -> list:
+        batch = [await self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._collect()
+            # callers that gave up (client disconnect, timeout) don't need encoding
+            batch = [(item, future) for item, future in batch if not future.done()]
+            if not batch:
+                continue
+            self.batches += 1
+            self.items += len(batch)
+            try:
+                results = await loop.run_in_executor(self.executor, self.fn, [item for item, _ in batch])
+            except Exception as exc:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(exc)
+                continue
+            for (_, future), result in zip(batch, results):
+                if not future.done():
+                    future.set_result(result)
+
+    def pending(self) -> int:
+        """
+        Items queued for the next batch (not counting the batch being encoded).
+        """
+        return self._queue.qsize() if self._queue is not None else 0
+
+    def stats(self):
+        return {
+            "pending": self.pending(),
+            "batches": self.batches,
+            "items": self.items,
+            "avg_batch_size": round(self.items / self.batches, 2) if self.batches else 0.0,
+        }
@@ -0,0 +1,332 @@
+import heapq
+import math
+import threading
+import time
+from collections import Counter, defaultdict
+from typing import Any, Dict, Hashable, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from app.lexical import PostingCursor, tokenize, wand_top_k
+
+
+class Segment:
+    def __init__(self, docnos: np.ndarray, keys: List[Hashable], doc_lens: np.ndarray,
+                 postings: Dict[str, Tuple[np.ndarray, np.ndarray]]):
+        """
+        Immutable slice of the index.
+          - docnos: global document numbers (ascending), local doc i <-> docnos[i]
+          - keys: external document keys, same order
+          - postings: term -> (local doc ids ascending, term frequencies)
+        """
+        self.docnos = docnos
+        self.keys = keys
+        self.doc_lens = doc_lens
+        self.postings = postings
+
+    def __len__(self) -> int:
+        return len(self.docnos)
+
+    @classmethod
+    def build(cls, docs: List[Tuple[int, Hashable, List[str]]]) -> "Segment":
+        """
+        Build a segment from (docno, key, tokens) triples given in docno order.
+        """
+        lists = defaultdict(lambda: ([], []))
+        for local, (_, _, tokens) in enumerate(docs):
+            for term, tf in Counter(tokens).items():
+                ids, tfs = lists[term]
+                ids.append(local)
+                tfs.append(tf)
+        postings = {t: (np.asarray(ids, dtype=np.int64), np.asarray(tfs, dtype=np.float32))
+                    for t, (ids, tfs) in lists.items()}
+        return cls(
+            np.asarray([d[0] for d in docs], dtype=np.int64),
+            [d[1] for d in docs],
+            np.asarray([len(d[2]) for d in docs], dtype=np.float32),
+            postings,
+        )
+
+    @classmethod
+    def merge(cls, segments: List["Segment"], deleted: set) -> Tuple["Segment", Counter, int]:
+        """
+        Merge segments into one, dropping deleted documents.
+        Returns the new segment plus the df and token-length contributions that were
+        dropped, so the caller can correct the global statistics.
+        """
+        docnos = np.concatenate([s.docnos for s in segments])
+        keys = [key for s in segments for key in s.keys]
+        doc_lens = np.concatenate([s.doc_lens for s in segments])
+        keep = ~np.isin(docnos, np.fromiter(deleted, dtype=np.int64, count=len(deleted)))
+        order = np.argsort(docnos, kind="stable")
+        order = order[keep[order]]
+        # old position in the concatenation -> new local id (-1 = dropped)
+        remap = np.full(len(docnos), -1, dtype=np.int64)
+        remap[order] = np.arange(len(order))
+
+        dropped_df = Counter()
+        lists = defaultdict(lambda: ([], []))
+        base = 0
+        for s in segments:
+            for term, (ids, tfs) in s.postings.items():
+                new_ids = remap[ids + base]
+                alive = new_ids >= 0
+                if not alive.all():
+                    dropped_df[term] += int((~alive).sum())
+                if alive.any():
+                    lists[term][0].append(new_ids[alive])
+                    lists[term][1].append(tfs[alive])
+            base += len(s)
+
+        postings = {}
+        for term, (id_parts, tf_parts) in lists.items():
+            ids = np.concatenate(id_parts)
+            tfs = np.concatenate(tf_parts)
+            by_id = np.argsort(ids, kind="stable")
+            postings[term] = (ids[by_id], tfs[by_id])
+        merged = cls(docnos[order], [keys[i] for i in order], doc_lens[order], postings)
+        return merged, dropped_df, int(doc_lens[~keep].sum())
+
+
+class BM25Index:
+    def __init__(self, k1: float = 1.2, b: float = 0.75, flush_docs: int = 1000,
+                 merge_factor: int = 4, background: bool = True):
+        """
+        Incremental BM25 index built from immutable, log-structured segments.
+          - new documents go to a small in-memory buffer
+          - every `flush_docs` documents the buffer is frozen into a segment
+          - segments of the same size tier are merged `merge_factor` at a time, on a
+            background thread when `background` is True (inline otherwise)
+          - corpus statistics (doc count, total length, document frequencies) are
+            maintained incrementally, so nothing is ever refit
+        Deletes are tombstones; deleted documents stop matching immediately and are
+        physically dropped (and removed from the statistics) when their segment is merged.
+        Searches run concurrently with ingestion on a snapshot of the segment list.
+        """
+        self.k1 = k1
+        self.b = b
+        self.flush_docs = flush_docs
+        self.merge_factor = max(2, merge_factor)
+        self.background = background
+
+        self.n_docs = 0
+        self.total_len = 0
+        self.df: Counter = Counter()
+        self.segments: List[Segment] = []
+        self.merges = 0
+
+        self._buffer: List[Tuple[int, Hashable, List[str]]] = []
+        self._buffer_segment: Optional[Segment] = None
+        self._next_docno = 0
+        self._docno_of: Dict[Hashable, int] = {}
+        self._deleted: set = set()
+        self._lock = threading.RLock()
+        self._merge_wanted = threading.Condition(self._lock)
+        self._merger: Optional[threading.Thread] = None
+        self._closed = False
+
+    # ---------- writes ----------
+
+    def add(self, key: Hashable, text: str):
+        self.add_many([(key, text)])
+
+    def add_many(self, docs: Iterable[Tuple[Hashable, str]]):
+        """
+        Add or replace documents by key.
+        """
+        tokenized = [(key, tokenize(text)) for key, text in docs]
+        with self._lock:
+            for key, tokens in tokenized:
+                self._delete_locked(key)
+                docno = self._next_docno
+                self._next_docno += 1
+                self._docno_of[key] = docno
+                self._buffer.append((docno, key, tokens))
+                self._buffer_segment = None
+                self.n_docs += 1
+                self.total_len += len(tokens)
+                self.df.update(set(tokens))
+            if len(self._buffer) >= self.flush_docs:
+                self._flush_locked()
+
+    def delete(self, key: Hashable):
+        with self._lock:
+            self._delete_locked(key)
+
+    def _delete_locked(self, key: Hashable):
+        docno = self._docno_of.pop(key, None)
+        if docno is None:
+            return
+        for i, (buffered_docno, _, tokens) in enumerate(self._buffer):
+            if buffered_docno == docno:
+                # still in memory: undo its statistics right away
+                del self._buffer[i]
+                self._buffer_segment = None
+                self.n_docs -= 1
+                self.total_len -= len(tokens)
+                self.df.subtract(set(tokens))
+                return
+        self._deleted.add(docno)
+
+    def flush(self):
+        with self._lock:
+            self._flush_locked()
+
+    def _flush_locked(self):
+        if not self._buffer:
+            return
+        self.segments = self.segments + [Segment.build(self._buffer)]
+        self._buffer = []
+        self._buffer_segment = None
+        if self.background:
+            self._ensure_merger()
+            self._merge_wanted.notify()
+        else:
+            while self._merge_once():
+                pass
+
+    # ---------- merging ----------
+
+    def _tier(self, segment: Segment) -> int:
+        return int(math.log(max(len(segment), 1) / self.flush_docs + 1, self.merge_factor))
+
+    def _pick_merge(self) -> Optional[List[Segment]]:
+        tiers = defaultdict(list)
+        for segment in self.segments:
+            tiers[self._tier(segment)].append(segment)
+        for tier in sorted(tiers):
+            if len(tiers[tier]) >= self.merge_factor:
+                return tiers[tier][:self.merge_factor]
+        return None
+
+    def _merge_once(self) -> bool:
+        with self._lock:
+            victims = self._pick_merge()
+            if not victims:
+                return False
+            deleted = set(self._deleted)
+        # the expensive part runs without the lock; searches keep using the old segments
+        merged, dropped_df, dropped_len = Segment.merge(victims, deleted)
+        dropped = set(np.concatenate([s.docnos for s in victims]).tolist()) & deleted
+        with self._lock:
+            remaining = [s for s in self.segments if all(s is not v for v in victims)]
+            self.segments = remaining + [merged]
+            self._deleted -= dropped
+            self.n_docs -= len(dropped)
+            self.total_len -= dropped_len
+            self.df.subtract(dropped_df)
+            self.merges += 1
+        return True
+
+    def _ensure_merger(self):
+        if self._merger is None or not self._merger.is_alive():
+            self._merger = threading.Thread(target=self._merge_loop, name="bm25-merger", daemon=True)
+            self._merger.start()
+
+    def _merge_loop(self):
+        while True:
+            with self._lock:
+                while not self._closed and self._pick_merge() is None:
+                    self._merge_wanted.wait()
+                if self._closed:
+                    return
+            self._merge_once()
+
+    def close(self):
+        with self._lock:
+            self._closed = True
+            self._merge_wanted.notify_all()
+
+    # ---------- reads ----------
+
+    def __len__(self) -> int:
+        return len(self._docno_of)
+
+    def vocabulary_size(self) -> int:
+        # df changes size under the lock (new terms, merges), so count under it too
+        with self._lock:
+            return sum(1 for count in self.df.values() if count > 0)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "documents": len(self._docno_of),
+                "segments": len(self.segments),
+                "buffered": len(self._buffer),
+                "deleted_pending_merge": len(self._deleted),
+                "merges": self.merges,
+                "vocabulary": self.vocabulary_size(),
+            }
+
+    def _snapshot(self):
+        with self._lock:
+            if self._buffer and self._buffer_segment is None:
+                self._buffer_segment = Segment.build(self._buffer)
+            segments = list(self.segments)
+            if self._buffer_segment is not None:
+                segments.append(self._buffer_segment)
+            avgdl = self.total_len / self.n_docs if self.n_docs else 0.0
+            return segments, self.n_docs, avgdl, set(self._deleted)
+
+    def score_bound(self, query: str) -> float:
+        """
+        Highest BM25 score any document could reach for this query
+        (each term saturating at idf * (k1 + 1)); used to map scores into [0, 1].
+        """
+        terms = set(tokenize(query))
+        with self._lock:
+            n_docs = self.n_docs
+            dfs = [self.df.get(t, 0) for t in terms]
+        return sum(math.log(1.0 + (n_docs - df + 0.5) / (df + 0.5)) * (self.k1 + 1.0) for df in dfs if df > 0)
+
+    def search(self, query: str, k: int = 5, deadline: Optional[float] = None,
+               keys: Optional[Iterable[Hashable]] = None) -> List[Tuple[Hashable, float]]:
+        """
+        BM25 top-k as [(key, score)], best first. Each segment is searched with WAND
+        over its posting lists; only documents containing a query term are scored.
+        deadline (time.monotonic() value) raises TimeoutError once passed (checked between
+        segments and inside WAND scoring).
+        keys restricts the search to these documents (e.g. the ones passing a metadata
+        filter): other postings are dropped before WAND, so they are never scored.
+        """
+        terms = set(tokenize(query))
+        segments, n_docs, avgdl, deleted = self._snapshot()
+        allowed = None
+        if keys is not None:
+            with self._lock:
+                allowed = np.sort(np.fromiter((self._docno_of[key] for key in keys if key in self._docno_of),
+                                              dtype=np.int64))
+            if not len(allowed):
+                return []
+        if not terms or not n_docs or k <= 0:
+            return []
+        idf = {}
+        for term in terms:
+            df = self.df.get(term, 0)
+            if df > 0:
+                idf[term] = math.log(1.0 + (n_docs - df + 0.5) / (df + 0.5))
+
+        deleted_docnos = np.fromiter(deleted, dtype=np.int64, count=len(deleted))
+        hits = []
+        for segment in segments:
+            if deadline is not None and time.monotonic() > deadline:
+                raise TimeoutError("lexical search deadline exceeded")
+            cursors = []
+            for term, weight in idf.items():
+                if term not in segment.postings:
+                    continue
+                ids, tfs = segment.postings[term]
+                if allowed is not None:
+                    keep = np.isin(segment.docnos[ids], allowed, assume_unique=True)
+                    ids, tfs = ids[keep], tfs[keep]
+                    if not len(ids):
+                        continue
+                norm = self.k1 * (1.0 - self.b + self.b * segment.doc_lens[ids] / avgdl)
+                scores = tfs * (self.k1 + 1.0) / (tfs + norm)
+                if len(deleted_docnos):
+                    scores = np.where(np.isin(segment.docnos[ids], deleted_docnos), 0.0, scores)
+                cursors.append(PostingCursor(ids, scores, weight))
+            for local, score in wand_top_k(cursors, k, deadline):
+                if score > 0:
+                    hits.append((score, segment.docnos[local], segment.keys[local]))
+        return [(key, score) for score, _, key in heapq.nlargest(k, hits, key=lambda h: (h[0], -h[1]))]
@@ -0,0 +1,150 @@
+import asyncio
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional
+
+_MISSING = object()
+
+
+class TTLCache:
+    def __init__(self, maxsize: int = 1024, ttl: Optional[float] = None):
+        """
+        Thread-safe LRU cache with an optional time-to-live (seconds).
+          - maxsize: least recently used entries are evicted beyond this many
+          - ttl: entries older than this are treated as misses (None = never expire)
+        maxsize <= 0 disables caching entirely.
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._data.get(key, _MISSING)
+            if entry is not _MISSING:
+                value, stored_at = entry
+                if self.ttl is None or time.monotonic() - stored_at < self.ttl:
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._data[key]
+            self.misses += 1
+            return default
+
+    def set(self, key: Hashable, value: Any):
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._data[key] = (value, time.monotonic())
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Hit/miss counters and current size, e.g. for /health.
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+            }
+
+
+class ResultCache:
+    def __init__(self, maxsize: int = 1024, ttl: Optional[float] = 60):
+        """
+        Search-result cache on top of TTLCache:
+          - entries belong to an index generation; the first lookup at a newer generation
+            drops everything cached before it
+          - identical concurrent misses are coalesced (single-flight): one caller computes,
+            the others wait for its result, so a burst of one query costs one search
+        get_or_compute serves threads (sync handlers), aget_or_compute the event loop.
+        cacheable(value) -> False returns a result without caching it (e.g. a degraded one).
+        """
+        self.cache = TTLCache(maxsize=maxsize, ttl=ttl)
+        self.coalesced = 0
+        self._generation: Optional[int] = None
+        self._flights: Dict[Hashable, Future] = {}
+        self._tasks: Dict[Hashable, asyncio.Future] = {}
+        self._lock = threading.Lock()
+
+    def _lookup(self, key: Hashable, generation: int) -> Any:
+        with self._lock:
+            if generation != self._generation:
+                self.cache.clear()
+                self._generation = generation
+        return self.cache.get((generation, key), _MISSING)
+
+    def get_or_compute(self, key: Hashable, generation: int, compute: Callable[[], Any],
+                       cacheable: Optional[Callable[[Any], bool]] = None) -> Any:
+        value = self._lookup(key, generation)
+        if value is not _MISSING:
+            return value
+        full_key = (generation, key)
+        with self._lock:
+            flight = self._flights.get(full_key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[full_key] = Future()
+            else:
+                self.coalesced += 1
+        if not leader:
+            return flight.result()
+        try:
+            value = compute()
+        except BaseException as e:
+            with self._lock:
+                self._flights.pop(full_key, None)
+            flight.set_exception(e)
+            raise
+        # cached before the flight ends, so a caller arriving in between does not recompute
+        if cacheable is None or cacheable(value):
+            self.cache.set(full_key, value)
+        with self._lock:
+            self._flights.pop(full_key, None)
+        flight.set_result(value)
+        return value
+
+    async def aget_or_compute(self, key: Hashable, generation: int, compute: Callable[[], Awaitable],
+                              cacheable: Optional[Callable[[Any], bool]] = None) -> Any:
+        value = self._lookup(key, generation)
+        if value is not _MISSING:
+            return value
+        full_key = (generation, key)
+        task = self._tasks.get(full_key)
+        if task is None:
+            # a task of its own, so a cancelled (disconnected) first caller does not
+            # cancel the computation the others are waiting for
+            task = self._tasks[full_key] = asyncio.ensure_future(compute())
+
+            def finish(done: asyncio.Future):
+                self._tasks.pop(full_key, None)
+                if done.cancelled() or done.exception() is not None:
+                    return
+                if cacheable is None or cacheable(done.result()):
+                    self.cache.set(full_key, done.result())
+
+            task.add_done_callback(finish)
+        else:
+            self.coalesced += 1
+        return await asyncio.shield(task)
+
+    def stats(self) -> Dict[str, Any]:
+        return dict(self.cache.stats(), coalesced=self.coalesced, generation=self._generation)
@@ -0,0 +1,139 @@
+import asyncio
+import threading
+from typing import Any, Dict, List, Optional
+
+import httpx
+import numpy as np
+
+
+class ChromaRestClient:
+    def __init__(self, base_url: str, collection: str = "documents", max_connections: int = 16,
+                 add_batch_size: int = 128, add_concurrency: int = 4, timeout: float = 30.0):
+        """
+        Async client for the chroma REST API (/api/v1) on one pooled keep-alive connection set.
+          - add_batch_size: rows per add request; a large add is split into such chunks
+          - add_concurrency: chunks in flight at once, so a remote server stays busy
+            without an unbounded number of requests (or JSON payloads) piling up
+        Embeddings are converted to JSON lists chunk by chunk, right before sending.
+        """
+        self.base_url = base_url.rstrip("/")
+        self.collection_name = collection
+        self.add_batch_size = add_batch_size
+        self.add_concurrency = max(1, add_concurrency)
+        self._http = httpx.AsyncClient(
+            base_url=self.base_url + "/api/v1",
+            timeout=timeout,
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+            transport=httpx.AsyncHTTPTransport(retries=2),
+        )
+        self._collection_id: Optional[str] = None
+
+    async def _request(self, method: str, path: str, payload: Optional[Dict[str, Any]] = None) -> Any:
+        resp = await self._http.request(method, path, json=payload)
+        resp.raise_for_status()
+        return resp.json()
+
+    async def collection_id(self) -> str:
+        if self._collection_id is None:
+            res = await self._request("POST", "/collections",
+                                      {"name": self.collection_name, "get_or_create": True})
+            self._collection_id = res["id"]
+        return self._collection_id
+
+    async def heartbeat(self) -> Any:
+        return await self._request("GET", "/heartbeat")
+
+    async def add(self, ids: List[str], documents: List[str], embeddings, upsert: bool = False,
+                  metadatas: Optional[List[Dict[str, Any]]] = None):
+        """
+        Add (or upsert) rows in chunks of add_batch_size, add_concurrency at a time.
+        metadatas: flat (scalar-valued) metadata per row, see app.filters.chroma_metadata.
+        """
+        cid = await self.collection_id()
+        vectors = np.asarray(embeddings, dtype=np.float32)
+        slots = asyncio.Semaphore(self.add_concurrency)
+
+        async def send(start: int):
+            async with slots:
+                stop = start + self.add_batch_size
+                payload = {"ids": ids[start:stop], "documents": documents[start:stop],
+                           "embeddings": vectors[start:stop].tolist()}
+                if metadatas:
+                    payload["metadatas"] = metadatas[start:stop]
+                await self._request("POST", f"/collections/{cid}/{'upsert' if upsert else 'add'}", payload)
+
+        await asyncio.gather(*(send(start) for start in range(0, len(ids), self.add_batch_size)))
+
+    async def get(self, ids: Optional[List[str]] = None, limit: Optional[int] = None,
+                  offset: Optional[int] = None, include: Optional[List[str]] = None) -> Dict[str, Any]:
+        cid = await self.collection_id()
+        payload = {"ids": ids, "limit": limit, "offset": offset,
+                   "include": include if include is not None else ["documents"]}
+        return await self._request("POST", f"/collections/{cid}/get", payload)
+
+    async def delete(self, ids: List[str]):
+        cid = await self.collection_id()
+        await self._request("POST", f"/collections/{cid}/delete", {"ids": ids})
+
+    async def count(self) -> int:
+        cid = await self.collection_id()
+        return await self._request("GET", f"/collections/{cid}/count")
+
+    async def query(self, query_embeddings, n_results: int = 10, include: Optional[List[str]] = None,
+                    where: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        cid = await self.collection_id()
+        payload = {"query_embeddings": np.asarray(query_embeddings, dtype=np.float32).tolist(),
+                   "n_results": n_results, "include": include or ["documents", "metadatas", "distances"]}
+        if where:
+            payload["where"] = where
+        return await self._request("POST", f"/collections/{cid}/query", payload)
+
+    async def aclose(self):
+        await self._http.aclose()
+
+
+class ChromaRestCollection:
+    def __init__(self, client: ChromaRestClient):
+        """
+        The chroma collection API VectorDB uses (add / upsert / get / delete / query /
+        count), on top of ChromaRestClient. The client lives on its own event-loop thread,
+        so worker threads (sync calls) and the FastAPI loop (run_async) share one
+        connection pool.
+        """
+        self.client = client
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name="chroma-rest", daemon=True)
+        self._thread.start()
+
+    def _call(self, coro) -> Any:
+        return asyncio.run_coroutine_threadsafe(coro, self._loop).result()
+
+    async def run_async(self, coro) -> Any:
+        """
+        Await a client coroutine from another event loop (e.g. a FastAPI handler).
+        """
+        return await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(coro, self._loop))
+
+    def add(self, ids: List[str], documents: List[str], embeddings, metadatas=None, **kwargs):
+        self._call(self.client.add(ids, documents, embeddings, metadatas=metadatas))
+
+    def upsert(self, ids: List[str], documents: List[str], embeddings, metadatas=None, **kwargs):
+        self._call(self.client.add(ids, documents, embeddings, upsert=True, metadatas=metadatas))
+
+    def get(self, ids: Optional[List[str]] = None, limit: Optional[int] = None,
+            offset: Optional[int] = None, include: Optional[List[str]] = None, **kwargs) -> Dict[str, Any]:
+        return self._call(self.client.get(ids=ids, limit=limit, offset=offset, include=include))
+
+    def delete(self, ids: List[str], **kwargs):
+        self._call(self.client.delete(ids))
+
+    def count(self) -> int:
+        return self._call(self.client.count())
+
+    def query(self, query_embeddings, n_results: int = 10, where: Optional[Dict[str, Any]] = None,
+              **kwargs) -> Dict[str, Any]:
+        return self._call(self.client.query(query_embeddings, n_results, where=where))
+
+    def close(self):
+        self._call(self.client.aclose())
+        self._loop.call_soon_threadsafe(self._loop.stop)
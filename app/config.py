@@ -1,5 +1,201 @@
+import os
+
 # Choose run mode:
 # MODE = "local"  -> PyCharm / local (uses embedded/local Chroma)
 # MODE = "docker" -> Docker Compose (connects to chroma service)
+# MODE = "numpy"  -> in-process exact search over memory-mapped vectors (no chroma)
 MODE = "local"
-# MODE = "docker"
\ No newline at end of file
+# MODE = "docker"
+
+# Ingestion:
+# DATA_PATH          -> file or directory indexed by POST /index (one document per line)
+# INGEST_BATCH_SIZE  -> documents encoded per batch
+# INGEST_MAX_IN_FLIGHT -> encoded batches allowed to wait for the DB writer (bounds memory)
+# INGEST_CHECKPOINT  -> progress file used to resume an interrupted run (None disables it)
+DATA_PATH = "app/data/sample_documents.txt"
+INGEST_BATCH_SIZE = 256
+INGEST_MAX_IN_FLIGHT = 2
+INGEST_CHECKPOINT = ".ingest_checkpoint.json"
+
+# Bulk ingestion CLI (python -m app.ingest):
+# INGEST_WORKERS           -> encoder processes (each loads its own model)
+# INGEST_TEXT_FIELD        -> JSONL key / CSV column holding the document text
+# INGEST_PROGRESS_INTERVAL -> seconds between progress lines
+# INGEST_CLI_CHECKPOINT    -> the CLI's own progress file (--checkpoint), apart from POST /index's
+INGEST_WORKERS = max(1, (os.cpu_count() or 1) // 4)
+INGEST_TEXT_FIELD = "text"
+INGEST_PROGRESS_INTERVAL = 5.0
+INGEST_CLI_CHECKPOINT = ".ingest_cli_checkpoint.json"
+
+# Text preprocessing (app.preprocessing.clean_texts):
+# PREPROCESS_CHUNK_SIZE -> texts cleaned per chunk (one pass of each stage over the chunk)
+# PREPROCESS_WORKERS    -> cleaning processes for large inputs (1 = clean in the calling process)
+PREPROCESS_CHUNK_SIZE = 2048
+PREPROCESS_WORKERS = 1
+
+# Query embedding cache (EmbeddingModel.embed_queries):
+# QUERY_CACHE_SIZE -> max cached query vectors (0 disables the cache)
+# QUERY_CACHE_TTL  -> seconds before a cached vector is recomputed (None = never)
+QUERY_CACHE_SIZE = 4096
+QUERY_CACHE_TTL = 3600
+
+# EMBEDDING_STORE -> sqlite file caching document embeddings by (model, content hash),
+# so re-indexing only encodes new or changed documents
+EMBEDDING_STORE = "embedding_store.sqlite3"
+
+# Micro-batching of concurrent /search queries into one encoder call:
+# QUERY_BATCH_MAX_SIZE -> most queries encoded together
+# QUERY_BATCH_WAIT_MS  -> how long a query waits for others to join its batch
+QUERY_BATCH_MAX_SIZE = 64
+QUERY_BATCH_WAIT_MS = 3.0
+
+# Pre-fork serving (python -m app.prefork): the master loads the model and, for
+# MODE = "numpy", a read-only index once, then forks workers sharing those pages.
+# PREFORK_WORKERS         -> worker processes
+# PREFORK_HOST / PORT     -> shared listening socket
+# PREFORK_REPORT_INTERVAL -> seconds between per-worker unique / shared memory reports (0 = off)
+PREFORK_WORKERS = 2
+PREFORK_HOST = "0.0.0.0"
+PREFORK_PORT = 8001
+PREFORK_REPORT_INTERVAL = 60
+
+# Startup: the API serves liveness (/health) at once and loads the model + index in the
+# background; /ready turns true only after the warm-up below.
+# WARMUP_ROUNDS      -> times each batch shape is encoded before the service reports ready
+# WARMUP_BATCH_SIZES -> encoder batch shapes to warm (the micro-batcher produces 1..QUERY_BATCH_MAX_SIZE)
+# STARTUP_RETRY_AFTER -> Retry-After seconds sent with 503s while still loading
+WARMUP_ROUNDS = 3
+WARMUP_BATCH_SIZES = [1, 8, QUERY_BATCH_MAX_SIZE]
+STARTUP_RETRY_AFTER = 5
+
+# Inference executor (encoding + vector queries) with backpressure:
+# INFERENCE_WORKERS     -> requests running inference concurrently
+# INFERENCE_QUEUE_SIZE  -> requests allowed to wait; beyond that the API answers 503
+# INFERENCE_RETRY_AFTER -> Retry-After (seconds) sent with the 503
+# INFERENCE_INTRA_OP_THREADS -> torch threads per forward pass, so workers don't oversubscribe cores
+INFERENCE_WORKERS = 2
+INFERENCE_QUEUE_SIZE = 32
+INFERENCE_RETRY_AFTER = 1
+INFERENCE_INTRA_OP_THREADS = max(1, (os.cpu_count() or 1) // INFERENCE_WORKERS)
+
+# NumPy backend (MODE = "numpy"):
+# NUMPY_INDEX_DIR         -> directory holding vectors.npy + the id/text sidecar
+# NUMPY_SEARCH_BLOCK_ROWS -> rows scored per matmul block (bounds search memory)
+NUMPY_INDEX_DIR = "local_numpy_index"
+NUMPY_SEARCH_BLOCK_ROWS = 65536
+# Compressed vectors for the NumPy backend (full-precision vectors stay on disk for reranking):
+# NUMPY_QUANTIZATION     -> None (exact), "sq8" (int8 scalar, 4x) or "pq" (product quantization)
+# NUMPY_PQ_M             -> PQ bytes per vector (must divide the dimension; 96 -> 16x for MiniLM)
+# NUMPY_QUANT_TRAIN_MIN  -> vectors needed before the quantizer is trained (exact search until then)
+# NUMPY_RERANK_FACTOR    -> candidates reranked exactly = k * this (raised automatically if needed)
+# NUMPY_RECALL_TOLERANCE -> allowed recall@10 loss vs exact search, checked after training
+NUMPY_QUANTIZATION = None
+NUMPY_PQ_M = 96
+NUMPY_QUANT_TRAIN_MIN = 10000
+NUMPY_RERANK_FACTOR = 4
+NUMPY_RECALL_TOLERANCE = 0.02
+
+# NUMPY_ANN_INDEX            -> None (full scan), "ivf" (inverted file, pure NumPy) or "hnsw" (needs hnswlib)
+# NUMPY_ANN_TRAIN_MIN        -> vectors needed before the ANN index is built (full scan until then)
+# NUMPY_IVF_NLIST            -> IVF cells (k-means centroids); ~sqrt(N) to 4*sqrt(N) is typical
+# NUMPY_IVF_NPROBE           -> cells visited per query (default; /search?nprobe= overrides)
+# NUMPY_HNSW_M               -> HNSW graph degree
+# NUMPY_HNSW_EF_CONSTRUCTION -> HNSW build-time beam width
+# NUMPY_HNSW_EF              -> HNSW query-time beam width (default; /search?ef= overrides)
+NUMPY_ANN_INDEX = None
+NUMPY_ANN_TRAIN_MIN = 50000
+NUMPY_IVF_NLIST = 1024
+NUMPY_IVF_NPROBE = 16
+NUMPY_HNSW_M = 16
+NUMPY_HNSW_EF_CONSTRUCTION = 200
+NUMPY_HNSW_EF = 64
+
+# Chroma REST (MODE = "docker"), through the pooled async client in app/chroma_client.py:
+# CHROMA_HOST / CHROMA_PORT -> chroma server (docker-compose sets them for the app container)
+# CHROMA_MAX_CONNECTIONS    -> keep-alive connection pool size
+# CHROMA_ADD_BATCH          -> rows per add request (large adds are split)
+# CHROMA_ADD_CONCURRENCY    -> add requests in flight at once
+# CHROMA_TIMEOUT            -> seconds per request
+CHROMA_HOST = os.environ.get("CHROMA_HOST", "chroma")
+CHROMA_PORT = int(os.environ.get("CHROMA_PORT", "8000"))
+CHROMA_MAX_CONNECTIONS = 16
+CHROMA_ADD_BATCH = 128
+CHROMA_ADD_CONCURRENCY = 4
+CHROMA_TIMEOUT = 30.0
+
+# Metadata filters (/search?year_min=&year_max=&venue=&author=):
+# NUMPY_FILTER_ANN_MIN_FRACTION -> filters passing at least this share of the rows use the ANN
+#                                  index; more selective ones scan only the passing rows
+# CHROMA_FILTER_OVERFETCH       -> chroma has no substring match on metadata: with an author
+#                                  filter, this many times k rows are fetched and checked
+NUMPY_FILTER_ANN_MIN_FRACTION = 0.1
+CHROMA_FILTER_OVERFETCH = 4
+
+# Search result cache (/search, also real_backend.py):
+# RESULT_CACHE_SIZE -> cached responses (0 disables caching; concurrent misses are still coalesced)
+# RESULT_CACHE_TTL  -> seconds a response is served from the cache; indexing invalidates it anyway
+# INDEX_GENERATION_FILE -> stamp touched after every vector DB write, by the API and by
+#                          python -m app.ingest alike; its mtime is the index generation
+#                          that keys cached results and cursors (run both from the same directory)
+RESULT_CACHE_SIZE = 1024
+RESULT_CACHE_TTL = 60
+INDEX_GENERATION_FILE = ".index_generation"
+
+# Tracing and profiling (app/main.py and real_backend.py), all off by default:
+# TRACE_SAMPLE_RATE   -> share of requests traced (0..1); a traced response carries a Server-Timing
+#                        header with its stage spans and is kept for /admin/traces
+# TRACE_RECENT        -> sampled traces kept per process
+# SLOW_REQUEST_LOG_K  -> keep (and print) the K slowest requests with their stage breakdown; 0 = off
+# ADMIN_TOKEN         -> X-Admin-Token expected by /admin/* (tracing toggles, traces, slow log,
+#                        profiler); unset = the admin endpoints answer 404
+# PROFILE_MAX_SECONDS -> longest /admin/profile run
+# PROFILE_INTERVAL_MS -> default stack sampling interval of /admin/profile
+TRACE_SAMPLE_RATE = 0.0
+TRACE_RECENT = 100
+SLOW_REQUEST_LOG_K = 0
+ADMIN_TOKEN = os.environ.get("SEARCH_ADMIN_TOKEN")
+PROFILE_MAX_SECONDS = 60
+PROFILE_INTERVAL_MS = 5
+
+# Cursor pagination (/search?paginate=true, then /search?cursor=...):
+# PAGINATION_DEPTH      -> hits ranked (once) per paginated query; pages stop there
+# PAGINATION_CACHE_SIZE -> ranked lists kept per process
+# PAGINATION_CACHE_TTL  -> seconds a ranked list is kept (an expired cursor is re-ranked)
+PAGINATION_DEPTH = 1000
+PAGINATION_CACHE_SIZE = 256
+PAGINATION_CACHE_TTL = 300
+
+# Hybrid search (/search?mode=hybrid): dense + BM25 legs fused into one ranking
+# HYBRID_FUSION           -> "rrf" (reciprocal-rank fusion) or "weighted" (min-max score fusion)
+# HYBRID_RRF_K            -> rank offset in 1 / (k + rank)
+# HYBRID_DENSE_WEIGHT     -> weight of the dense leg (lexical gets 1 - this)
+# HYBRID_CANDIDATE_FACTOR -> each leg retrieves k * this candidates before fusion
+# HYBRID_*_TIMEOUT_MS     -> per-leg budget; a late leg is dropped instead of stalling the request
+# HYBRID_LEXICAL_WORKERS  -> threads scoring BM25 legs, off the event loop and the inference pool
+HYBRID_FUSION = "rrf"
+HYBRID_RRF_K = 60
+HYBRID_DENSE_WEIGHT = 0.5
+HYBRID_CANDIDATE_FACTOR = 4
+HYBRID_DENSE_TIMEOUT_MS = 1000
+HYBRID_LEXICAL_TIMEOUT_MS = 200
+HYBRID_LEXICAL_WORKERS = 2
+
+# Embedding model and inference backend:
+# EMBEDDING_BACKEND -> "artifact" (single-file packed model, memory-mapped, no hub access),
+#                      "torch" (SentenceTransformer), "onnx" (ONNX Runtime, fp32)
+#                      or "onnx-int8" (ONNX Runtime, dynamically quantized weights)
+# MODEL_ARTIFACT_DIR -> where `python -m app.models.artifact` writes <model>.safetensors;
+#                       if the artifact is missing the "artifact" backend falls back to "torch"
+# ONNX_MODEL_DIR    -> where exported ONNX models are cached (exported on first use)
+# ONNX_PARITY_MIN_COSINE -> an export agreeing less than this with PyTorch is not used
+# EMBED_LENGTH_BUCKETING  -> embed() sorts texts by token length and batches them by token budget
+# EMBED_MAX_BATCH_TOKENS  -> padded tokens per encoder batch (batch size x longest text in it)
+# EMBED_MAX_BATCH_SIZE    -> cap on texts per batch, however short
+EMBEDDING_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+EMBEDDING_BACKEND = "artifact"
+MODEL_ARTIFACT_DIR = "models/artifacts"
+ONNX_MODEL_DIR = "models/onnx"
+ONNX_PARITY_MIN_COSINE = 0.99
+EMBED_LENGTH_BUCKETING = True
+EMBED_MAX_BATCH_TOKENS = 8192
+EMBED_MAX_BATCH_SIZE = 256
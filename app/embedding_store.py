@@ -0,0 +1,74 @@
+import hashlib
+import os
+import sqlite3
+import threading
+from typing import Dict, Iterable, List
+
+import numpy as np
+
+
+def content_id(text: str) -> str:
+    """
+    Stable document id derived from the cleaned text, so an unchanged document keeps
+    its id (and its embedding) across re-indexing runs.
+    """
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=16).hexdigest()
+
+
+class EmbeddingStore:
+    def __init__(self, path: str = "embedding_store.sqlite3"):
+        """
+        On-disk embedding cache keyed by (model key, content id); the model key is
+        EmbeddingModel.store_key, i.e. model name plus precision.
+        Backed by a single sqlite file; vectors are stored as raw float32 bytes.
+        """
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            " model TEXT NOT NULL,"
+            " id TEXT NOT NULL,"
+            " vector BLOB NOT NULL,"
+            " PRIMARY KEY (model, id))"
+        )
+        self._conn.commit()
+
+    def get_many(self, model_key: str, ids: List[str]) -> Dict[str, np.ndarray]:
+        """
+        Return {id: vector} for the ids that are already stored; unknown ids are omitted.
+        """
+        found = {}
+        with self._lock:
+            # stay below sqlite's bound-parameter limit
+            for start in range(0, len(ids), 500):
+                chunk = ids[start:start + 500]
+                placeholders = ",".join("?" * len(chunk))
+                rows = self._conn.execute(
+                    f"SELECT id, vector FROM embeddings WHERE model = ? AND id IN ({placeholders})",
+                    [model_key, *chunk],
+                )
+                for doc_id, blob in rows:
+                    found[doc_id] = np.frombuffer(blob, dtype=np.float32)
+        return found
+
+    def put_many(self, model_key: str, ids: Iterable[str], vectors: Iterable):
+        rows = [
+            (model_key, doc_id, np.asarray(vector, dtype=np.float32).tobytes())
+            for doc_id, vector in zip(ids, vectors)
+        ]
+        with self._lock:
+            self._conn.executemany("INSERT OR REPLACE INTO embeddings VALUES (?, ?, ?)", rows)
+            self._conn.commit()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,71 @@
+import asyncio
+import contextvars
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Any, Callable
+
+
+class Overloaded(Exception):
+    def __init__(self, retry_after: int = 1):
+        """
+        Raised when the inference executor is full; the API turns it into a 503.
+        """
+        super().__init__("inference queue is full")
+        self.retry_after = retry_after
+
+
+class InferenceExecutor:
+    def __init__(self, max_workers: int = 2, max_queue: int = 32, retry_after: int = 1):
+        """
+        Dedicated thread pool for CPU-bound work (encoding, vector queries) with admission control.
+          - max_workers: requests doing inference at the same time
+          - max_queue: requests allowed to wait for a worker; anything beyond is rejected
+            immediately with Overloaded instead of slowing every request down
+        Threads (not processes) are used because the model and the DB client live in this
+        process and torch releases the GIL inside its kernels.
+        """
+        self.max_workers = max_workers
+        self.capacity = max_workers + max_queue
+        self.retry_after = retry_after
+        self.pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="inference")
+        self.in_flight = 0
+        self.rejected = 0
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def admit(self):
+        """
+        Reserve a slot for one request for the duration of the block, or raise Overloaded.
+        """
+        with self._lock:
+            if self.in_flight >= self.capacity:
+                self.rejected += 1
+                raise Overloaded(self.retry_after)
+            self.in_flight += 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+
+    async def run(self, fn: Callable, *args, **kwargs) -> Any:
+        """
+        Run fn on the inference pool from the event loop, in a copy of the caller's context
+        (so the request's trace, see app/tracing.py, follows it into the thread).
+        """
+        loop = asyncio.get_running_loop()
+        context = contextvars.copy_context()
+        return await loop.run_in_executor(self.pool, functools.partial(context.run, fn, *args, **kwargs))
+
+    def shutdown(self):
+        self.pool.shutdown(wait=False)
+
+    def stats(self):
+        return {
+            "workers": self.max_workers,
+            "capacity": self.capacity,
+            "in_flight": self.in_flight,
+            "rejected": self.rejected,
+        }
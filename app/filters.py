@@ -0,0 +1,179 @@
+from collections import defaultdict
+from typing import Any, Dict, Iterable, List, Optional
+
+import numpy as np
+
+# metadata fields documents may carry (JSONL keys / CSV columns, real_backend records)
+METADATA_FIELDS = ("year", "venue", "authors")
+# year column value for documents without a year; never inside a year range
+MISSING_YEAR = np.iinfo(np.int32).min
+
+
+def normalize_metadata(record: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    The METADATA_FIELDS of a record, cleaned up: year as int, venue as str, authors as a
+    list of names ("a; b" strings from CSV files are split). Missing / unparsable fields
+    are left out.
+    """
+    meta = {}
+    try:
+        if record.get("year") not in (None, ""):
+            meta["year"] = int(record["year"])
+    except (TypeError, ValueError):
+        pass
+    if record.get("venue"):
+        meta["venue"] = str(record["venue"])
+    authors = record.get("authors")
+    if isinstance(authors, str):
+        authors = authors.split(";")
+    if authors:
+        names = [str(a).strip() for a in authors if str(a).strip()]
+        if names:
+            meta["authors"] = names
+    return meta
+
+
+def chroma_metadata(meta: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Flatten metadata for chroma, which only stores scalar values: authors become one
+    "; "-joined string. Never empty (chroma rejects empty metadata dicts).
+    """
+    meta = meta or {}
+    flat = {key: meta[key] for key in ("year", "venue") if key in meta}
+    flat["authors"] = "; ".join(meta.get("authors", []))
+    return flat
+
+
+def _padded(column: np.ndarray, rows: int, fill: int) -> np.ndarray:
+    if len(column) >= rows:
+        return column[:rows]
+    return np.concatenate([column, np.full(rows - len(column), fill, dtype=column.dtype)])
+
+
+class SearchFilter:
+    def __init__(self, year_min: Optional[int] = None, year_max: Optional[int] = None,
+                 venues: Optional[Iterable[str]] = None, author: Optional[str] = None):
+        """
+        Metadata restriction for a search; every given condition must hold:
+          - year_min / year_max: inclusive year range
+          - venues: venue is one of these (exact match)
+          - author: case-insensitive substring of one of the author names
+        """
+        self.year_min = year_min
+        self.year_max = year_max
+        self.venues = sorted(set(venues)) if venues else None
+        self.author = author.strip().lower() if author and author.strip() else None
+
+    def __bool__(self) -> bool:
+        return any(v is not None for v in (self.year_min, self.year_max, self.venues, self.author))
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"year_min": self.year_min, "year_max": self.year_max, "venues": self.venues, "author": self.author}
+
+    def matches(self, meta: Optional[Dict[str, Any]]) -> bool:
+        """
+        Row-at-a-time check; the indexes below use MetadataColumns.mask instead.
+        """
+        meta = meta or {}
+        year = meta.get("year")
+        if self.year_min is not None and (year is None or year < self.year_min):
+            return False
+        if self.year_max is not None and (year is None or year > self.year_max):
+            return False
+        if self.venues is not None and meta.get("venue") not in self.venues:
+            return False
+        if self.author is not None:
+            authors = meta.get("authors") or []
+            if isinstance(authors, str):
+                authors = authors.split(";")
+            if not any(self.author in name.lower() for name in authors):
+                return False
+        return True
+
+    def chroma_where(self) -> Optional[Dict[str, Any]]:
+        """
+        The year / venue part as a chroma `where` clause (None if there is none). Chroma has
+        no substring operator for metadata, so the author condition is checked with
+        matches() on the returned rows.
+        """
+        clauses: List[Dict[str, Any]] = []
+        if self.year_min is not None:
+            clauses.append({"year": {"$gte": self.year_min}})
+        if self.year_max is not None:
+            clauses.append({"year": {"$lte": self.year_max}})
+        if self.venues is not None:
+            clauses.append({"venue": {"$in": self.venues}})
+        if not clauses:
+            return None
+        return clauses[0] if len(clauses) == 1 else {"$and": clauses}
+
+
+class MetadataColumns:
+    def __init__(self):
+        """
+        Column-oriented metadata of row-numbered documents, for filtering before scoring:
+          - year: int32 column (MISSING_YEAR when unknown); a range is two comparisons
+          - venue: int32 codes into a venue dictionary (-1 when unknown); "venue in set"
+            compares the codes of the (few) matching venues
+          - authors: inverted index, lowercased name -> rows; an author match scans the
+            distinct names, not the rows
+        Rows are set once, in any order; deleted rows are the caller's business (they
+        keep their metadata and are masked out by the caller's alive mask).
+        """
+        self._years = np.full(0, MISSING_YEAR, dtype=np.int32)
+        self._venues = np.full(0, -1, dtype=np.int32)
+        self._venue_codes: Dict[str, int] = {}
+        self._author_rows: Dict[str, List[int]] = defaultdict(list)
+        self._rows = 0
+
+    def __len__(self) -> int:
+        return self._rows
+
+    def _reserve(self, rows: int):
+        if rows <= len(self._years):
+            return
+        capacity = max(rows, 2 * len(self._years), 1024)
+        years = np.full(capacity, MISSING_YEAR, dtype=np.int32)
+        years[:len(self._years)] = self._years
+        venues = np.full(capacity, -1, dtype=np.int32)
+        venues[:len(self._venues)] = self._venues
+        self._years, self._venues = years, venues
+
+    def set(self, row: int, meta: Optional[Dict[str, Any]]):
+        self._reserve(row + 1)
+        self._rows = max(self._rows, row + 1)
+        if not meta:
+            return
+        if meta.get("year") is not None:
+            self._years[row] = meta["year"]
+        if meta.get("venue") is not None:
+            self._venues[row] = self._venue_codes.setdefault(meta["venue"], len(self._venue_codes))
+        for name in meta.get("authors") or []:
+            self._author_rows[name.lower()].append(row)
+
+    def mask(self, search_filter: SearchFilter, rows: Optional[int] = None) -> np.ndarray:
+        """
+        Boolean mask over rows [0, rows) of the documents that pass the filter.
+        """
+        rows = self._rows if rows is None else rows
+        # the arrays are replaced (never resized in place) when they grow, so these
+        # references stay consistent while a writer adds rows
+        years = _padded(self._years, rows, MISSING_YEAR)
+        venues = _padded(self._venues, rows, -1)
+        mask = np.ones(rows, dtype=bool)
+        if search_filter.year_min is not None:
+            mask &= years >= search_filter.year_min
+        if search_filter.year_max is not None:
+            # MISSING_YEAR is below every range, so it has to be excluded explicitly here
+            mask &= (years <= search_filter.year_max) & (years != MISSING_YEAR)
+        if search_filter.venues is not None:
+            codes = [self._venue_codes[v] for v in search_filter.venues if v in self._venue_codes]
+            mask &= np.isin(venues, np.asarray(codes, dtype=np.int32))
+        if search_filter.author is not None:
+            by_author = np.zeros(rows, dtype=bool)
+            for name, author_rows in list(self._author_rows.items()):
+                if search_filter.author in name:
+                    hits = np.asarray(author_rows, dtype=np.int64)
+                    by_author[hits[hits < rows]] = True
+            mask &= by_author
+        return mask
@@ -0,0 +1,51 @@
+import asyncio
+from collections import defaultdict
+from typing import Awaitable, Dict, Hashable, List, Optional, Sequence, Tuple
+
+Ranking = List[Tuple[Hashable, float]]
+
+
+def reciprocal_rank_fusion(rankings: Sequence[Ranking], k: int = 60,
+                           weights: Optional[Sequence[float]] = None) -> Ranking:
+    """
+    Reciprocal-rank fusion: every list contributes weight / (k + rank) for each id it ranks.
+    Only positions matter, so dense distances and BM25 scores need no calibration.
+    """
+    weights = weights or [1.0] * len(rankings)
+    fused: Dict[Hashable, float] = defaultdict(float)
+    for ranking, weight in zip(rankings, weights):
+        for rank, (doc_id, _) in enumerate(ranking, start=1):
+            fused[doc_id] += weight / (k + rank)
+    return sorted(fused.items(), key=lambda item: -item[1])
+
+
+def weighted_score_fusion(rankings: Sequence[Ranking], weights: Optional[Sequence[float]] = None) -> Ranking:
+    """
+    Weighted sum of min-max normalized scores (higher = better in every list).
+    An id missing from a list gets 0 from it.
+    """
+    weights = weights or [1.0] * len(rankings)
+    fused: Dict[Hashable, float] = defaultdict(float)
+    for ranking, weight in zip(rankings, weights):
+        if not ranking:
+            continue
+        scores = [score for _, score in ranking]
+        low, high = min(scores), max(scores)
+        span = high - low
+        for doc_id, score in ranking:
+            fused[doc_id] += weight * ((score - low) / span if span > 0 else 1.0)
+    return sorted(fused.items(), key=lambda item: -item[1])
+
+
+async def run_leg(leg: Awaitable, timeout: float):
+    """
+    Await one retrieval leg with its own timeout.
+    Returns (result, status) where status is "ok", "timeout" or "error"; a failed leg
+    yields None so the caller can fall back to the other leg.
+    """
+    try:
+        return await asyncio.wait_for(leg, timeout), "ok"
+    except (asyncio.TimeoutError, TimeoutError):
+        return None, "timeout"
+    except Exception:
+        return None, "error"
@@ -0,0 +1,171 @@
+import argparse
+import multiprocessing
+import os
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from app.config import (MODE, EMBEDDING_MODEL, EMBEDDING_BACKEND, EMBEDDING_STORE, INGEST_BATCH_SIZE,
+                        INGEST_CLI_CHECKPOINT, INGEST_WORKERS, INGEST_TEXT_FIELD, INGEST_PROGRESS_INTERVAL,
+                        PREPROCESS_WORKERS)
+
+# one model per encoder process, created by _init_encoder
+_model = None
+
+
+def _init_encoder(model_name: str, backend: str, num_threads: int):
+    global _model
+    from app.models.embedding_model import EmbeddingModel
+    _model = EmbeddingModel(model_name=model_name, num_threads=num_threads, backend=backend)
+
+
+def _store_key() -> str:
+    return _model.store_key
+
+
+def _encode(texts: List[str]):
+    start = time.perf_counter()
+    vectors = np.asarray(_model.embed(texts), dtype=np.float32)
+    return vectors, time.perf_counter() - start
+
+
+class EncoderPool:
+    def __init__(self, workers: int, threads_per_worker: int, model_name: str = EMBEDDING_MODEL,
+                 backend: str = EMBEDDING_BACKEND):
+        """
+        Encoder processes, each holding its own EmbeddingModel pinned to
+        `threads_per_worker` intra-op threads. Batches are handed to whichever process is
+        free; IngestionPipeline accepts this in place of a model and keeps its writes ordered.
+        Processes are spawned (not forked), so no thread or DB handle of the parent leaks in.
+        """
+        self.model_name = model_name
+        self.workers = workers
+        self.threads_per_worker = threads_per_worker
+        self._pool = ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_encoder,
+            initargs=(model_name, backend, threads_per_worker),
+        )
+        # the backend a worker ended up with (the onnx export may fall back to torch)
+        self.store_key = self._pool.submit(_store_key).result()
+
+    def submit(self, texts: List[str]) -> Future:
+        """
+        Future of (float32 embeddings, encode seconds).
+        """
+        return self._pool.submit(_encode, texts)
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        return self.submit(texts).result()[0]
+
+    def shutdown(self):
+        self._pool.shutdown()
+
+
+class ProgressReporter:
+    def __init__(self, total: Optional[int], interval: float = 5.0):
+        """
+        Prints committed docs, docs/sec, encode vs write time and ETA at most every
+        `interval` seconds (and once more from finish()).
+        """
+        self.total = total
+        self.interval = interval
+        self._started = time.monotonic()
+        self._last = 0.0
+        # the rate is measured from the first committed batch, so encoder start-up
+        # (process spawn, model load) does not skew docs/sec and the ETA
+        self._first: Optional[tuple] = None
+
+    def __call__(self, stats: Dict[str, Any], force: bool = False):
+        now = time.monotonic()
+        if self._first is None:
+            self._first = (now, stats["committed"])
+        if not force and now - self._last < self.interval:
+            return
+        self._last = now
+        elapsed = now - self._started
+        rate = (stats["committed"] - self._first[1]) / max(now - self._first[0], 1e-9)
+        line = f"[ingest] {stats['committed']:,}"
+        if self.total:
+            line += f"/{self.total:,} ({100.0 * stats['committed'] / self.total:.1f}%)"
+        line += (f"  {rate:,.0f} docs/s  encode {stats['encode_seconds']:.1f}s (all workers)"
+                 f"  write {stats['write_seconds']:.1f}s  elapsed {_duration(elapsed)}")
+        if self.total and rate > 0:
+            line += f"  ETA {_duration(max(self.total - stats['committed'], 0) / rate)}"
+        print(line, flush=True)
+
+    def finish(self, stats: Dict[str, Any]):
+        self(stats, force=True)
+
+
+def _duration(seconds: float) -> str:
+    seconds = int(seconds)
+    hours, rest = divmod(seconds, 3600)
+    return f"{hours}h{rest // 60:02d}m{rest % 60:02d}s" if hours else f"{rest // 60}m{rest % 60:02d}s"
+
+
+def main(argv: Optional[List[str]] = None) -> Dict[str, Any]:
+    from app.embedding_store import EmbeddingStore
+    from app.ingestion import IngestionPipeline, count_documents
+    from app.vector_db import VectorDB
+
+    cpus = os.cpu_count() or 1
+    parser = argparse.ArgumentParser(
+        prog="python -m app.ingest",
+        description="Bulk-load .txt (one document per line), .jsonl and .csv files into the "
+                    "configured vector DB. Stop the API first (or restart it afterwards): "
+                    "it loads the numpy index and the BM25 index at startup.")
+    parser.add_argument("paths", nargs="+", help="files or directories")
+    parser.add_argument("--workers", type=int, default=INGEST_WORKERS, help="encoder processes")
+    parser.add_argument("--threads", type=int, default=None,
+                        help="intra-op threads per encoder (default: cores / workers)")
+    parser.add_argument("--batch-size", type=int, default=INGEST_BATCH_SIZE)
+    parser.add_argument("--clean-workers", type=int, default=PREPROCESS_WORKERS,
+                        help="text-cleaning processes (large inputs)")
+    parser.add_argument("--text-field", default=INGEST_TEXT_FIELD, help="JSONL key / CSV column holding the text")
+    parser.add_argument("--mode", default=MODE, help="vector DB mode (local / docker / numpy)")
+    parser.add_argument("--no-count", action="store_true", help="skip the counting pass (no ETA)")
+    parser.add_argument("--checkpoint", default=INGEST_CLI_CHECKPOINT,
+                        help="progress file (one per source set is derived from it)")
+    parser.add_argument("--no-checkpoint", action="store_true", help="do not record / resume progress")
+    parser.add_argument("--prune", action="store_true",
+                        help="treat the sources as the whole corpus: delete stored documents not in them")
+    args = parser.parse_args(argv)
+
+    workers = max(1, args.workers)
+    threads = args.threads or max(1, cpus // workers)
+    total = None if args.no_count else count_documents(args.paths, args.text_field)
+    print(f"[ingest] {total if total is not None else '?'} documents, {workers} encoder processes "
+          f"x {threads} threads, batches of {args.batch_size}", flush=True)
+
+    encoders = EncoderPool(workers, threads)
+    store = EmbeddingStore(EMBEDDING_STORE)
+    reporter = ProgressReporter(total, INGEST_PROGRESS_INTERVAL)
+    try:
+        pipeline = IngestionPipeline(
+            encoders,
+            VectorDB(args.mode),
+            batch_size=args.batch_size,
+            # enough batches in flight to keep every encoder busy while one is written
+            max_in_flight=2 * workers + 1,
+            checkpoint_path=None if args.no_checkpoint else args.checkpoint,
+            store=store,
+            text_field=args.text_field,
+            progress=reporter,
+            prune=args.prune,
+            preprocess_workers=args.clean_workers,
+        )
+        stats = pipeline.run(args.paths)
+    finally:
+        encoders.shutdown()
+        store.close()
+    reporter.finish(stats)
+    print(f"[ingest] done: {stats}", flush=True)
+    return stats
+
+
+if __name__ == "__main__":
+    main()
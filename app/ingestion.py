@@ -0,0 +1,365 @@
+import csv
+import hashlib
+import json
+import os
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple, Union
+
+from app.embedding_store import EmbeddingStore, content_id
+from app.filters import normalize_metadata
+from app.config import PREPROCESS_WORKERS
+from app.preprocessing import clean_texts
+
+PathLike = Union[str, os.PathLike]
+
+
+def iter_files(paths: Union[PathLike, Sequence[PathLike]]) -> Iterator[str]:
+    """
+    Yield every file under the given files or directories, in a stable (sorted) order.
+    Hidden files and directories are skipped.
+    """
+    if isinstance(paths, (str, os.PathLike)):
+        paths = [paths]
+    for path in paths:
+        path = os.fspath(path)
+        if os.path.isdir(path):
+            for root, dirs, files in os.walk(path):
+                dirs[:] = sorted(d for d in dirs if not d.startswith("."))
+                for name in sorted(files):
+                    if not name.startswith("."):
+                        yield os.path.join(root, name)
+        else:
+            yield path
+
+
+def source_format(path: str) -> str:
+    """
+    "jsonl" (.jsonl / .ndjson), "csv" (.csv) or "txt" (anything else: one document per line).
+    """
+    ext = os.path.splitext(path)[1].lower()
+    if ext in (".jsonl", ".ndjson"):
+        return "jsonl"
+    if ext == ".csv":
+        return "csv"
+    return "txt"
+
+
+def iter_raw_records(path: str, text_field: str = "text") -> Iterator[Tuple[str, Dict[str, Any]]]:
+    """
+    (raw text, metadata) of every document of one file, in file order; JSONL objects and
+    CSV rows contribute their `text_field` and their year / venue / authors fields
+    (app.filters.METADATA_FIELDS), rows without text are skipped. Text files have no metadata.
+    """
+    fmt = source_format(path)
+    with open(path, "r", encoding="utf-8", newline="" if fmt == "csv" else None) as f:
+        if fmt == "csv":
+            csv.field_size_limit(max(csv.field_size_limit(), 1 << 26))
+            rows = csv.DictReader(f)
+        elif fmt == "jsonl":
+            rows = (json.loads(line) for line in f if line.strip())
+        else:
+            rows = ({text_field: line} for line in f)
+        for row in rows:
+            text = row.get(text_field) if isinstance(row, dict) else None
+            if isinstance(text, str) and text.strip():
+                yield text.strip(), normalize_metadata(row) if fmt != "txt" else {}
+
+
+def iter_raw_texts(path: str, text_field: str = "text") -> Iterator[str]:
+    """
+    Raw document texts of one file, in file order (see iter_raw_records).
+    """
+    for text, _ in iter_raw_records(path, text_field):
+        yield text
+
+
+def iter_documents(paths: Union[PathLike, Sequence[PathLike]], text_field: str = "text",
+                   workers: int = PREPROCESS_WORKERS, with_metadata: bool = False) -> Iterator[Any]:
+    """
+    Stream documents from files or directories: one per non-empty line of text files,
+    one per JSONL object / CSV row (their `text_field`).
+    Documents are cleaned in chunks as they are read (clean_texts, in `workers`
+    processes); only the chunks being cleaned are buffered.
+    with_metadata=True yields (text, metadata) pairs instead of texts.
+    """
+    # metadata waits here while its text is being cleaned; clean_texts keeps input order
+    metas = deque()
+
+    def raw_texts():
+        for path in iter_files(paths):
+            for text, meta in iter_raw_records(path, text_field):
+                metas.append(meta)
+                yield text
+
+    for chunk in clean_texts(raw_texts(), workers=workers):
+        for text in chunk:
+            meta = metas.popleft()
+            yield (text, meta) if with_metadata else text
+
+
+def count_documents(paths: Union[PathLike, Sequence[PathLike]], text_field: str = "text") -> int:
+    """
+    Number of documents iter_documents() will yield (one cheap pass, no cleaning).
+    """
+    return sum(1 for path in iter_files(paths) for _ in iter_raw_texts(path, text_field))
+
+
+def batched(items: Iterable[Any], size: int) -> Iterator[List[Any]]:
+    """
+    Group an iterable into lists of at most `size` items.
+    """
+    if size < 1:
+        raise ValueError("batch size must be >= 1")
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+class Checkpoint:
+    def __init__(self, path: Optional[PathLike]):
+        """
+        Records how many documents of a given source list have been written to the DB,
+        so an interrupted run can resume instead of starting from zero.
+        Each source's size and mtime are stored with it: a file edited since the checkpoint
+        was written shifts the document offsets, so the run starts from zero again.
+        The file actually written is keyed by a hash of the source list (path
+        "x.json" -> "x.<hash>.json"), so runs over different sources (POST /index, the
+        CLI) never overwrite or clear each other's progress.
+        path=None disables checkpointing.
+        """
+        self.path = os.fspath(path) if path else None
+        # the keyed file of the sources last loaded / saved
+        self._file: Optional[str] = None
+        # fingerprint taken by load(), i.e. when the run started: a file modified during
+        # the run must not be recorded as matching the offsets read before the change
+        self._files: List[List[Any]] = []
+
+    @staticmethod
+    def _fingerprint(sources: List[str]) -> List[List[Any]]:
+        # [path, size, mtime_ns] per source; None for a file that vanished meanwhile
+        out = []
+        for source in sources:
+            try:
+                st = os.stat(source)
+            except OSError:
+                out.append([source, None, None])
+            else:
+                out.append([source, st.st_size, st.st_mtime_ns])
+        return out
+
+    def load(self, sources: List[str]) -> int:
+        """
+        Return the number of already committed documents for these sources (0 if unknown
+        or if any of them changed since).
+        """
+        self._files = self._fingerprint(sources)
+        self._file = self.file_for(sources)
+        if not self._file or not os.path.exists(self._file):
+            return 0
+        try:
+            with open(self._file, "r", encoding="utf-8") as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            return 0
+        if state.get("sources") != self._files:
+            return 0
+        return int(state.get("committed", 0))
+
+    def file_for(self, sources: List[str]) -> Optional[str]:
+        """
+        The checkpoint file of this source list (None when checkpointing is off).
+        """
+        if not self.path:
+            return None
+        digest = hashlib.sha1("\n".join(sources).encode("utf-8")).hexdigest()[:16]
+        root, ext = os.path.splitext(self.path)
+        return f"{root}.{digest}{ext}"
+
+    def save(self, sources: List[str], committed: int):
+        if not self.path:
+            return
+        if [f[0] for f in self._files] != sources:
+            self._files = self._fingerprint(sources)
+            self._file = self.file_for(sources)
+        directory = os.path.dirname(self._file)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # write-then-rename so a crash mid-write never leaves a corrupt checkpoint
+        tmp_path = self._file + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"sources": self._files, "committed": committed}, f)
+        os.replace(tmp_path, self._file)
+
+    def clear(self):
+        """
+        Remove the checkpoint of the sources last loaded or saved.
+        """
+        if self._file and os.path.exists(self._file):
+            os.remove(self._file)
+
+
+class IngestionPipeline:
+    def __init__(self, model, db, batch_size: int = 256, max_in_flight: int = 2,
+                 checkpoint_path: Optional[PathLike] = None, store: Optional[EmbeddingStore] = None,
+                 lexical=None, text_field: str = "text",
+                 progress: Optional[Callable[[Dict[str, Any]], None]] = None, prune: bool = False,
+                 preprocess_workers: int = PREPROCESS_WORKERS):
+        """
+        Streams documents into the vector DB in fixed-size batches.
+          - document ids are content hashes, so documents already in the DB are skipped
+          - embeddings are looked up in `store` first; only new or changed text is encoded
+          - encoding runs on the calling thread, DB writes on a single writer thread,
+            so the next batch is encoded while the previous one is being written;
+            a `model` with submit(texts) -> Future (app.ingest.EncoderPool) encodes
+            asynchronously instead, and the writer still commits batches in order
+          - at most `max_in_flight` batches are pending (encoding or waiting for the
+            writer), which bounds memory
+          - after every committed batch the checkpoint is advanced and `progress(stats)`
+            is called
+          - `lexical` (a BM25Index), when given, receives the same documents as the DB
+          - prune=True makes the sources the whole corpus: stored documents that are not
+            in them anymore are deleted at the end (off by default: the DB may also hold
+            documents bulk-loaded from other sources with python -m app.ingest); without
+            it they are only counted, as stats["stale"]
+          - preprocess_workers > 1 cleans the text in that many processes
+        """
+        self.model = model
+        self.db = db
+        self.batch_size = batch_size
+        self.max_in_flight = max(1, max_in_flight)
+        self.checkpoint = Checkpoint(checkpoint_path)
+        self.store = store
+        self.lexical = lexical
+        self.text_field = text_field
+        self.progress = progress
+        self.prune = prune
+        self.preprocess_workers = preprocess_workers
+
+    def run(self, paths: Union[PathLike, Sequence[PathLike]]) -> Dict[str, Any]:
+        sources = [os.path.abspath(p) for p in iter_files(paths)]
+        resume_from = self.checkpoint.load(sources)
+        stats = {"committed": resume_from, "resumed_from": resume_from,
+                 "encoded": 0, "reused": 0, "unchanged": 0, "metadata_updated": 0, "deleted": 0, "stale": 0,
+                 "encode_seconds": 0.0, "write_seconds": 0.0}
+
+        docs = iter_documents(sources, self.text_field, self.preprocess_workers, with_metadata=True)
+        # skip what a previous run already committed (reading and hashing is cheap,
+        # encoding is not); the ids are still needed to detect vanished documents
+        seen = set()
+        for _ in range(resume_from):
+            doc = next(docs, None)
+            if doc is None:
+                break
+            seen.add(content_id(doc[0]))
+
+        pending = deque()
+        with ThreadPoolExecutor(max_workers=1, thread_name_prefix="ingest-writer") as writer:
+            offset = resume_from
+            for batch in batched(docs, self.batch_size):
+                offset += len(batch)
+                ids, texts, metadatas, embeddings = self._prepare(batch, seen, stats)
+
+                while len(pending) >= self.max_in_flight:
+                    stats["committed"] = self._wait(pending, sources, stats)
+                if ids:
+                    future = writer.submit(self._write, ids, texts, metadatas, embeddings, stats)
+                else:
+                    future = None
+                pending.append((future, offset))
+
+            while pending:
+                stats["committed"] = self._wait(pending, sources, stats)
+
+        vanished = [doc_id for doc_id in self.db.all_ids() if doc_id not in seen]
+        if not self.prune:
+            stats["stale"] = len(vanished)
+            vanished = []
+        for start in range(0, len(vanished), self.batch_size):
+            self.db.delete(vanished[start:start + self.batch_size])
+        if self.lexical is not None:
+            for doc_id in vanished:
+                self.lexical.delete(doc_id)
+        stats["deleted"] = len(vanished)
+
+        self.checkpoint.clear()
+        return stats
+
+    def _prepare(self, batch: List[Tuple[str, Dict[str, Any]]], seen: set, stats: Dict[str, Any]):
+        """
+        Drop documents that are duplicates or already in the DB with the same metadata,
+        then resolve embeddings for the rest from the store, encoding only what the store
+        does not know. Stored documents whose metadata changed are rewritten (their
+        embedding normally comes from the store).
+        Returns (ids, texts, metadatas, embeddings); embeddings is a
+        (found, missing ids, Future) triple resolved by the writer.
+        """
+        unique = {}
+        for text, meta in batch:
+            doc_id = content_id(text)
+            if doc_id not in seen:
+                seen.add(doc_id)
+                unique[doc_id] = (text, meta)
+
+        existing, changed = self.db.changed_metadata(list(unique), [meta for _, meta in unique.values()])
+        stats["unchanged"] += len(existing) - len(changed)
+        stats["metadata_updated"] += len(changed)
+        ids = [doc_id for doc_id in unique if doc_id not in existing or doc_id in changed]
+        texts = [unique[doc_id][0] for doc_id in ids]
+        # metadata only goes to the DB when some document has any
+        metadatas = [unique[doc_id][1] for doc_id in ids]
+        metadatas = metadatas if any(metadatas) else None
+        if not ids:
+            return ids, texts, metadatas, []
+
+        cached = self.store.get_many(self.model.store_key, ids) if self.store is not None else {}
+        missing = [doc_id for doc_id in ids if doc_id not in cached]
+        encoded = self._encode([unique[doc_id][0] for doc_id in missing]) if missing else None
+        stats["encoded"] += len(missing)
+        stats["reused"] += len(ids) - len(missing)
+        return ids, texts, metadatas, (cached, missing, encoded)
+
+    def _encode(self, texts: List[str]) -> Future:
+        """
+        Future of (embeddings, encode seconds).
+        """
+        if hasattr(self.model, "submit"):
+            return self.model.submit(texts)
+        future = Future()
+        start = time.perf_counter()
+        future.set_result((self.model.embed(texts), time.perf_counter() - start))
+        return future
+
+    def _write(self, ids: List[str], texts: List[str], metadatas: Optional[List[Dict[str, Any]]], embeddings,
+               stats: Dict[str, Any]):
+        cached, missing, encoded = embeddings
+        if encoded is not None:
+            vectors, seconds = encoded.result()
+            stats["encode_seconds"] += seconds
+            cached.update(zip(missing, vectors))
+            if self.store is not None:
+                self.store.put_many(self.model.store_key, missing, vectors)
+        start = time.perf_counter()
+        self.db.add(ids=ids, texts=texts, embeddings=[cached[doc_id] for doc_id in ids], metadatas=metadatas)
+        if self.lexical is not None:
+            self.lexical.add_many(zip(ids, texts))
+        stats["write_seconds"] += time.perf_counter() - start
+
+    def _wait(self, pending: deque, sources: List[str], stats: Dict[str, Any]) -> int:
+        """
+        Block on the oldest write; a failed write raises here and leaves the checkpoint
+        at the last batch that made it into the DB.
+        """
+        future, end = pending.popleft()
+        if future is not None:
+            future.result()
+        self.checkpoint.save(sources, end)
+        if self.progress is not None:
+            self.progress(dict(stats, committed=end))
+        return end
@@ -0,0 +1,107 @@
+import heapq
+import time
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from app.preprocessing import STOP_WORDS, clean_text
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Lexical tokens: cleaned, whitespace-split, stop words removed.
+    """
+    return [t for t in clean_text(text).split() if t not in STOP_WORDS]
+
+
+class PostingCursor:
+    def __init__(self, doc_ids: np.ndarray, weights: np.ndarray, multiplier: float = 1.0,
+                 max_weight: float = None):
+        """
+        Iterator over one term's posting list (doc ids sorted ascending).
+        A posting contributes multiplier * weight to a document's score;
+        `upper_bound` is the most this term can add to any document.
+        """
+        self.doc_ids = doc_ids
+        self.weights = weights
+        self.multiplier = multiplier
+        if max_weight is None:
+            max_weight = float(weights.max()) if len(weights) else 0.0
+        self.upper_bound = multiplier * max_weight
+        self.pos = 0
+
+    @property
+    def doc(self) -> int:
+        return int(self.doc_ids[self.pos]) if self.pos < len(self.doc_ids) else -1
+
+    def score(self) -> float:
+        return self.multiplier * float(self.weights[self.pos])
+
+    def next(self):
+        self.pos += 1
+
+    def seek(self, target: int):
+        """
+        Skip forward to the first posting with doc id >= target.
+        """
+        self.pos += int(np.searchsorted(self.doc_ids[self.pos:], target))
+
+
+# WAND steps between two deadline checks
+_DEADLINE_CHECK_EVERY = 256
+
+
+def wand_top_k(cursors: List[PostingCursor], k: int, deadline: Optional[float] = None) -> List[Tuple[int, float]]:
+    """
+    Top-k documents by summed posting scores using WAND dynamic pruning.
+    Only documents whose score upper bound can beat the current k-th best are fully scored;
+    everything else is skipped with seeks. Returns [(doc_id, score)] best first.
+    deadline (time.monotonic() value) raises TimeoutError once passed, checked every
+    few hundred steps so a long posting list cannot overrun it.
+    """
+    cursors = [c for c in cursors if len(c.doc_ids) and c.upper_bound > 0]
+    heap: List[Tuple[float, int]] = []  # min-heap of (score, -doc) holding the current top-k
+    if k <= 0:
+        return []
+
+    steps = 0
+    while cursors:
+        steps += 1
+        if deadline is not None and steps % _DEADLINE_CHECK_EVERY == 0 and time.monotonic() > deadline:
+            raise TimeoutError("lexical search deadline exceeded")
+        cursors.sort(key=lambda c: c.doc_ids[c.pos])
+        threshold = heap[0][0] if len(heap) >= k else 0.0
+
+        # pivot: first term at which the accumulated upper bounds exceed the threshold
+        bound = 0.0
+        pivot = None
+        for i, cursor in enumerate(cursors):
+            bound += cursor.upper_bound
+            if bound > threshold:
+                pivot = i
+                break
+        if pivot is None:
+            break
+        pivot_doc = cursors[pivot].doc
+
+        if cursors[0].doc == pivot_doc:
+            # every cursor up to the pivot sits on pivot_doc: score it fully
+            score = 0.0
+            for cursor in cursors:
+                if cursor.doc != pivot_doc:
+                    break
+                score += cursor.score()
+                cursor.next()
+            if len(heap) < k:
+                heapq.heappush(heap, (score, -pivot_doc))
+            elif score > threshold:
+                heapq.heapreplace(heap, (score, -pivot_doc))
+        else:
+            # no document before pivot_doc can make it into the top-k
+            for cursor in cursors[:pivot]:
+                cursor.seek(pivot_doc)
+
+        cursors = [c for c in cursors if c.pos < len(c.doc_ids)]
+
+    return [(-neg_doc, score) for score, neg_doc in sorted(heap, reverse=True)]
+
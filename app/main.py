@@ -7,122 +7,404 @@ project_root = os.path.dirname(current_file_dir)
 sys.path.insert(0, project_root)
 sys.path.insert(0, current_file_dir)
 
-# ===== CREATE ALL NEEDED CLASSES =====
-# Correct way to create classes
-ModelCard = type('ModelCard', (), {})
-CommitOperationAdd = type('CommitOperationAdd', (), {})
-CommitOperationDelete = type('CommitOperationDelete', (), {})
-CommitOperation = type('CommitOperation', (), {})
-HfApi = type('HfApi', (), {})
-ModelInfo = type('ModelInfo', (), {'id': 'mock', 'sha': 'mock'})  # FIXED: Use () not {}
-RepoFile = type('RepoFile', (), {})
-
-
-# Create the main mock
-class EverythingMock:
-    # Version and constants
-    __version__ = '0.19.4'
-    __name__ = 'huggingface_hub'
-    ENDPOINT = 'https://huggingface.co'
-    HF_HUB_DISABLE_TELEMETRY = False
-    _CACHED_NO_EXIST = object()
-
-    # ALL imports
-    ModelCard = ModelCard
-    CommitOperationAdd = CommitOperationAdd
-    CommitOperationDelete = CommitOperationDelete
-    CommitOperation = CommitOperation
-    HfApi = HfApi
-    ModelInfo = ModelInfo
-    RepoFile = RepoFile
-
-    # Functions
-    @staticmethod
-    def get_full_repo_name(*args, **kwargs):
-        return 'mock/repo'
-
-    @staticmethod
-    def hf_hub_download(*args, **kwargs):
-        os.makedirs('./models', exist_ok=True)
-        return './models/model.bin'
-
-    @staticmethod
-    def cached_download(*args, **kwargs):
-        return './models/model.bin'
-
-    @staticmethod
-    def snapshot_download(*args, **kwargs):
-        return './models/'
-
-    @staticmethod
-    def model_info(*args, **kwargs):
-        return ModelInfo()
-
-    @staticmethod
-    def list_repo_files(*args, **kwargs):
-        return []
-
-    # Submodules
-    class utils:
-        @staticmethod
-        def are_progress_bars_disabled():
-            return False
-
-        @staticmethod
-        def get_session(*args, **kwargs):
-            return type('Session', (), {})()
-
-    class constants:
-        ENDPOINT = 'https://huggingface.co'
-        HF_HUB_DISABLE_TELEMETRY = False
-
-
-# Register everything
-everything = EverythingMock()
-sys.modules['huggingface_hub'] = everything
-sys.modules['huggingface_hub.utils'] = everything.utils
-sys.modules['huggingface_hub.constants'] = everything.constants
-
-print("[FIX] HuggingFace hub mock created")
-
 # ===== CHROMADB =====
 os.environ['CHROMA_DB_IMPLEMENTATION'] = 'duckdb+parquet'
-os.makedirs('./models', exist_ok=True)
+# the model is loaded from the packed artifact (python -m app.models.artifact), so the
+# hub is never contacted at startup
 
 # ===== IMPORT YOUR APP =====
 try:
-    print("Testing imports...")
-    from sentence_transformers import SentenceTransformer
-
-    print("✓ sentence-transformers OK")
-
-    from fastapi import FastAPI
+    from fastapi import FastAPI, Query, Request
+    from fastapi.responses import JSONResponse, Response
+    from pydantic import BaseModel, Field
+    from typing import Any, Dict, List, Optional
+    import asyncio
+    import contextvars
+    import functools
+    import json
+    import time
+    from concurrent.futures import ThreadPoolExecutor
     from app.search import SemanticSearch
-    from app.config import MODE
+    from app.batching import MicroBatcher
+    from app.executor import InferenceExecutor, Overloaded
+    from app.hybrid import run_leg
+    from app.filters import SearchFilter
+    from app.pagination import ResultPager, StaleCursor, decode_cursor
+    from app.cache import ResultCache
+    from app.metrics import BATCH_SIZE, CONTENT_TYPE, REGISTRY, STAGE_SECONDS, cache_metrics
+    from app.tracing import Tracer, TracingMiddleware, span
+    from app.admin import admin_router
+    from app.preprocessing import clean_text
+    from app.warmup import NotReady, Readiness, warm_up, warmup_queries
+    from app.memory import memory_usage
+    from app import prefork
+    from app.config import (MODE, DATA_PATH, QUERY_BATCH_MAX_SIZE, QUERY_BATCH_WAIT_MS,
+                            WARMUP_ROUNDS, WARMUP_BATCH_SIZES, STARTUP_RETRY_AFTER,
+                            INFERENCE_WORKERS, INFERENCE_QUEUE_SIZE, INFERENCE_RETRY_AFTER,
+                            HYBRID_FUSION, HYBRID_CANDIDATE_FACTOR,
+                            HYBRID_DENSE_TIMEOUT_MS, HYBRID_LEXICAL_TIMEOUT_MS, HYBRID_LEXICAL_WORKERS,
+                            PAGINATION_DEPTH, PAGINATION_CACHE_SIZE, PAGINATION_CACHE_TTL,
+                            RESULT_CACHE_SIZE, RESULT_CACHE_TTL,
+                            TRACE_SAMPLE_RATE, TRACE_RECENT, SLOW_REQUEST_LOG_K)
 
     app = FastAPI(title="Semantic Search API")
-    search_engine = SemanticSearch(mode=MODE)
+    # opt-in request tracing / slow-request log, toggled at runtime under /admin (with the profiler)
+    tracer = Tracer(sample_rate=TRACE_SAMPLE_RATE, slow_k=SLOW_REQUEST_LOG_K, recent=TRACE_RECENT)
+    app.add_middleware(TracingMiddleware, tracer=tracer)
+    app.include_router(admin_router(tracer))
+    # the model and index load in the background (see startup); until then only
+    # liveness is served and everything that needs them answers 503
+    search_engine: Optional[SemanticSearch] = None
+    readiness = Readiness()
+    # bounded pool for encoding + vector queries; overflow is rejected with 503
+    inference = InferenceExecutor(
+        max_workers=INFERENCE_WORKERS,
+        max_queue=INFERENCE_QUEUE_SIZE,
+        retry_after=INFERENCE_RETRY_AFTER,
+    )
+    # BM25 legs of hybrid / lexical searches: off the event loop (which must keep
+    # dispatching encoder batches meanwhile) and outside the inference admission slots
+    lexical_pool = ThreadPoolExecutor(max_workers=HYBRID_LEXICAL_WORKERS, thread_name_prefix="lexical")
+    # finished /search responses, per index generation; identical concurrent misses share one search
+    result_cache = ResultCache(maxsize=RESULT_CACHE_SIZE, ttl=RESULT_CACHE_TTL)
+    # ranked candidate lists behind /search cursors
+    pager = ResultPager(maxsize=PAGINATION_CACHE_SIZE, ttl=PAGINATION_CACHE_TTL, depth=PAGINATION_DEPTH)
+
+    def embed_queries(texts: List[str]):
+        # one observation per micro-batch: the encode stage is shared by its queries
+        with STAGE_SECONDS.time("encode"):
+            vectors = engine().model.embed_queries(texts)
+        BATCH_SIZE.observe(len(texts))
+        return vectors
+
+
+    def preprocess(q: str) -> str:
+        with STAGE_SECONDS.time("preprocess"):
+            return clean_text(q)
+
+
+    def respond(result: Dict[str, Any]) -> JSONResponse:
+        """
+        Render a result to JSON here (instead of letting FastAPI do it after the handler)
+        so the serialization stage is measured.
+        """
+        with STAGE_SECONDS.time("serialize"):
+            return JSONResponse(content=result)
+
+
+    # concurrent /search requests share one encoder call
+    query_batcher = MicroBatcher(
+        embed_queries,
+        max_batch_size=QUERY_BATCH_MAX_SIZE,
+        max_wait_ms=QUERY_BATCH_WAIT_MS,
+        executor=inference.pool,
+    )
+
+
+    # vector DB size as of the last /metrics scrape: counting can be a REST round trip, so
+    # the handler awaits it and the (synchronous) gauge only reads this
+    vector_count: Dict[str, int] = {}
+
+
+    def db_size() -> Optional[Dict[tuple, int]]:
+        if search_engine is None:
+            return None
+        return {("vector",): vector_count.get("documents"), ("lexical",): len(search_engine.lexical)}
+
+
+    # sampled at scrape time from the components' own counters
+    REGISTRY.gauge("search_inference_in_flight", "Requests holding an inference slot (running or queued)",
+                   lambda: inference.in_flight)
+    REGISTRY.gauge("search_inference_capacity", "Inference slots (workers + queue)", lambda: inference.capacity)
+    REGISTRY.counter("search_inference_rejected_total", "Requests rejected with 503 (queue full)",
+                     lambda: inference.rejected)
+    REGISTRY.gauge("search_encode_queue_depth", "Queries waiting for the next encoder micro-batch",
+                   query_batcher.pending)
+    cache_metrics(REGISTRY, lambda: {
+        "query_embedding": None if search_engine is None else search_engine.model.query_cache.stats(),
+        "result": result_cache.stats(),
+        "pagination": pager.cache.stats(),
+    })
+    REGISTRY.gauge("search_index_documents", "Documents in each index", db_size, ("index",))
+    REGISTRY.gauge("search_index_vocabulary", "Distinct terms in the BM25 index",
+                   lambda: search_engine and search_engine.lexical.vocabulary_size())
+    REGISTRY.gauge("search_index_generation", "Time (ns) of the last index write (keys caches and cursors)",
+                   lambda: search_engine and search_engine.db.generation)
+    REGISTRY.gauge("search_ready", "1 once the model and index are loaded and warm",
+                   lambda: int(readiness.ready))
+
+
+    class BatchQuery(BaseModel):
+        q: str
+        k: int = Field(5, ge=1)
+
+
+    class BatchSearchRequest(BaseModel):
+        queries: List[BatchQuery]
+
+
+    @app.exception_handler(Overloaded)
+    async def overloaded(request: Request, exc: Overloaded):
+        return JSONResponse(
+            status_code=503,
+            content={"error": "server busy, retry later"},
+            headers={"Retry-After": str(exc.retry_after)},
+        )
+
+
+    @app.exception_handler(StaleCursor)
+    async def stale_cursor(request: Request, exc: StaleCursor):
+        return JSONResponse(
+            status_code=410,
+            content={"error": "the index changed since this cursor was issued; restart the search",
+                     "cursor_generation": exc.issued, "generation": exc.current},
+        )
+
+
+    @app.exception_handler(NotReady)
+    async def not_ready(request: Request, exc: NotReady):
+        return JSONResponse(
+            status_code=503,
+            content={"error": "starting up, retry later", "startup": readiness.stats()},
+            headers={"Retry-After": str(exc.retry_after)},
+        )
+
+
+    def engine() -> SemanticSearch:
+        if search_engine is None:
+            raise NotReady(STARTUP_RETRY_AFTER)
+        return search_engine
+
+
+    async def load_engine():
+        """
+        Load the model, vector DB and BM25 index on the inference pool, then warm the
+        encoder and search paths; the service reports ready only after that.
+        """
+        global search_engine
+        try:
+            readiness.enter("loading")
+            # under app.prefork the model (and numpy index) come preloaded from the master
+            loaded = await inference.run(SemanticSearch, mode=MODE, **prefork.preloaded)
+            search_engine = loaded
+            readiness.enter("warming")
+            queries = warmup_queries(DATA_PATH)
+            batch_sizes = sorted({max(1, min(size, QUERY_BATCH_MAX_SIZE)) for size in WARMUP_BATCH_SIZES})
+            result = await inference.run(warm_up, loaded, queries, batch_sizes, WARMUP_ROUNDS)
+            readiness.enter("ready")
+            print(f"[startup] ready: {readiness.timings}, warm-up {result}")
+        except Exception as exc:
+            readiness.fail(exc)
+            print(f"[startup] failed: {readiness.error}")
+
+
+    @app.on_event("startup")
+    async def startup():
+        # do not block the server: liveness is answered while this runs
+        app.state.loader = asyncio.ensure_future(load_engine())
+
+
+    @app.on_event("shutdown")
+    async def shutdown():
+        await query_batcher.close()
+        inference.shutdown()
+        lexical_pool.shutdown(wait=False)
+        if search_engine is not None:
+            search_engine.db.close()
 
 
     @app.get("/")
-    def root():
+    async def root():
         return {"app": "Semantic Search", "status": "running"}
 
 
     @app.get("/health")
-    def health():
-        return {"status": "healthy"}
+    async def health():
+        """
+        Liveness: answers as soon as the process serves requests, loaded or not.
+        """
+        return {
+            "status": "healthy",
+            "startup": readiness.stats(),
+            "query_cache": None if search_engine is None else search_engine.model.query_cache.stats(),
+            "query_batches": query_batcher.stats(),
+            "result_cache": result_cache.stats(),
+            "pagination": pager.cache.stats(),
+            "inference": inference.stats(),
+            "tracing": tracer.stats(),
+            "memory": memory_usage(),
+        }
+
+
+    @app.get("/ready")
+    async def ready():
+        """
+        Readiness: 200 only once the model and index are loaded and warm, 503 before
+        (or if loading failed).
+        """
+        if not readiness.ready:
+            return JSONResponse(status_code=503, content=readiness.stats())
+        return readiness.stats()
+
+
+    @app.get("/metrics")
+    async def metrics():
+        """
+        Prometheus text format: per-stage latency histograms, encoder batch sizes, queue
+        depth, cache and index gauges of this process.
+        """
+        if search_engine is not None:
+            vector_count["documents"] = await search_engine.db.acount()
+        return Response(content=REGISTRY.render(), media_type=CONTENT_TYPE)
 
 
     @app.get("/search")
-    def search(q: str, k: int = 5):
-        return search_engine.search(q, k)
+    async def search(q: Optional[str] = None, k: int = Query(5, ge=1, le=PAGINATION_DEPTH),
+                     mode: str = "dense", fusion: str = HYBRID_FUSION,
+                     nprobe: Optional[int] = None, ef: Optional[int] = None,
+                     year_min: Optional[int] = None, year_max: Optional[int] = None,
+                     venue: Optional[List[str]] = Query(None), author: Optional[str] = None,
+                     paginate: bool = False, cursor: Optional[str] = None):
+        """
+        mode: "dense" (embeddings + vector DB), "lexical" (BM25) or "hybrid" (both, fused)
+        nprobe / ef: ANN recall-vs-latency knobs (IVF cells probed / HNSW beam width)
+        year_min / year_max / venue (repeatable) / author: metadata filters, applied before
+        scoring; on lexical / hybrid search they need MODE = "numpy"
+        paginate=true: return the first k hits plus page.next_cursor; pass that back as
+        cursor (alone) for the next page. A cursor issued before the index changed gets 410.
+        """
+        if cursor is not None:
+            return await next_page(cursor)
+        if q is None:
+            return JSONResponse(status_code=400, content={"error": "q is required (or a cursor)"})
+        search_filter = SearchFilter(year_min, year_max, venue, author)
+        if search_filter and mode in ("hybrid", "lexical") and engine().db.client is not None:
+            # BM25 is restricted through the ids the numpy backend's metadata columns list
+            return JSONResponse(status_code=400, content={
+                "error": "metadata filters on lexical / hybrid search need MODE = \"numpy\""})
+        request = {"q": q, "mode": mode, "fusion": fusion, "nprobe": nprobe, "ef": ef,
+                   "filter": search_filter.to_dict()}
+        generation = engine().db.generation
+        if paginate:
+            ranked = await rank_for_pages(request, generation)
+            with inference.admit():
+                return respond(await inference.run(pager.page, request, generation, ranked, 0, k,
+                                                   engine().db.documents))
+        # queries that clean to the same text share an entry; the response echoes this q
+        key = json.dumps(dict(request, q=clean_text(q), k=k), sort_keys=True)
+        result = await result_cache.aget_or_compute(
+            key, generation, lambda: run_search(q, k, mode, fusion, {"nprobe": nprobe, "ef": ef}, search_filter),
+            cacheable=complete_result)
+        return respond(dict(result, query=q))
+
+
+    def complete_result(result: Dict[str, Any]) -> bool:
+        # a hybrid result missing a leg (timeout / error) is served but not cached
+        return all(status == "ok" for status in result.get("legs", {}).values())
+
+
+    async def next_page(cursor: str):
+        try:
+            state = decode_cursor(cursor, PAGINATION_DEPTH)
+        except ValueError as e:
+            return JSONResponse(status_code=400, content={"error": str(e)})
+        generation = engine().db.generation
+        if state["g"] != generation:
+            raise StaleCursor(state["g"], generation)
+        ranked = pager.get(state["r"], generation)
+        if ranked is None:
+            # expired, or ranked by another pre-fork worker: same request, same generation
+            ranked = await rank_for_pages(state["r"], generation)
+        with inference.admit():
+            return respond(await inference.run(pager.page, state["r"], generation, ranked, state["o"], state["n"],
+                                               engine().db.documents))
+
+
+    async def rank_for_pages(request: Dict[str, Any], generation: int):
+        """
+        Rank the request's hits down to the pagination depth, once, and cache the list.
+        """
+        result = await run_search(request["q"], PAGINATION_DEPTH, request["mode"], request["fusion"],
+                                  {"nprobe": request["nprobe"], "ef": request["ef"]},
+                                  SearchFilter(**request["filter"]))
+        return pager.put(request, generation, result)
+
+
+    async def run_search(q: str, k: int, mode: str, fusion: str, search_params: Dict[str, Any],
+                         search_filter: SearchFilter):
+        if mode in ("hybrid", "lexical"):
+            return await hybrid_search(q, k, fusion, dense=(mode == "hybrid"), search_params=search_params,
+                                       search_filter=search_filter)
+        with inference.admit():
+            with span("encode_wait"):
+                emb = await query_batcher.submit(preprocess(q))
+            if engine().db.remote:
+                # chroma REST: await the HTTP round trip on the loop instead of a pool thread
+                return await engine().asearch_by_embedding(q, emb, k, search_filter=search_filter)
+            return await inference.run(engine().search_by_embedding, q, emb, k, search_params, search_filter)
+
+
+    async def hybrid_search(q: str, k: int, fusion: str, dense: bool = True,
+                            search_params: Optional[Dict[str, Any]] = None,
+                            search_filter: Optional[SearchFilter] = None):
+        """
+        Dense leg on the inference pool, lexical leg on lexical_pool, each with its own
+        timeout; a leg that is late or fails is dropped and the other one is returned alone.
+        The lexical deadline is also checked inside WAND scoring, so a leg that timed out
+        does not keep its thread busy.
+        """
+        depth = k * HYBRID_CANDIDATE_FACTOR
+
+        async def dense_leg():
+            with inference.admit():
+                with span("encode_wait"):
+                    emb = await query_batcher.submit(preprocess(q))
+                if engine().db.remote:
+                    return await engine().db.asearch(emb, depth, search_filter=search_filter)
+                return await inference.run(engine().db.search, emb, depth, search_filter,
+                                           **(search_params or {}))
+
+        async def lexical_leg():
+            deadline = time.monotonic() + HYBRID_LEXICAL_TIMEOUT_MS / 1000.0
+            # the caller's context goes along, like InferenceExecutor.run (request traces)
+            score = functools.partial(contextvars.copy_context().run, engine().lexical_search, q, depth,
+                                      deadline=deadline, search_filter=search_filter)
+            return await asyncio.get_running_loop().run_in_executor(lexical_pool, score)
+
+        legs = {}
+        dense_task = None
+        if dense:
+            # start encoding first so it overlaps with the lexical scoring below
+            dense_task = asyncio.ensure_future(run_leg(dense_leg(), HYBRID_DENSE_TIMEOUT_MS / 1000.0))
+        lexical_hits, legs["lexical"] = await run_leg(lexical_leg(), HYBRID_LEXICAL_TIMEOUT_MS / 1000.0)
+        dense_raw = None
+        if dense_task is not None:
+            dense_raw, legs["dense"] = await dense_task
+        return await inference.run(engine().fuse, q, dense_raw, lexical_hits, k, fusion, legs)
+
+
+    @app.post("/search/batch")
+    async def search_batch(body: BatchSearchRequest):
+        """
+        Many queries in one request: one encode and one vector query for the whole batch.
+        """
+        with inference.admit():
+            results = await inference.run(engine().search_batch, [(x.q, x.k) for x in body.queries])
+        return respond({"results": results})
 
 
     @app.post("/index")
-    def index_docs():
-        search_engine.index_documents()
-        return {"status": "indexed"}
+    async def index_docs(prune: bool = False):
+        """
+        Index DATA_PATH incrementally. prune=true also deletes stored documents that are
+        not in DATA_PATH (including ones bulk-loaded with python -m app.ingest); without it
+        their number is reported as "stale".
+        """
+        if engine().db.read_only:
+            return JSONResponse(status_code=409, content={
+                "error": "the index is shared read-only by pre-fork workers; index from a single process"})
+        with inference.admit():
+            return await inference.run(engine().index_documents, prune=prune)
 
 
     print("✅ Your app loaded successfully")
@@ -0,0 +1,61 @@
+import os
+from typing import Dict, Optional
+
+# smaps fields (kB) -> reported name
+_FIELDS = {
+    "Rss": "rss",
+    "Pss": "pss",
+    "Shared_Clean": "shared_clean",
+    "Shared_Dirty": "shared_dirty",
+    "Private_Clean": "private_clean",
+    "Private_Dirty": "private_dirty",
+}
+
+
+def memory_usage(pid: Optional[int] = None) -> Dict[str, Optional[int]]:
+    """
+    Resident memory of a process, in bytes, split by sharing (Linux /proc/<pid>/smaps_rollup):
+      - rss: everything resident
+      - unique: private pages (USS), what the process would free on exit
+      - shared: pages other processes map too (fork copy-on-write pages, memory-mapped
+        weights / vectors in the page cache)
+      - pss: proportional share, shared pages divided among the processes mapping them;
+        summing pss over the workers gives their real total
+    Outside Linux only the peak rss of the current process is known.
+    """
+    pid = pid or os.getpid()
+    totals = dict.fromkeys(_FIELDS.values(), 0)
+    for name in ("smaps_rollup", "smaps"):
+        path = f"/proc/{pid}/{name}"
+        if not os.path.exists(path):
+            continue
+        with open(path, "r") as f:
+            for line in f:
+                key, _, rest = line.partition(":")
+                if key in _FIELDS:
+                    totals[_FIELDS[key]] += int(rest.split()[0]) * 1024
+        return {
+            "pid": pid,
+            "rss": totals["rss"],
+            "unique": totals["private_clean"] + totals["private_dirty"],
+            "shared": totals["shared_clean"] + totals["shared_dirty"],
+            "pss": totals["pss"],
+        }
+
+    import resource
+    return {"pid": pid, "rss": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024,
+            "unique": None, "shared": None, "pss": None}
+
+
+def format_memory_table(rows: Dict[str, Dict[str, Optional[int]]]) -> str:
+    """
+    One line per process: label, pid and the memory_usage() figures in MB.
+    """
+    def mb(value):
+        return "-" if value is None else f"{value / 2 ** 20:.1f}"
+
+    lines = [f"{'process':<10}{'pid':>8}{'rss MB':>10}{'unique MB':>11}{'shared MB':>11}{'pss MB':>9}"]
+    for label, usage in rows.items():
+        lines.append(f"{label:<10}{usage['pid']:>8}{mb(usage['rss']):>10}{mb(usage['unique']):>11}"
+                     f"{mb(usage['shared']):>11}{mb(usage['pss']):>9}")
+    return "\n".join(lines)
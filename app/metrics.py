@@ -0,0 +1,184 @@
+import bisect
+import math
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple, Union
+
+from app.tracing import record_span
+
+# Prometheus text exposition format, version 0.0.4 (Starlette appends the utf-8 charset)
+CONTENT_TYPE = "text/plain; version=0.0.4"
+
+# seconds; from sub-millisecond cache-warm stages up to slow cold encodes
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# items per encoder call
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256)
+
+Labels = Tuple[str, ...]
+# what a sampled metric's callback returns: one value, or one value per label tuple
+Sample = Union[None, float, Dict[Labels, Optional[float]]]
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value))
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS, trace: bool = False):
+        """
+        Cumulative-bucket histogram, one series per label values tuple (e.g. per stage).
+        Observations only bump a bucket counter; the cumulative counts are computed at
+        scrape time.
+        trace: blocks timed with time() are also spans of the current request's trace
+        (app/tracing.py), named by their first label value.
+        """
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self.trace = trace
+        # label values -> [per-bucket counts (last = +Inf), sum, count]
+        self._series: Dict[Labels, list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labels: str):
+        slot = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][slot] += 1
+            series[1] += value
+            series[2] += 1
+
+    @contextmanager
+    def time(self, *labels: str) -> Iterator[None]:
+        """
+        Observe the wall time of the block (also when it raises).
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            duration = time.perf_counter() - start
+            self.observe(duration, *labels)
+            if self.trace:
+                record_span(labels[0] if labels else self.name, start, duration)
+
+    def collect(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = [(labels, list(counts), total, count) for labels, (counts, total, count) in self._series.items()]
+        for labels, counts, total, count in sorted(series):
+            cumulative = 0
+            for bound, n in zip(self.buckets + (math.inf,), counts):
+                cumulative += n
+                le = 'le="' + _number(bound) + '"'
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, labels, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, labels)} {_number(total)}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, labels)} {count}")
+        return lines
+
+
+class Gauge:
+    type = "gauge"
+
+    def __init__(self, name: str, help: str, fn: Callable[[], Sample], labelnames: Sequence[str] = ()):
+        """
+        Value read at scrape time from fn(): queue depths, cache counters and index sizes
+        already live in the components' stats(), so they are sampled, not pushed.
+        fn returns a number, or {label values: number} for a labeled metric; None (or an
+        exception, e.g. while the service is still loading) leaves the sample out.
+        """
+        self.name = name
+        self.help = help
+        self.fn = fn
+        self.labelnames = tuple(labelnames)
+
+    def collect(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.type}"]
+        try:
+            sample = self.fn()
+        except Exception:
+            sample = None
+        if not isinstance(sample, dict):
+            sample = {(): sample}
+        for labels, value in sorted(sample.items()):
+            if value is not None:
+                lines.append(f"{self.name}{_labels(self.labelnames, labels)} {_number(value)}")
+        return lines
+
+
+class Counter(Gauge):
+    # monotonic totals read from a component's counters (hits, rejections, ...)
+    type = "counter"
+
+
+class Registry:
+    def __init__(self):
+        """
+        The metrics one process exposes on /metrics. Under the pre-fork server every
+        worker has its own registry; Prometheus tells them apart by scrape target.
+        """
+        self._metrics: Dict[str, Union[Histogram, Gauge]] = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            self._metrics[metric.name] = metric
+        return metric
+
+    def histogram(self, name: str, help: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = LATENCY_BUCKETS, trace: bool = False) -> Histogram:
+        return self.register(Histogram(name, help, labelnames, buckets, trace))
+
+    def gauge(self, name: str, help: str, fn: Callable[[], Sample], labelnames: Sequence[str] = ()) -> Gauge:
+        return self.register(Gauge(name, help, fn, labelnames))
+
+    def counter(self, name: str, help: str, fn: Callable[[], Sample], labelnames: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, help, fn, labelnames))
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return "\n".join(line for metric in metrics for line in metric.collect()) + "\n"
+
+
+REGISTRY = Registry()
+
+# where a search spends its time; stages: preprocess, encode, vector_query, lexical,
+# fusion, serialize, plus filter in real_backend.py (both backends record into this one)
+STAGE_SECONDS = REGISTRY.histogram(
+    "search_stage_seconds", "Time spent per search stage", ("stage",), trace=True)
+# items per encoder call (the /search micro-batches and /search/batch)
+BATCH_SIZE = REGISTRY.histogram(
+    "search_encode_batch_size", "Queries encoded per encoder call", buckets=BATCH_SIZE_BUCKETS)
+
+
+def cache_metrics(registry: Registry, caches: Callable[[], Dict[str, Optional[dict]]]):
+    """
+    Hit / miss counters, hit ratio and size of the caches returned (as name -> stats()
+    dict, None when not available yet) by caches(), labeled by cache name.
+    """
+    def field(name: str) -> Callable[[], Sample]:
+        return lambda: {(cache,): stats.get(name) for cache, stats in caches().items() if stats}
+
+    registry.counter("search_cache_hits_total", "Cache lookups that hit", field("hits"), ("cache",))
+    registry.counter("search_cache_misses_total", "Cache lookups that missed", field("misses"), ("cache",))
+    registry.gauge("search_cache_hit_ratio", "Hits / lookups since start", field("hit_ratio"), ("cache",))
+    registry.gauge("search_cache_entries", "Entries currently cached", field("size"), ("cache",))
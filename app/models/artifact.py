@@ -0,0 +1,159 @@
+import inspect
+import json
+import os
+import time
+from typing import Dict, List
+
+import numpy as np
+
+from app.models.onnx_backend import mean_pool
+
+# bump when the layout below changes; loaders refuse artifacts of another version
+ARTIFACT_FORMAT = "semantic-app-model/1"
+
+
+def artifact_path(base_dir: str, model_name: str) -> str:
+    return os.path.join(base_dir, model_name.replace("/", "__") + ".safetensors")
+
+
+def pack_model(sentence_model, model_name: str, out_path: str) -> str:
+    """
+    Write a loaded SentenceTransformer into one self-contained .safetensors file:
+      - tensors: every parameter and buffer of the transformer (float32)
+      - metadata: format version, model name, transformer config, tokenizer.json,
+        max sequence length, pooling and normalization
+    Only mean pooling (what all-MiniLM-L6-v2 uses) is supported.
+    Returns out_path.
+    """
+    from safetensors.torch import save_file
+
+    transformer = sentence_model[0]
+    pooling = sentence_model[1]
+    if not getattr(pooling, "pooling_mode_mean_tokens", False):
+        raise ValueError(f"{model_name}: only mean pooling can be packed")
+    normalize = any(type(module).__name__ == "Normalize" for module in sentence_model)
+
+    model = transformer.auto_model.eval()
+    tensors: Dict[str, object] = {}
+    aliases: Dict[str, str] = {}
+    seen: Dict[int, str] = {}
+    # buffers too: non-persistent ones (e.g. position_ids) are not in the state dict
+    for name, tensor in list(model.named_parameters()) + list(model.named_buffers()):
+        ptr = tensor.data_ptr()
+        if ptr in seen:
+            aliases[name] = seen[ptr]  # tied weights are stored once
+            continue
+        seen[ptr] = name
+        tensors[name] = tensor.detach().contiguous().cpu()
+
+    metadata = {
+        "format": ARTIFACT_FORMAT,
+        "model_name": model_name,
+        "config": model.config.to_json_string(),
+        "tokenizer": sentence_model.tokenizer.backend_tokenizer.to_str(),
+        "pad_token": sentence_model.tokenizer.pad_token,
+        "max_seq_length": str(sentence_model.get_max_seq_length()),
+        "pooling": "mean",
+        "normalize": json.dumps(normalize),
+        "aliases": json.dumps(aliases),
+    }
+    os.makedirs(os.path.dirname(out_path) or ".", exist_ok=True)
+    tmp_path = out_path + ".tmp"
+    save_file(tensors, tmp_path, metadata=metadata)
+    os.replace(tmp_path, out_path)
+    return out_path
+
+
+def _assign(model, name: str, tensor):
+    import torch
+
+    *path, leaf = name.split(".")
+    module = model
+    for part in path:
+        module = getattr(module, part)
+    if leaf in module._parameters:
+        module._parameters[leaf] = torch.nn.Parameter(tensor, requires_grad=False)
+    else:
+        module._buffers[leaf] = tensor
+
+
+class ArtifactEncoder:
+    def __init__(self, path: str):
+        """
+        Encoder loaded from a pack_model() artifact, without the hub or sentence-transformers:
+          - weights are memory-mapped (pages come from the page cache and are shared by
+            every process that maps the same file) and assigned to a model built on the
+            meta device, so nothing is initialized or copied
+          - the tokenizer is rebuilt from the embedded tokenizer.json (Rust tokenizers)
+        Same encode() contract as SentenceTransformer.
+        """
+        import torch
+        from safetensors import safe_open
+        from safetensors.torch import load_file
+        from tokenizers import Tokenizer
+        from transformers import AutoConfig, AutoModel
+
+        start = time.perf_counter()
+        with safe_open(path, framework="pt") as f:
+            metadata = f.metadata()
+        if metadata.get("format") != ARTIFACT_FORMAT:
+            raise ValueError(f"{path}: artifact format {metadata.get('format')!r}, expected {ARTIFACT_FORMAT!r}")
+        config_dict = json.loads(metadata["config"])
+        config = AutoConfig.for_model(config_dict.pop("model_type"), **config_dict)
+        with torch.device("meta"):
+            model = AutoModel.from_config(config)
+        tensors = load_file(path)  # memory-mapped
+        for name, tensor in tensors.items():
+            _assign(model, name, tensor)
+        for name, target in json.loads(metadata["aliases"]).items():
+            _assign(model, name, tensors[target])
+        missing = [n for n, t in list(model.named_parameters()) + list(model.named_buffers()) if t.is_meta]
+        if missing:
+            raise ValueError(f"{path}: no weights for {missing[:5]}")
+        self.model = model.eval()
+        self._takes_token_types = "token_type_ids" in inspect.signature(model.forward).parameters
+
+        self.max_seq_length = int(metadata["max_seq_length"])
+        self.normalize = json.loads(metadata["normalize"])
+        self.tokenizer = Tokenizer.from_str(metadata["tokenizer"])
+        self.tokenizer.enable_truncation(self.max_seq_length)
+        pad_token = metadata["pad_token"]
+        self.tokenizer.enable_padding(pad_id=self.tokenizer.token_to_id(pad_token), pad_token=pad_token)
+        self.model_name = metadata["model_name"]
+        self.load_seconds = time.perf_counter() - start
+
+    def encode(self, texts: List[str], batch_size: int = 32, convert_to_numpy: bool = True, **kwargs) -> np.ndarray:
+        import torch
+
+        out = []
+        for start in range(0, len(texts), batch_size):
+            encodings = self.tokenizer.encode_batch(list(texts[start:start + batch_size]))
+            ids = torch.tensor([e.ids for e in encodings], dtype=torch.long)
+            mask = torch.tensor([e.attention_mask for e in encodings], dtype=torch.long)
+            inputs = {"input_ids": ids, "attention_mask": mask}
+            if self._takes_token_types:
+                inputs["token_type_ids"] = torch.tensor([e.type_ids for e in encodings], dtype=torch.long)
+            with torch.inference_mode():
+                hidden = self.model(**inputs)[0]
+            out.append(mean_pool(hidden.numpy(), mask.numpy(), normalize=self.normalize))
+        if not out:
+            return np.zeros((0, 0), dtype=np.float32)
+        return np.concatenate(out)
+
+
+if __name__ == "__main__":
+    # python -m app.models.artifact
+    # packs the configured model (needs the hub or its local cache once), then times a
+    # cold load of the artifact and prints its parity against sentence-transformers
+    from sentence_transformers import SentenceTransformer
+    from app.config import EMBEDDING_MODEL, MODEL_ARTIFACT_DIR
+    from app.models.onnx_backend import parity_check
+
+    path = artifact_path(MODEL_ARTIFACT_DIR, EMBEDDING_MODEL)
+    st_model = SentenceTransformer(EMBEDDING_MODEL)
+    pack_model(st_model, EMBEDDING_MODEL, path)
+    encoder = ArtifactEncoder(path)
+    print(f"wrote {path} ({os.path.getsize(path) / 1e6:.1f} MB), loads in {encoder.load_seconds * 1000:.0f} ms")
+    with open("app/data/sample_documents.txt", "r", encoding="utf-8") as f:
+        sample = [line.strip() for line in f if line.strip()]
+    print(parity_check(lambda t: st_model.encode(t, convert_to_numpy=True), encoder.encode, sample))
@@ -0,0 +1,72 @@
+import argparse
+import time
+from typing import Dict, List
+
+import numpy as np
+
+from app.config import DATA_PATH
+
+
+def heterogeneous_corpus(n: int, seed: int = 0, path: str = DATA_PATH) -> List[str]:
+    """
+    n synthetic documents with a long-tailed length distribution (lognormal word counts,
+    median ~15, some past 300), drawn from the sample documents' vocabulary.
+    """
+    rng = np.random.default_rng(seed)
+    with open(path, "r", encoding="utf-8") as f:
+        vocab = [w for line in f for w in line.split()] or ["semantic", "search"]
+    counts = np.clip(rng.lognormal(mean=2.7, sigma=1.0, size=n).astype(int), 1, 400)
+    return [" ".join(rng.choice(vocab, size=c)) for c in counts]
+
+
+def padding_efficiency(lengths: np.ndarray, batches: List[np.ndarray]) -> float:
+    """
+    Real tokens / padded tokens actually run through the encoder (1.0 = no padding).
+    """
+    padded = sum(len(rows) * int(lengths[rows].max()) for rows in batches)
+    return float(lengths.sum()) / max(padded, 1)
+
+
+def run(n_docs: int = 2000, fixed_batch_size: int = 32, repeat: int = 2) -> Dict[str, Dict[str, float]]:
+    """
+    Encode the same heterogeneous corpus with fixed-size batches in input order (the old
+    embed()) and with length-bucketed, token-budgeted batches; best of `repeat` runs each.
+    """
+    from app.models.embedding_model import EmbeddingModel
+
+    model = EmbeddingModel()
+    texts = heterogeneous_corpus(n_docs)
+    lengths = model.token_lengths(texts)
+    model.embed(texts[:64])  # warm-up
+
+    fixed_batches = [np.arange(i, min(i + fixed_batch_size, len(texts)))
+                     for i in range(0, len(texts), fixed_batch_size)]
+    results, outputs = {}, {}
+    for name, bucketing in (("fixed", False), ("bucketed", True)):
+        model.bucketing = bucketing
+        best = float("inf")
+        for _ in range(repeat):
+            start = time.perf_counter()
+            if bucketing:
+                outputs[name] = model.embed(texts)
+            else:
+                outputs[name] = model.model.encode(texts, batch_size=fixed_batch_size, convert_to_numpy=True)
+            best = min(best, time.perf_counter() - start)
+        batches = model.token_batches(lengths) if bucketing else fixed_batches
+        results[name] = {"seconds": round(best, 3), "docs_per_sec": round(len(texts) / best, 1),
+                         "batches": len(batches), "padding_efficiency": round(padding_efficiency(lengths, batches), 3)}
+    results["speedup"] = round(results["fixed"]["seconds"] / results["bucketed"]["seconds"], 2)
+    results["max_abs_diff"] = float(np.abs(outputs["fixed"] - outputs["bucketed"]).max())
+    return results
+
+
+if __name__ == "__main__":
+    # python -m app.models.benchmark [--docs N]
+    # fixed-size vs length-bucketed batching on the configured backend
+    parser = argparse.ArgumentParser(prog="python -m app.models.benchmark")
+    parser.add_argument("--docs", type=int, default=2000)
+    parser.add_argument("--batch-size", type=int, default=32, help="fixed batch size to compare against")
+    parser.add_argument("--repeat", type=int, default=2)
+    args = parser.parse_args()
+    for key, value in run(args.docs, args.batch_size, args.repeat).items():
+        print(f"{key:>10}: {value}")
@@ -1,15 +1,149 @@
-from sentence_transformers import SentenceTransformer
-from typing import List
+from typing import List, Optional
+import os
+import numpy as np
+from app.cache import TTLCache
+from app.models.artifact import ArtifactEncoder, artifact_path
+from app.models.onnx_backend import (OnnxEncoder, export_onnx, onnx_model_dir, parity_check,
+                                     ONNX_FILE, ONNX_INT8_FILE)
+from app.config import (QUERY_CACHE_SIZE, QUERY_CACHE_TTL, INFERENCE_INTRA_OP_THREADS,
+                        EMBEDDING_MODEL, EMBEDDING_BACKEND, MODEL_ARTIFACT_DIR, ONNX_MODEL_DIR, ONNX_PARITY_MIN_COSINE, DATA_PATH,
+                        EMBED_LENGTH_BUCKETING, EMBED_MAX_BATCH_TOKENS, EMBED_MAX_BATCH_SIZE)
 
 class EmbeddingModel:
-    def __init__(self, model_name: str = "sentence-transformers/all-MiniLM-L6-v2"):
+    def __init__(self, model_name: str = EMBEDDING_MODEL,
+                 num_threads: Optional[int] = INFERENCE_INTRA_OP_THREADS,
+                 backend: str = EMBEDDING_BACKEND):
+        """
+        backend: "artifact" loads the packed single-file model (see app/models/artifact.py);
+        "torch" runs SentenceTransformer; "onnx" / "onnx-int8" run an ONNX Runtime
+        export of the same model (exported and parity-checked on first use).
+        Either way self.model.encode(texts, convert_to_numpy=True) is what embed() calls.
+        """
+        # torch / sentence-transformers are imported here, not at module import, so the
+        # API process starts serving liveness before paying for them
+        import torch
+
         # small, fast, good for semantic search in student projects
         self.model_name = model_name
-        self.model = SentenceTransformer(self.model_name)
+        self.backend = backend
+        if num_threads:
+            # pin intra-op parallelism; several inference workers share the cores
+            torch.set_num_threads(num_threads)
+        if backend in ("onnx", "onnx-int8"):
+            self.model = self._load_onnx(quantized=(backend == "onnx-int8"), num_threads=num_threads)
+        elif backend == "artifact" and os.path.exists(artifact_path(MODEL_ARTIFACT_DIR, model_name)):
+            self.model = ArtifactEncoder(artifact_path(MODEL_ARTIFACT_DIR, model_name))
+            print(f"[model] {model_name} loaded from artifact in {self.model.load_seconds * 1000:.0f} ms")
+        else:
+            if backend == "artifact":
+                print(f"[model] no artifact for {model_name}, loading with sentence-transformers "
+                      f"(run `python -m app.models.artifact` to create one)")
+                self.backend = "torch"
+            from sentence_transformers import SentenceTransformer
+            self.model = SentenceTransformer(self.model_name)
+        # inputs are grouped by token length so short texts are not padded to long ones
+        self.bucketing = EMBED_LENGTH_BUCKETING
+        self.max_batch_tokens = EMBED_MAX_BATCH_TOKENS
+        self.max_batch_size = EMBED_MAX_BATCH_SIZE
+        # repeated queries (UI topic tags, reruns) skip the encoder entirely
+        self.query_cache = TTLCache(maxsize=QUERY_CACHE_SIZE, ttl=QUERY_CACHE_TTL)
+
+    @property
+    def store_key(self) -> str:
+        """
+        Embedding-store key: the model plus the precision the vectors were actually
+        computed at ("int8" for onnx-int8, "fp32" for artifact / torch / onnx, and after
+        a failed parity check falls back to torch), so quantized and full-precision
+        embeddings are never mixed in one index.
+        """
+        return f"{self.model_name}:{'int8' if self.backend == 'onnx-int8' else 'fp32'}"
 
     def embed(self, texts: List[str]):
         """
-        Return embeddings as a Python list or numpy array.
-        SentenceTransformer.encode returns numpy array by default.
+        Return embeddings as a numpy array, one row per text in input order.
+        With bucketing on, texts are sorted by token length and encoded in batches of at
+        most max_batch_tokens padded tokens (batch size x longest member), so a batch of
+        short texts is wide and a batch of long ones narrow; rows are put back in order.
+        """
+        if not self.bucketing or len(texts) <= 1:
+            return self.model.encode(texts, convert_to_numpy=True)
+        lengths = self.token_lengths(texts)
+        out = None
+        for rows in self.token_batches(lengths):
+            vectors = self.model.encode([texts[i] for i in rows], batch_size=len(rows), convert_to_numpy=True)
+            if out is None:
+                out = np.empty((len(texts), vectors.shape[1]), dtype=vectors.dtype)
+            out[rows] = vectors
+        return out
+
+    def token_lengths(self, texts: List[str]) -> np.ndarray:
+        """
+        Tokens per text including special tokens, capped at the model's max sequence length.
         """
-        return self.model.encode(texts, convert_to_numpy=True)
\ No newline at end of file
+        tokenizer = getattr(self.model, "tokenizer", None)
+        limit = getattr(self.model, "max_seq_length", None) or 512
+        if hasattr(tokenizer, "encode_batch"):
+            # tokenizers.Tokenizer (artifact backend); it pads, so count the attention mask
+            lengths = [sum(e.attention_mask) for e in tokenizer.encode_batch(list(texts))]
+        elif callable(tokenizer):
+            lengths = [len(ids) for ids in tokenizer(list(texts), add_special_tokens=True,
+                                                     truncation=True, max_length=limit)["input_ids"]]
+        else:
+            lengths = [len(t.split()) + 2 for t in texts]
+        return np.minimum(np.asarray(lengths, dtype=np.int64), limit)
+
+    def token_batches(self, lengths: np.ndarray) -> List[np.ndarray]:
+        """
+        Row indices grouped into length-sorted batches whose padded size
+        (rows x longest row) stays within max_batch_tokens, at most max_batch_size rows.
+        """
+        order = np.argsort(lengths, kind="stable")
+        batches, start = [], 0
+        for end in range(1, len(order) + 1):
+            # order is ascending, so the candidate's length is the batch's padded length
+            too_big = end < len(order) and (
+                (end + 1 - start) * lengths[order[end]] > self.max_batch_tokens
+                or end - start >= self.max_batch_size)
+            if end == len(order) or too_big:
+                batches.append(order[start:end])
+                start = end
+        return batches
+
+    def embed_queries(self, texts: List[str]):
+        """
+        Embed already cleaned query strings through the query cache.
+        Only cache misses are sent to the encoder, in a single call.
+        Returns one vector per input, in input order.
+        """
+        vectors = [self.query_cache.get((self.model_name, t)) for t in texts]
+        missing = [i for i, v in enumerate(vectors) if v is None]
+        if missing:
+            encoded = self.embed([texts[i] for i in missing])
+            for i, vector in zip(missing, encoded):
+                self.query_cache.set((self.model_name, texts[i]), vector)
+                vectors[i] = vector
+        return vectors
+
+    def embed_query(self, text: str):
+        return self.embed_queries([text])[0]
+
+    def _load_onnx(self, quantized: bool, num_threads: Optional[int]):
+        model_dir = onnx_model_dir(ONNX_MODEL_DIR, self.model_name)
+        if os.path.exists(os.path.join(model_dir, ONNX_INT8_FILE if quantized else ONNX_FILE)):
+            return OnnxEncoder(model_dir, quantized=quantized, num_threads=num_threads)
+
+        from sentence_transformers import SentenceTransformer
+        reference = SentenceTransformer(self.model_name)
+        export_onnx(reference, model_dir, quantize=quantized)
+        encoder = OnnxEncoder(model_dir, quantized=quantized, num_threads=num_threads)
+        sample = ["semantic search with sentence embeddings"]
+        if os.path.isfile(DATA_PATH):
+            with open(DATA_PATH, "r", encoding="utf-8") as f:
+                sample = [line.strip() for line in f if line.strip()][:64] or sample
+        parity = parity_check(lambda t: reference.encode(t, convert_to_numpy=True), encoder.encode, sample)
+        print(f"[onnx] exported {self.model_name} (int8={quantized}), parity {parity}")
+        if parity["min_cosine"] < ONNX_PARITY_MIN_COSINE:
+            print(f"[onnx] parity below {ONNX_PARITY_MIN_COSINE}, falling back to PyTorch")
+            self.backend = "torch"
+            return reference
+        return encoder
\ No newline at end of file
@@ -0,0 +1,124 @@
+import os
+from typing import Any, Callable, Dict, List, Optional
+
+import numpy as np
+
+ONNX_FILE = "model.onnx"
+ONNX_INT8_FILE = "model.int8.onnx"
+
+
+def onnx_model_dir(base_dir: str, model_name: str) -> str:
+    return os.path.join(base_dir, model_name.replace("/", "__"))
+
+
+def export_onnx(sentence_model, out_dir: str, quantize: bool = False) -> str:
+    """
+    Export the transformer inside a loaded SentenceTransformer to ONNX, plus its tokenizer.
+    With quantize=True an int8 dynamically quantized copy is written next to it.
+    Returns out_dir.
+    """
+    import torch
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    os.makedirs(out_dir, exist_ok=True)
+    transformer = sentence_model[0].auto_model.eval()
+    tokenizer = sentence_model.tokenizer
+    tokenizer.save_pretrained(out_dir)
+
+    sample = tokenizer(["export sample"], return_tensors="pt")
+    input_names = list(sample.keys())
+    dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in input_names}
+    dynamic_axes["last_hidden_state"] = {0: "batch", 1: "sequence"}
+    onnx_path = os.path.join(out_dir, ONNX_FILE)
+    with torch.no_grad():
+        torch.onnx.export(
+            transformer,
+            tuple(sample[name] for name in input_names),
+            onnx_path,
+            input_names=input_names,
+            output_names=["last_hidden_state"],
+            dynamic_axes=dynamic_axes,
+            opset_version=14,
+        )
+    if quantize:
+        quantize_dynamic(onnx_path, os.path.join(out_dir, ONNX_INT8_FILE), weight_type=QuantType.QInt8)
+    return out_dir
+
+
+def mean_pool(hidden: np.ndarray, attention_mask: np.ndarray, normalize: bool = True) -> np.ndarray:
+    """
+    Mean over non-padding tokens, then L2-normalize: the same pooling and Normalize
+    modules all-MiniLM-L6-v2 uses in sentence-transformers.
+    """
+    mask = attention_mask[..., None].astype(hidden.dtype)
+    pooled = (hidden * mask).sum(axis=1) / np.maximum(mask.sum(axis=1), 1e-9)
+    if normalize:
+        pooled = pooled / np.maximum(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12)
+    return pooled.astype(np.float32)
+
+
+class OnnxEncoder:
+    def __init__(self, model_dir: str, quantized: bool = False, num_threads: Optional[int] = None,
+                 max_seq_length: int = 256):
+        """
+        ONNX Runtime replacement for SentenceTransformer.encode (CPU execution provider).
+        quantized=True loads the int8 model written by export_onnx(quantize=True).
+        """
+        import onnxruntime as ort
+        from transformers import AutoTokenizer
+
+        options = ort.SessionOptions()
+        if num_threads:
+            options.intra_op_num_threads = num_threads
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        path = os.path.join(model_dir, ONNX_INT8_FILE if quantized else ONNX_FILE)
+        self.session = ort.InferenceSession(path, options, providers=["CPUExecutionProvider"])
+        self.input_names = {i.name for i in self.session.get_inputs()}
+        self.tokenizer = AutoTokenizer.from_pretrained(model_dir)
+        self.max_seq_length = max_seq_length
+
+    def encode(self, texts: List[str], batch_size: int = 32, convert_to_numpy: bool = True, **kwargs) -> np.ndarray:
+        """
+        Same contract as SentenceTransformer.encode: one normalized float32 row per text.
+        """
+        out = []
+        for start in range(0, len(texts), batch_size):
+            batch = texts[start:start + batch_size]
+            tokens = self.tokenizer(batch, padding=True, truncation=True,
+                                    max_length=self.max_seq_length, return_tensors="np")
+            feeds = {name: tokens[name].astype(np.int64) for name in self.input_names if name in tokens}
+            hidden = self.session.run(["last_hidden_state"], feeds)[0]
+            out.append(mean_pool(hidden, tokens["attention_mask"]))
+        if not out:
+            return np.zeros((0, 0), dtype=np.float32)
+        return np.concatenate(out)
+
+
+def parity_check(reference: Callable[[List[str]], Any], candidate: Callable[[List[str]], Any],
+                 texts: List[str]) -> Dict[str, float]:
+    """
+    Cosine agreement between two encoders on the same texts (1.0 = identical directions).
+    """
+    a = np.asarray(reference(texts), dtype=np.float32)
+    b = np.asarray(candidate(texts), dtype=np.float32)
+    a = a / np.maximum(np.linalg.norm(a, axis=1, keepdims=True), 1e-12)
+    b = b / np.maximum(np.linalg.norm(b, axis=1, keepdims=True), 1e-12)
+    cosines = (a * b).sum(axis=1)
+    return {"min_cosine": float(cosines.min()), "mean_cosine": float(cosines.mean())}
+
+
+if __name__ == "__main__":
+    # python -m app.models.onnx_backend [--quantize]
+    # exports the configured model and prints its parity against PyTorch
+    import sys
+    from sentence_transformers import SentenceTransformer
+    from app.config import EMBEDDING_MODEL, ONNX_MODEL_DIR
+
+    quantize = "--quantize" in sys.argv
+    model_dir = onnx_model_dir(ONNX_MODEL_DIR, EMBEDDING_MODEL)
+    st_model = SentenceTransformer(EMBEDDING_MODEL)
+    export_onnx(st_model, model_dir, quantize=quantize)
+    encoder = OnnxEncoder(model_dir, quantized=quantize)
+    with open("app/data/sample_documents.txt", "r", encoding="utf-8") as f:
+        sample = [line.strip() for line in f if line.strip()]
+    print(parity_check(lambda t: st_model.encode(t, convert_to_numpy=True), encoder.encode, sample))
@@ -0,0 +1,511 @@
+import json
+import os
+import threading
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from app.ann import make_ann_index
+from app.filters import MetadataColumns, SearchFilter
+from app.quantization import load_quantizer, make_quantizer
+
+
+class NumpyCollection:
+    def __init__(self, path: str = "local_numpy_index", block_rows: int = 65536,
+                 quantization: Optional[str] = None, pq_m: int = 96, train_min: int = 10000,
+                 rerank_factor: int = 4, recall_tolerance: float = 0.02,
+                 ann_index: Optional[str] = None, ann_train_min: int = 10000,
+                 ann_params: Optional[Dict[str, Any]] = None, read_only: bool = False,
+                 filter_ann_min_fraction: float = 0.1):
+        """
+        In-process exact-search store with the subset of the chroma collection API that
+        VectorDB uses (add / get / delete / query / count).
+
+        Layout of `path`:
+          - vectors.npy : memory-mapped float32 matrix of L2-normalized vectors (grows by doubling)
+          - docs.jsonl  : append-only sidecar, {"id", "text", "meta"} per row and {"delete": row} tombstones
+          - meta.json   : dim, committed row count and sidecar length; written last, so a crash
+                          mid-write leaves trailing data that is dropped on reload
+        Only ids and sidecar offsets live in RAM; vectors stay in the page cache and
+        documents are read from the sidecar for the returned hits only.
+        Search is a blocked matmul, so memory stays flat as the corpus grows.
+
+        quantization="sq8" (int8 scalar) or "pq" (product quantization, pq_m bytes per vector)
+        adds a compressed copy of the vectors (codes.npy + quantizer.npz), trained once
+        `train_min` vectors exist. Searches then scan only the codes, keep
+        k * rerank_factor candidates and rerank them exactly against the float32 vectors,
+        which are read from disk for those rows only. After training, rerank_factor is
+        doubled until the measured recall@10 is within `recall_tolerance` of exact search.
+
+        ann_index="ivf" or "hnsw" (see app/ann.py) builds an approximate index once
+        `ann_train_min` vectors exist; queries then only score the index's candidates
+        (through the codes first, when quantized). Per-query knobs (nprobe / ef) are
+        passed to query() and trade recall for latency.
+
+        Metadata (year / venue / authors) is kept in columns in RAM (app/filters.py) and
+        query(search_filter=...) only scores the rows that pass the filter: a block scan
+        over those rows, or, for filters letting through at least filter_ann_min_fraction
+        of the rows, the ANN candidates (fetched deeper in proportion) that pass.
+
+        read_only=True maps the files read-only and rejects add / delete; the pages are
+        then shared by every process that opened (or was forked from) the collection.
+        """
+        self.path = path
+        self.block_rows = block_rows
+        self.read_only = read_only
+        os.makedirs(path, exist_ok=True)
+        self._vectors_path = os.path.join(path, "vectors.npy")
+        self._docs_path = os.path.join(path, "docs.jsonl")
+        self._meta_path = os.path.join(path, "meta.json")
+        self._codes_path = os.path.join(path, "codes.npy")
+        self._quantizer_path = os.path.join(path, "quantizer.npz")
+        self._lock = threading.Lock()
+
+        self.dim: Optional[int] = None
+        self._count = 0
+        self._vectors: Optional[np.ndarray] = None
+        self._ids: List[str] = []
+        self._offsets: List[int] = []
+        self._row_of: Dict[str, int] = {}
+        self._alive = np.zeros(0, dtype=bool)
+        self._columns = MetadataColumns()
+        self.filter_ann_min_fraction = filter_ann_min_fraction
+
+        self.quantization = quantization
+        self.pq_m = pq_m
+        self.train_min = train_min
+        self.rerank_factor = rerank_factor
+        self.recall_tolerance = recall_tolerance
+        self.measured_recall: Optional[float] = None
+        self._quantizer = None
+        self._codes: Optional[np.ndarray] = None
+
+        self.ann_train_min = ann_train_min
+        self._ann = make_ann_index(ann_index, path, **(ann_params or {})) if ann_index else None
+        self._load()
+
+    # ---------- persistence ----------
+
+    def _load(self):
+        if not os.path.exists(self._meta_path):
+            return
+        with open(self._meta_path, "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        self.dim = meta["dim"]
+        self._count = meta["count"]
+        self.rerank_factor = meta.get("rerank_factor", self.rerank_factor)
+        self.measured_recall = meta.get("measured_recall")
+        mmap_mode = "r" if self.read_only else "r+"
+        self._vectors = np.load(self._vectors_path, mmap_mode=mmap_mode)
+        if self.quantization and os.path.exists(self._quantizer_path):
+            with np.load(self._quantizer_path) as state:
+                quantizer = load_quantizer(state)
+            if quantizer.kind == self.quantization:
+                self._quantizer = quantizer
+                self._codes = np.load(self._codes_path, mmap_mode=mmap_mode)
+        self._alive = np.zeros(len(self._vectors), dtype=bool)
+
+        # drop whatever an interrupted write appended after the last commit
+        with open(self._docs_path, "rb" if self.read_only else "r+b") as f:
+            if not self.read_only:
+                f.truncate(meta["docs_bytes"])
+            offset = 0
+            for line in f:
+                if offset >= meta["docs_bytes"]:
+                    break
+                entry = json.loads(line)
+                if "delete" in entry:
+                    row = entry["delete"]
+                    self._alive[row] = False
+                    if self._row_of.get(self._ids[row]) == row:
+                        del self._row_of[self._ids[row]]
+                else:
+                    row = len(self._ids)
+                    self._alive[row] = True
+                    self._columns.set(row, entry.get("meta"))
+                    self._row_of[entry["id"]] = row
+                    self._ids.append(entry["id"])
+                    self._offsets.append(offset)
+                offset += len(line)
+
+        if self._ann is not None and self._ann.load(self.dim, self._count, read_only=self.read_only):
+            if self.read_only and len(self._ann) < self._count:
+                # catching up would write to the index files; scan without it instead
+                print(f"[numpy] {self._ann.kind} index is behind the vectors, searching without it")
+                self._ann = None
+                return
+            # catch up on rows committed after the index was last persisted
+            self._ann_add_range(len(self._ann), self._count)
+            self._ann.delete(np.flatnonzero(~self._alive[:self._count]).tolist())
+
+    def _write_meta(self, docs_bytes: int):
+        tmp_path = self._meta_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"dim": self.dim, "count": self._count, "docs_bytes": docs_bytes,
+                       "rerank_factor": self.rerank_factor, "measured_recall": self.measured_recall}, f)
+        os.replace(tmp_path, self._meta_path)
+
+    def _reserve(self, rows: int):
+        """
+        Make room for `rows` more vectors, doubling the memory-mapped file when full.
+        """
+        needed = self._count + rows
+        capacity = 0 if self._vectors is None else len(self._vectors)
+        if needed <= capacity:
+            return
+        new_capacity = max(needed, capacity * 2, 1024)
+        self._vectors = self._grow(self._vectors_path, self._vectors, new_capacity, np.float32, self.dim)
+        if self._codes is not None:
+            self._codes = self._grow(self._codes_path, self._codes, new_capacity, np.uint8, self._codes.shape[1])
+        alive = np.zeros(new_capacity, dtype=bool)
+        alive[:len(self._alive)] = self._alive
+        self._alive = alive
+
+    def _grow(self, path: str, current: Optional[np.ndarray], capacity: int, dtype, width: int) -> np.ndarray:
+        """
+        Copy the committed rows of a memory-mapped matrix into a bigger file and remap it.
+        """
+        tmp_path = path + ".tmp"
+        grown = np.lib.format.open_memmap(tmp_path, mode="w+", dtype=dtype, shape=(capacity, width))
+        if current is not None and self._count:
+            grown[:self._count] = current[:self._count]
+        grown.flush()
+        del grown
+        os.replace(tmp_path, path)
+        return np.load(path, mmap_mode="r+")
+
+    # ---------- quantization ----------
+
+    def _train_quantizer(self):
+        """
+        Train on (a sample of) the stored vectors, encode every row, then calibrate the
+        rerank depth against exact search.
+        """
+        rng = np.random.default_rng(0)
+        rows = np.flatnonzero(self._alive[:self._count])
+        sample = np.sort(rng.choice(rows, min(len(rows), 50000), replace=False))
+        quantizer = make_quantizer(self.quantization, self.pq_m).train(np.asarray(self._vectors[sample]))
+
+        width = quantizer.encode(self._vectors[:1]).shape[1]
+        codes = self._grow(self._codes_path, None, len(self._vectors), dtype=np.uint8, width=width)
+        for start in range(0, self._count, self.block_rows):
+            stop = min(start + self.block_rows, self._count)
+            codes[start:stop] = quantizer.encode(self._vectors[start:stop])
+        codes.flush()
+        np.savez(self._quantizer_path, **quantizer.state())
+        self._codes, self._quantizer = codes, quantizer
+        self._calibrate(rows)
+
+    def _calibrate(self, rows: np.ndarray, k: int = 10, max_factor: int = 256):
+        # midpoints of random stored pairs: close to the data but not stored points themselves,
+        # which would make the codes look better than they are on real queries
+        rng = np.random.default_rng(1)
+        n = min(len(rows), 200)
+        queries = (np.asarray(self._vectors[np.sort(rng.choice(rows, n, replace=False))])
+                   + np.asarray(self._vectors[np.sort(rng.choice(rows, n, replace=False))]))
+        rng.shuffle(queries)
+        queries /= np.maximum(np.linalg.norm(queries, axis=1, keepdims=True), 1e-12)
+        exact, _ = self._top_k(queries, k)
+        while True:
+            approx, _ = self._approx_top_k(queries, k)
+            hits = sum(len(set(a) & set(e)) for a, e in zip(approx, exact))
+            self.measured_recall = hits / max(sum(len(e) for e in exact), 1)
+            if self.measured_recall >= 1.0 - self.recall_tolerance or self.rerank_factor >= max_factor:
+                return
+            self.rerank_factor *= 2
+
+    def _approx_top_k(self, queries: np.ndarray, k: int, rows: Optional[np.ndarray] = None):
+        """
+        First pass over the codes for k * rerank_factor candidates, then exact rerank.
+        rows restricts the scan as in _top_k.
+        """
+        candidates, _ = self._top_k(queries, k * self.rerank_factor, self._code_block, rows=rows)
+        out_rows, out_scores = [], []
+        for query, rows in zip(queries, candidates):
+            rows, scores = self._rank_candidates(query, np.asarray(rows, dtype=np.int64), k)
+            out_rows.append(rows)
+            out_scores.append(scores)
+        return out_rows, out_scores
+
+    def _scan_top_k(self, queries: np.ndarray, k: int, rows: Optional[np.ndarray] = None):
+        # full scan (of `rows` if given): codes + rerank once quantized, float32 otherwise
+        if self._quantizer is None:
+            return self._top_k(queries, k, rows=rows)
+        return self._approx_top_k(queries, k, rows=rows)
+
+    def _ann_top_k(self, queries: np.ndarray, k: int, rows: Optional[np.ndarray] = None, **search_params):
+        """
+        Rerank the ANN index's candidates; queries the index cannot answer (see
+        HNSWIndex.candidates) fall back to a full scan. rows (ascending) keeps only the
+        candidates among them, e.g. the ones passing a filter.
+        """
+        depth = k * self.rerank_factor
+        if rows is not None:
+            passes = np.zeros(self._count, dtype=bool)
+            passes[rows] = True
+            depth = int(np.ceil(depth * self._count / max(len(rows), 1)))
+        out_rows, out_scores = [], []
+        for query in queries:
+            candidates = self._ann.candidates(query, depth, **search_params)
+            if candidates is None:
+                (top_rows,), (top_scores,) = self._scan_top_k(query[None, :], k, rows=rows)
+            else:
+                candidates = np.asarray(candidates, dtype=np.int64)
+                if rows is not None:
+                    candidates = candidates[candidates < len(passes)]  # rows added since `rows` was taken
+                    candidates = candidates[passes[candidates]]
+                top_rows, top_scores = self._rank_candidates(query, candidates, k)
+            out_rows.append(top_rows)
+            out_scores.append(top_scores)
+        return out_rows, out_scores
+
+    def _filtered_top_k(self, queries: np.ndarray, k: int, search_filter: SearchFilter, **search_params):
+        """
+        Top-k among the rows passing the filter. A selective filter scans just those rows
+        (codes first when quantized), so it costs less than an unfiltered query; a broad
+        one takes ANN candidates, deeper by 1 / selectivity, and keeps the passing ones.
+        """
+        allowed = self.matching_rows(search_filter)
+        if not len(allowed):
+            return [[] for _ in queries], [[] for _ in queries]
+        fraction = len(allowed) / max(self._count, 1)
+        if self._ann is not None and self._ann.trained and fraction >= self.filter_ann_min_fraction:
+            return self._ann_top_k(queries, k, rows=allowed, **search_params)
+        return self._scan_top_k(queries, k, rows=allowed)
+
+    def _build_ann(self):
+        rng = np.random.default_rng(0)
+        rows = np.flatnonzero(self._alive[:self._count])
+        sample = np.sort(rng.choice(rows, min(len(rows), 100000), replace=False))
+        self._ann.train(np.asarray(self._vectors[sample]))
+        self._ann_add_range(0, self._count)
+        self._ann.delete(np.flatnonzero(~self._alive[:self._count]).tolist())
+        self._ann.save()
+
+    def _ann_add_range(self, start: int, stop: int):
+        for block in range(start, stop, self.block_rows):
+            end = min(block + self.block_rows, stop)
+            self._ann.add(block, np.asarray(self._vectors[block:end]))
+
+    def _rank_candidates(self, query: np.ndarray, rows: np.ndarray, k: int):
+        """
+        Exact top-k among candidate rows; with a quantizer, the codes first cut the
+        candidates down to k * rerank_factor so few float32 rows are read from disk.
+        """
+        rows = np.sort(rows)
+        rows = rows[self._alive[rows]]
+        depth = k * self.rerank_factor
+        if self._quantizer is not None and len(rows) > depth:
+            approx = self._quantizer.scores(query[None, :], np.asarray(self._codes[rows]))[0]
+            rows = np.sort(rows[np.argpartition(-approx, depth - 1)[:depth]])
+        exact = np.asarray(self._vectors[rows]) @ query if len(rows) else np.zeros(0, dtype=np.float32)
+        order = np.argsort(-exact)[:k]
+        return rows[order].tolist(), exact[order].tolist()
+
+    def _code_block(self, queries: np.ndarray, index) -> np.ndarray:
+        return self._quantizer.scores(queries, np.asarray(self._codes[index]))
+
+    def _exact_block(self, queries: np.ndarray, index) -> np.ndarray:
+        return queries @ np.asarray(self._vectors[index]).T
+
+    def quantization_stats(self) -> Dict[str, Any]:
+        return {
+            "quantization": self.quantization if self._quantizer is not None else None,
+            "code_bytes_per_vector": None if self._codes is None else int(self._codes.shape[1]),
+            "float_bytes_per_vector": None if self.dim is None else self.dim * 4,
+            "rerank_factor": self.rerank_factor,
+            "measured_recall_at_10": self.measured_recall,
+            "ann": None if self._ann is None or not self._ann.trained else self._ann.stats(),
+        }
+
+    # ---------- collection API ----------
+
+    def count(self) -> int:
+        return len(self._row_of)
+
+    def add(self, ids: List[str], documents: List[str], embeddings,
+            metadatas: Optional[List[Optional[Dict[str, Any]]]] = None, **kwargs):
+        """
+        Append vectors; an id that already exists is replaced (tombstone + new row).
+        metadatas: optional normalized metadata per row (app.filters.normalize_metadata).
+        """
+        self._check_writable()
+        vectors = np.asarray(embeddings, dtype=np.float32)
+        if vectors.ndim != 2 or len(vectors) != len(ids):
+            raise ValueError("expected one embedding per id")
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        vectors = vectors / np.maximum(norms, 1e-12)
+
+        with self._lock:
+            if self.dim is None:
+                self.dim = vectors.shape[1]
+            elif vectors.shape[1] != self.dim:
+                raise ValueError(f"expected {self.dim}-d embeddings, got {vectors.shape[1]}-d")
+            self._reserve(len(ids))
+
+            start = self._count
+            self._vectors[start:start + len(ids)] = vectors
+            self._vectors.flush()
+            if self._quantizer is not None:
+                self._codes[start:start + len(ids)] = self._quantizer.encode(vectors)
+                self._codes.flush()
+            if self._ann is not None and self._ann.trained:
+                self._ann.add(start, vectors)
+            self._alive[start:start + len(ids)] = True
+
+            with open(self._docs_path, "ab") as f:
+                offset = f.tell()
+                for i, (doc_id, text) in enumerate(zip(ids, documents)):
+                    meta = metadatas[i] if metadatas else None
+                    old = self._row_of.get(doc_id)
+                    if old is not None:
+                        f.write(json.dumps({"delete": old}).encode("utf-8") + b"\n")
+                        offset = f.tell()
+                        self._alive[old] = False
+                        if self._ann is not None and self._ann.trained:
+                            self._ann.delete([old])
+                    entry = {"id": doc_id, "text": text}
+                    if meta:
+                        entry["meta"] = meta
+                    line = json.dumps(entry).encode("utf-8") + b"\n"
+                    f.write(line)
+                    self._columns.set(start + i, meta)
+                    self._ids.append(doc_id)
+                    self._offsets.append(offset)
+                    self._row_of[doc_id] = start + i
+                    offset += len(line)
+
+            self._count = start + len(ids)
+            if self.quantization and self._quantizer is None and self.count() >= self.train_min:
+                self._train_quantizer()
+            if self._ann is not None and not self._ann.trained and self.count() >= self.ann_train_min:
+                self._build_ann()
+            self._write_meta(offset)
+
+    upsert = add
+
+    def delete(self, ids: List[str], **kwargs):
+        self._check_writable()
+        with self._lock:
+            rows = [self._row_of.pop(doc_id) for doc_id in ids if doc_id in self._row_of]
+            if not rows:
+                return
+            with open(self._docs_path, "ab") as f:
+                for row in rows:
+                    f.write(json.dumps({"delete": row}).encode("utf-8") + b"\n")
+                docs_bytes = f.tell()
+            self._alive[rows] = False
+            if self._ann is not None and self._ann.trained:
+                self._ann.delete(rows)
+            self._write_meta(docs_bytes)
+
+    def get(self, ids: Optional[List[str]] = None, limit: Optional[int] = None,
+            offset: Optional[int] = None, include: Optional[List[str]] = None, **kwargs) -> Dict[str, Any]:
+        if ids is not None:
+            rows = [self._row_of[doc_id] for doc_id in ids if doc_id in self._row_of]
+        else:
+            rows = np.flatnonzero(self._alive[:self._count])[offset or 0:]
+            if limit is not None:
+                rows = rows[:limit]
+        result = {"ids": [self._ids[row] for row in rows]}
+        if include and ("documents" in include or "metadatas" in include):
+            entries = self._read_entries(rows)
+            if "documents" in include:
+                result["documents"] = [e["text"] for e in entries]
+            if "metadatas" in include:
+                result["metadatas"] = [e.get("meta") for e in entries]
+        return result
+
+    def query(self, query_embeddings, n_results: int = 10, nprobe: Optional[int] = None,
+              ef: Optional[int] = None, search_filter: Optional[SearchFilter] = None, **kwargs) -> Dict[str, Any]:
+        """
+        Top-k by cosine similarity: exact, or codes + exact rerank once a quantizer is trained,
+        restricted to ANN candidates once an ANN index is built (nprobe / ef tune it per query).
+        search_filter restricts the search to documents whose metadata passes it.
+        Distances are squared L2 between unit vectors (2 - 2*cos), like chroma's default space.
+        """
+        queries = np.asarray(query_embeddings, dtype=np.float32)
+        queries = queries / np.maximum(np.linalg.norm(queries, axis=1, keepdims=True), 1e-12)
+        if search_filter:
+            rows, scores = self._filtered_top_k(queries, n_results, search_filter, nprobe=nprobe, ef=ef)
+        elif self._ann is not None and self._ann.trained:
+            rows, scores = self._ann_top_k(queries, n_results, nprobe=nprobe, ef=ef)
+        else:
+            rows, scores = self._scan_top_k(queries, n_results)
+        entries = [self._read_entries(qr) for qr in rows]
+        return {
+            "ids": [[self._ids[r] for r in qr] for qr in rows],
+            "documents": [[e["text"] for e in qe] for qe in entries],
+            "metadatas": [[e.get("meta") for e in qe] for qe in entries],
+            "distances": [[max(0.0, 2.0 - 2.0 * s) for s in qs] for qs in scores],
+        }
+
+    # ---------- internals ----------
+
+    def _check_writable(self):
+        if self.read_only:
+            raise PermissionError(f"{self.path} is opened read-only")
+
+    def _top_k(self, queries: np.ndarray, k: int, score_block=None, rows: Optional[np.ndarray] = None):
+        """
+        Scan the matrix block by block, keeping only the running top-k per query.
+        score_block(queries, index) scores the rows selected by a slice or row array
+        (exact float32 by default). rows (ascending, all alive) restricts the scan to
+        those rows, e.g. the ones passing a metadata filter.
+        """
+        score_block = score_block or self._exact_block
+        count, vectors, alive = self._count, self._vectors, self._alive
+        n_queries = len(queries)
+        best_rows = np.empty((n_queries, 0), dtype=np.int64)
+        best_scores = np.empty((n_queries, 0), dtype=np.float32)
+        if vectors is None or k <= 0:
+            return [[] for _ in range(n_queries)], [[] for _ in range(n_queries)]
+
+        total = count if rows is None else len(rows)
+        for start in range(0, total, self.block_rows):
+            stop = min(start + self.block_rows, total)
+            if rows is None:
+                block = np.arange(start, stop)
+                scores = score_block(queries, slice(start, stop))
+                scores[:, ~alive[start:stop]] = -np.inf
+            else:
+                block = rows[start:stop]
+                scores = score_block(queries, block)
+
+            cand_scores = np.concatenate([best_scores, scores], axis=1)
+            cand_rows = np.concatenate([best_rows, np.broadcast_to(block, (n_queries, len(block)))], axis=1)
+            if cand_scores.shape[1] > k:
+                part = np.argpartition(-cand_scores, k - 1, axis=1)[:, :k]
+                cand_scores = np.take_along_axis(cand_scores, part, axis=1)
+                cand_rows = np.take_along_axis(cand_rows, part, axis=1)
+            best_scores, best_rows = cand_scores, cand_rows
+
+        order = np.argsort(-best_scores, axis=1)
+        best_scores = np.take_along_axis(best_scores, order, axis=1)
+        best_rows = np.take_along_axis(best_rows, order, axis=1)
+        out_rows, out_scores = [], []
+        for rows, scores in zip(best_rows, best_scores):
+            keep = np.isfinite(scores)
+            out_rows.append(rows[keep].tolist())
+            out_scores.append(scores[keep].tolist())
+        return out_rows, out_scores
+
+    def _read_entries(self, rows) -> List[Dict[str, Any]]:
+        if not len(rows):
+            return []  # also covers a fresh index whose sidecar does not exist yet
+        entries = []
+        with open(self._docs_path, "rb") as f:
+            for row in rows:
+                f.seek(self._offsets[row])
+                entries.append(json.loads(f.readline()))
+        return entries
+
+    def matching_rows(self, search_filter: SearchFilter) -> np.ndarray:
+        """
+        Rows of the live documents that pass the filter (ascending).
+        """
+        count = self._count
+        return np.flatnonzero(self._alive[:count] & self._columns.mask(search_filter, count))
+
+    def matching_ids(self, search_filter: SearchFilter) -> List[str]:
+        return [self._ids[row] for row in self.matching_rows(search_filter)]
@@ -0,0 +1,130 @@
+import base64
+import hashlib
+import json
+from typing import Any, Callable, Dict, List, Optional
+
+from app.cache import TTLCache
+
+# per-hit lists kept for the pages; document texts are read per page instead
+_RANKED_KEYS = ("ids", "distances", "scores", "metadatas")
+
+
+class StaleCursor(Exception):
+    def __init__(self, issued: int, current: int):
+        """
+        The index changed (generation `current`) since the cursor was issued at `issued`:
+        its ranking no longer matches the data, so the search has to be restarted.
+        """
+        super().__init__(f"index generation changed from {issued} to {current}")
+        self.issued = issued
+        self.current = current
+
+
+def encode_cursor(state: Dict[str, Any]) -> str:
+    raw = json.dumps(state, separators=(",", ":"), sort_keys=True).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def _is_int(value: Any) -> bool:
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+def _optional(check: Callable[[Any], bool]) -> Callable[[Any], bool]:
+    return lambda value: value is None or check(value)
+
+
+def _is_str(value: Any) -> bool:
+    return isinstance(value, str)
+
+
+def _is_str_list(value: Any) -> bool:
+    return isinstance(value, list) and all(isinstance(v, str) for v in value)
+
+
+# the request a cursor carries (see /search in app/main.py): field -> type check
+_REQUEST_FIELDS = {"q": _is_str, "mode": _is_str, "fusion": _is_str,
+                   "nprobe": _optional(_is_int), "ef": _optional(_is_int), "filter": lambda v: isinstance(v, dict)}
+_FILTER_FIELDS = {"year_min": _optional(_is_int), "year_max": _optional(_is_int),
+                  "venues": _optional(_is_str_list), "author": _optional(_is_str)}
+
+
+def _valid_fields(value: Any, fields: Dict[str, Callable[[Any], bool]]) -> bool:
+    return isinstance(value, dict) and value.keys() == fields.keys() and all(
+        check(value[key]) for key, check in fields.items())
+
+
+def decode_cursor(token: str, depth: Optional[int] = None) -> Dict[str, Any]:
+    """
+    Inverse of encode_cursor; ValueError for anything that is not a cursor, including
+    well-formed tokens whose request, generation, offset (0..depth) or page size do not
+    have the shape /search issues.
+    """
+    try:
+        raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+        state = json.loads(raw)
+    except (ValueError, UnicodeDecodeError) as e:
+        raise ValueError("malformed cursor") from e
+    if not isinstance(state, dict) or state.keys() != {"r", "g", "o", "n"}:
+        raise ValueError("malformed cursor")
+    if not (_valid_fields(state["r"], _REQUEST_FIELDS) and _valid_fields(state["r"]["filter"], _FILTER_FIELDS)):
+        raise ValueError("malformed cursor")
+    if not (_is_int(state["g"]) and _is_int(state["o"]) and _is_int(state["n"])):
+        raise ValueError("malformed cursor")
+    if state["o"] < 0 or (depth is not None and state["o"] > depth) or state["n"] < 1:
+        raise ValueError("cursor offset or page size out of range")
+    return state
+
+
+class ResultPager:
+    def __init__(self, maxsize: int = 256, ttl: Optional[float] = 300, depth: int = 1000):
+        """
+        Cursor pagination over ranked candidate lists.
+          - the first request ranks up to `depth` hits once and parks the list (ids and
+            scores, not the texts) in a TTL cache keyed by the request and the index
+            generation
+          - every page is a slice of that list plus a document read for the page's ids,
+            so it costs O(page size) whatever its offset
+          - the cursor token carries the request, the generation and the offset: a cursor
+            whose generation is not the current one raises StaleCursor, and one whose list
+            expired (or was ranked by another pre-fork worker) is re-ranked once
+        """
+        self.depth = depth
+        self.cache = TTLCache(maxsize=maxsize, ttl=ttl)
+
+    def _key(self, request: Dict[str, Any], generation: int) -> str:
+        raw = json.dumps([request, generation, self.depth], sort_keys=True).encode("utf-8")
+        return hashlib.sha1(raw).hexdigest()
+
+    def get(self, request: Dict[str, Any], generation: int) -> Optional[Dict[str, List[Any]]]:
+        return self.cache.get(self._key(request, generation))
+
+    def put(self, request: Dict[str, Any], generation: int, result: Dict[str, Any]) -> Dict[str, List[Any]]:
+        """
+        Park the ranked hits of a /search-shaped result (first query only).
+        """
+        results = result.get("results", {})
+        ranked = {key: list(results[key][0]) for key in _RANKED_KEYS if results.get(key)}
+        ranked.setdefault("ids", [])
+        self.cache.set(self._key(request, generation), ranked)
+        return ranked
+
+    def page(self, request: Dict[str, Any], generation: int, ranked: Dict[str, List[Any]], offset: int,
+             size: int, documents: Callable[[List[Any]], Dict[Any, str]]) -> Dict[str, Any]:
+        """
+        One page of a ranked list, shaped like /search, plus the cursor of the next page
+        (None after the last one). documents(ids) -> {id: text} reads the page's texts.
+        """
+        ids = ranked["ids"][offset:offset + size]
+        texts = documents(ids)
+        results = {key: [values[offset:offset + size]] for key, values in ranked.items()}
+        results["documents"] = [[texts.get(i) for i in ids]]
+        end = offset + len(ids)
+        next_cursor = None
+        if end < len(ranked["ids"]):
+            next_cursor = encode_cursor({"r": request, "g": generation, "o": end, "n": size})
+        return {
+            "query": request.get("q"),
+            "results": results,
+            "page": {"offset": offset, "size": len(ids), "total": len(ranked["ids"]),
+                     "generation": generation, "next_cursor": next_cursor},
+        }
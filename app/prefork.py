@@ -0,0 +1,149 @@
+import os
+import signal
+import socket
+import sys
+import time
+from typing import Any, Dict
+
+from app.config import (MODE, INFERENCE_WORKERS, PREFORK_WORKERS, PREFORK_HOST, PREFORK_PORT,
+                        PREFORK_REPORT_INTERVAL)
+from app.memory import format_memory_table, memory_usage
+
+# components loaded by the master before forking; app.main hands them to SemanticSearch
+preloaded: Dict[str, Any] = {}
+
+
+def preload(mode: str = MODE):
+    """
+    Load what is big and read-only once, before forking:
+      - the EmbeddingModel weights (memory-mapped when loaded from the packed artifact,
+        copy-on-write anonymous memory otherwise)
+      - for MODE = "numpy", the vector index, mapped read-only
+    Chroma clients, sqlite connections, the BM25 index and every thread are created per
+    worker after the fork. Nothing is encoded here: a thread pool started before fork()
+    does not exist in the children, so warm-up runs in each worker.
+    """
+    from app.models.embedding_model import EmbeddingModel
+    from app.vector_db import VectorDB
+
+    start = time.perf_counter()
+    preloaded["model"] = EmbeddingModel()
+    if mode == "numpy":
+        preloaded["db"] = VectorDB(mode, read_only=True)
+    print(f"[prefork] preloaded {sorted(preloaded)} in {time.perf_counter() - start:.2f}s")
+
+
+def _check_shared():
+    """
+    app.main reads app.prefork.preloaded; this module must be that module (not a second
+    copy imported as __main__), and the master must have filled it. Otherwise every
+    worker would silently load its own model and open the numpy index writable.
+    """
+    shared = sys.modules.get("app.prefork")
+    if shared is None or shared.preloaded is not preloaded or "model" not in preloaded:
+        raise RuntimeError("app.prefork.preloaded does not hold the master's preloaded model "
+                           "(empty, or this is a second copy of app.prefork)")
+
+
+def _run_worker(sock: socket.socket, workers: int):
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    signal.signal(signal.SIGUSR1, signal.SIG_DFL)
+    try:
+        import torch
+        # the cores are split between processes now, not only between inference threads
+        torch.set_num_threads(max(1, (os.cpu_count() or 1) // (workers * INFERENCE_WORKERS)))
+    except ImportError:
+        pass
+
+    import uvicorn
+    from app.main import app, readiness
+
+    _check_shared()
+
+    readiness.reset()
+    server = uvicorn.Server(uvicorn.Config(app, log_level="info"))
+    server.run(sockets=[sock])
+
+
+def serve(workers: int = PREFORK_WORKERS, host: str = PREFORK_HOST, port: int = PREFORK_PORT,
+          report_interval: float = PREFORK_REPORT_INTERVAL):
+    """
+    Pre-fork server: preload in the master, then fork `workers` uvicorn workers that
+    accept on one shared listening socket. Dead workers are replaced.
+    Per-worker unique vs shared memory is printed every `report_interval` seconds
+    (0 = never) and on SIGUSR1.
+    """
+    preload()
+    import app.main  # noqa: F401  (imported before forking so workers share its pages)
+    _check_shared()
+
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+
+    children: Dict[int, int] = {}  # pid -> worker number
+    state = {"stopping": False, "report": False}
+
+    def spawn(number: int):
+        pid = os.fork()
+        if pid == 0:
+            code = 0
+            try:
+                _run_worker(sock, workers)
+            except BaseException as e:
+                print(f"[prefork] worker {number} failed: {e!r}", flush=True)
+                code = 1
+            finally:
+                os._exit(code)
+        children[pid] = number
+
+    def report():
+        rows = {"master": memory_usage()}
+        for pid, number in sorted(children.items(), key=lambda item: item[1]):
+            try:
+                rows[f"worker {number}"] = memory_usage(pid)
+            except (FileNotFoundError, ProcessLookupError):
+                pass
+        print(format_memory_table(rows), flush=True)
+
+    def stop(signum, frame):
+        state["stopping"] = True
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGUSR1, lambda signum, frame: state.update(report=True))
+
+    for number in range(workers):
+        spawn(number)
+    print(f"[prefork] {workers} workers on http://{host}:{port} (master pid {os.getpid()})", flush=True)
+
+    next_report = time.monotonic() + report_interval
+    while not state["stopping"]:
+        pid, status = os.waitpid(-1, os.WNOHANG)
+        if pid and pid in children:
+            number = children.pop(pid)
+            print(f"[prefork] worker {number} (pid {pid}) exited with {status}, restarting", flush=True)
+            spawn(number)
+        if state["report"] or (report_interval and time.monotonic() >= next_report):
+            state["report"] = False
+            next_report = time.monotonic() + report_interval
+            report()
+        time.sleep(0.2)
+
+    for pid in children:
+        os.kill(pid, signal.SIGTERM)
+    for pid in list(children):
+        os.waitpid(pid, 0)
+    sock.close()
+
+
+if __name__ == "__main__":
+    # python -m app.prefork [workers]
+    # run the imported app.prefork, not this __main__ copy: app.main reads the preloaded
+    # components from app.prefork.preloaded
+    from app import prefork
+
+    prefork.serve(int(sys.argv[1]) if len(sys.argv) > 1 else prefork.PREFORK_WORKERS)
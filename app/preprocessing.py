@@ -1,5 +1,30 @@
-import re
+import multiprocessing
 import string
+import unicodedata
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+from typing import Iterable, Iterator, List, Optional
+
+from app.config import PREPROCESS_CHUNK_SIZE, PREPROCESS_WORKERS
+
+# built once; clean_text runs for every document and query
+_PUNCTUATION = str.maketrans("", "", string.punctuation)
+# joins a batch into one string so each stage is a single C-level call per batch;
+# not whitespace, not punctuation and unchanged by lower() / NFKC
+_SEP = "\x00"
+
+# Common English function words, dropped by lexical (BM25) tokenization
+STOP_WORDS = frozenset("""
+a about above after again against all am an and any are as at be because been before being
+below between both but by can could did do does doing down during each few for from further
+had has have having he her here hers herself him himself his how i if in into is it its itself
+just me more most my myself no nor not now of off on once only or other our ours ourselves out
+over own same she should so some such than that the their theirs them themselves then there
+these they this those through to too under until up very was we were what when where which
+while who whom why will with would you your yours yourself yourselves
+""".split())
+
 
 def clean_text(text: str) -> str:
     """
@@ -8,7 +33,113 @@ def clean_text(text: str) -> str:
     if not isinstance(text, str):
         text = str(text)
     text = text.lower()
-    text = re.sub(r"\s+", " ", text).strip()
+    # split() / join() collapses and strips the same whitespace as re.sub(r"\s+", " ", ...).strip(), faster
+    text = " ".join(text.split())
     # remove punctuation
-    text = text.translate(str.maketrans("", "", string.punctuation))
-    return text
\ No newline at end of file
+    return text.translate(_PUNCTUATION)
+
+
+class TextCleaner:
+    def __init__(self, normalize: Optional[str] = None, lowercase: bool = True, punctuation: bool = True,
+                 stopwords: bool = False, max_words: Optional[int] = None):
+        """
+        Configurable cleaning stages, applied in this order:
+          - normalize: unicode normalization form ("NFKC", "NFC", ...), None to skip
+          - lowercase
+          - whitespace collapsed and stripped (always)
+          - punctuation: remove string.punctuation
+          - stopwords: drop STOP_WORDS (and re-join words with single spaces)
+          - max_words: keep the first max_words words
+        The defaults give exactly clean_text(), which document ids are hashed from.
+        """
+        self.normalize = normalize
+        self.lowercase = lowercase
+        self.punctuation = punctuation
+        self.stopwords = stopwords
+        self.max_words = max_words
+
+    def clean(self, text: str) -> str:
+        return self.clean_batch([text])[0]
+
+    def clean_batch(self, texts: List[str]) -> List[str]:
+        """
+        Clean a list of texts. The batch is joined with a separator and every stage runs
+        once over the joined string; a batch that contains the separator itself is
+        cleaned text by text instead.
+        """
+        texts = [t if isinstance(t, str) else str(t) for t in texts]
+        if not texts:
+            return []
+        joined = _SEP.join(texts)
+        if joined.count(_SEP) != len(texts) - 1:
+            return [self._clean_one(t) for t in texts]
+        if self.normalize:
+            joined = unicodedata.normalize(self.normalize, joined)
+        if self.lowercase:
+            joined = joined.lower()
+        # collapse, then strip every text: after the join only single spaces can sit
+        # next to a separator
+        joined = " ".join(joined.split()).replace(" " + _SEP, _SEP).replace(_SEP + " ", _SEP)
+        if self.punctuation:
+            joined = joined.translate(_PUNCTUATION)
+        cleaned = joined.split(_SEP)
+        if self.stopwords or self.max_words is not None:
+            cleaned = [self._words(t) for t in cleaned]
+        return cleaned
+
+    def _clean_one(self, text: str) -> str:
+        if self.normalize:
+            text = unicodedata.normalize(self.normalize, text)
+        if self.lowercase:
+            text = text.lower()
+        text = " ".join(text.split())
+        if self.punctuation:
+            text = text.translate(_PUNCTUATION)
+        if self.stopwords or self.max_words is not None:
+            text = self._words(text)
+        return text
+
+    def _words(self, text: str) -> str:
+        words = text.split()
+        if self.stopwords:
+            words = [w for w in words if w not in STOP_WORDS]
+        if self.max_words is not None:
+            words = words[:self.max_words]
+        return " ".join(words)
+
+
+def clean_texts(texts: Iterable[str], cleaner: Optional[TextCleaner] = None,
+                chunk_size: int = PREPROCESS_CHUNK_SIZE, workers: int = PREPROCESS_WORKERS) -> Iterator[List[str]]:
+    """
+    Clean a stream of texts, yielding cleaned chunks of at most chunk_size, in input order.
+      - the input is consumed lazily, nothing but the chunks in flight is held in memory
+      - workers > 1 cleans chunks in that many (spawned) processes, with at most
+        2 x workers chunks pending; the pool is only started once the input turns out
+        to be longer than one chunk
+    """
+    cleaner = cleaner or TextCleaner()
+    texts = iter(texts)
+    chunk = list(islice(texts, chunk_size))
+    if not chunk:
+        return
+    following = list(islice(texts, chunk_size))
+    if workers <= 1 or not following:
+        yield cleaner.clean_batch(chunk)
+        while following:
+            yield cleaner.clean_batch(following)
+            following = list(islice(texts, chunk_size))
+        return
+
+    pending = deque()
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+        for chunk in (chunk, following):
+            pending.append(pool.submit(cleaner.clean_batch, chunk))
+        while True:
+            chunk = list(islice(texts, chunk_size))
+            if not chunk:
+                break
+            if len(pending) >= 2 * workers:
+                yield pending.popleft().result()
+            pending.append(pool.submit(cleaner.clean_batch, chunk))
+        while pending:
+            yield pending.popleft().result()
@@ -0,0 +1,134 @@
+from typing import Optional
+
+import numpy as np
+
+
+def kmeans(x: np.ndarray, k: int, iters: int = 20, seed: int = 0) -> np.ndarray:
+    """
+    Plain Lloyd's k-means (squared L2), returns (k, dim) float32 centroids.
+    Empty clusters are re-seeded from random points.
+    """
+    rng = np.random.default_rng(seed)
+    x = np.asarray(x, dtype=np.float32)
+    k = min(k, len(x))
+    centroids = x[rng.choice(len(x), k, replace=False)].copy()
+    for _ in range(iters):
+        assign = nearest_centroid(x, centroids)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assign, x)
+        counts = np.bincount(assign, minlength=k)
+        empty = counts == 0
+        centroids[~empty] = sums[~empty] / counts[~empty, None]
+        if empty.any():
+            centroids[empty] = x[rng.choice(len(x), int(empty.sum()), replace=False)]
+    return centroids
+
+
+def nearest_centroid(x: np.ndarray, centroids: np.ndarray, block_rows: int = 65536) -> np.ndarray:
+    """
+    Index of the closest centroid (squared L2) for every row of x.
+    """
+    c_norms = (centroids ** 2).sum(axis=1)
+    out = np.empty(len(x), dtype=np.int64)
+    for start in range(0, len(x), block_rows):
+        block = x[start:start + block_rows]
+        # ||x - c||^2 = ||x||^2 - 2 x.c + ||c||^2; ||x||^2 does not change the argmin
+        out[start:start + len(block)] = np.argmin(c_norms[None, :] - 2.0 * block @ centroids.T, axis=1)
+    return out
+
+
+class ScalarQuantizer:
+    kind = "sq8"
+
+    def __init__(self, low: Optional[np.ndarray] = None, scale: Optional[np.ndarray] = None):
+        """
+        int8 scalar quantization: each dimension is mapped linearly onto 0..255 using
+        its trained min/max. 4x smaller than float32.
+        """
+        self.low = low
+        self.scale = scale
+
+    def train(self, x: np.ndarray) -> "ScalarQuantizer":
+        self.low = x.min(axis=0).astype(np.float32)
+        high = x.max(axis=0).astype(np.float32)
+        self.scale = np.maximum(high - self.low, 1e-12) / 255.0
+        return self
+
+    def encode(self, x: np.ndarray) -> np.ndarray:
+        codes = np.rint((np.asarray(x, dtype=np.float32) - self.low) / self.scale)
+        return np.clip(codes, 0, 255).astype(np.uint8)
+
+    def scores(self, queries: np.ndarray, codes: np.ndarray) -> np.ndarray:
+        """
+        Approximate dot products between queries (nq, dim) and encoded rows (n, code_size):
+        q . (low + scale * c) = q . low + (q * scale) . c
+        """
+        return (queries * self.scale) @ codes.T.astype(np.float32) + (queries @ self.low)[:, None]
+
+    def state(self) -> dict:
+        return {"kind": self.kind, "low": self.low, "scale": self.scale}
+
+
+class ProductQuantizer:
+    kind = "pq"
+
+    def __init__(self, m: int = 96, centroids: Optional[np.ndarray] = None):
+        """
+        Product quantization: the vector is split into m sub-vectors, each replaced by the
+        id of its nearest of 256 trained centroids (1 byte per sub-vector).
+        For 384-d float32 vectors, m=96 is 16x smaller, m=48 is 32x.
+        """
+        self.m = m
+        self.centroids = centroids  # (m, 256, dim // m)
+
+    def train(self, x: np.ndarray, iters: int = 20) -> "ProductQuantizer":
+        dim = x.shape[1]
+        if dim % self.m:
+            raise ValueError(f"dimension {dim} is not divisible by m={self.m}")
+        sub = dim // self.m
+        books = []
+        for j in range(self.m):
+            book = kmeans(x[:, j * sub:(j + 1) * sub], 256, iters=iters, seed=j)
+            if len(book) < 256:
+                book = np.concatenate([book, np.repeat(book[-1:], 256 - len(book), axis=0)])
+            books.append(book)
+        self.centroids = np.stack(books).astype(np.float32)
+        return self
+
+    def encode(self, x: np.ndarray) -> np.ndarray:
+        x = np.asarray(x, dtype=np.float32)
+        sub = self.centroids.shape[2]
+        codes = np.empty((len(x), self.m), dtype=np.uint8)
+        for j in range(self.m):
+            codes[:, j] = nearest_centroid(x[:, j * sub:(j + 1) * sub], self.centroids[j])
+        return codes
+
+    def scores(self, queries: np.ndarray, codes: np.ndarray) -> np.ndarray:
+        """
+        Asymmetric distance computation: per query, a (m, 256) table of sub-vector dot
+        products, then one table lookup per code byte.
+        """
+        sub = self.centroids.shape[2]
+        out = np.zeros((len(queries), len(codes)), dtype=np.float32)
+        for qi, q in enumerate(queries):
+            table = np.einsum("jcd,jd->jc", self.centroids, q.reshape(self.m, sub))
+            out[qi] = table[np.arange(self.m), codes].sum(axis=1)
+        return out
+
+    def state(self) -> dict:
+        return {"kind": self.kind, "m": self.m, "centroids": self.centroids}
+
+
+def make_quantizer(kind: str, pq_m: int = 96):
+    if kind == "sq8":
+        return ScalarQuantizer()
+    if kind == "pq":
+        return ProductQuantizer(m=pq_m)
+    raise ValueError(f"unknown quantization {kind!r} (expected 'sq8' or 'pq')")
+
+
+def load_quantizer(state) -> object:
+    kind = str(state["kind"])
+    if kind == "sq8":
+        return ScalarQuantizer(state["low"], state["scale"])
+    return ProductQuantizer(int(state["m"]), state["centroids"])
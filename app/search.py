@@ -1,46 +1,197 @@
-from app.preprocessing import clean_text
+from app.preprocessing import TextCleaner, clean_text
 from app.models.embedding_model import EmbeddingModel
 from app.vector_db import VectorDB
-from typing import Dict, Any, List
+from app.ingestion import IngestionPipeline
+from app.embedding_store import EmbeddingStore
+from app.bm25 import BM25Index
+from app.filters import SearchFilter
+from app.hybrid import reciprocal_rank_fusion, weighted_score_fusion
+from app.metrics import BATCH_SIZE, STAGE_SECONDS
+from app.ingestion import batched
+from app.config import (DATA_PATH, INGEST_BATCH_SIZE, INGEST_MAX_IN_FLIGHT, INGEST_CHECKPOINT, EMBEDDING_STORE,
+                        HYBRID_RRF_K, HYBRID_DENSE_WEIGHT)
+from typing import Dict, Any, List, Optional, Tuple
 
 class SemanticSearch:
-    def __init__(self, mode: str = "local"):
+    def __init__(self, mode: str = "local", model: Optional[EmbeddingModel] = None,
+                 db: Optional[VectorDB] = None):
+        """
+        model / db: already loaded components to reuse (the pre-fork server loads them
+        once in the master, see app/prefork.py); built here when not given.
+        """
         self.mode = mode
-        self.model = EmbeddingModel()
-        self.db = VectorDB(mode)
+        self.model = model if model is not None else EmbeddingModel()
+        self.db = db if db is not None else VectorDB(mode)
+        self.store = EmbeddingStore(EMBEDDING_STORE)
+        # lexical (BM25) view of the same documents, keyed by the same ids, for hybrid search
+        self.lexical = BM25Index()
+        self._load_lexical()
+
+    def _load_lexical(self):
+        for batch in batched(self.db.iter_documents(), 1000):
+            self.lexical.add_many(batch)
 
-    def index_documents(self):
+    def index_documents(self, paths=None, prune: bool = False):
         """
-        Read app/data/sample_documents.txt and index each line as a document.
+        Stream documents (one per line) from a file or directory into the DB.
+        Defaults to DATA_PATH (app/data/sample_documents.txt). Encoding and writes run
+        batch by batch, and an interrupted run resumes from its checkpoint.
+        Re-indexing is incremental: only new or changed documents are encoded.
+        prune=True also deletes every stored document that is not in the source, which
+        treats the source as the whole corpus (it drops documents loaded from elsewhere).
         """
-        docs = []
-        with open("app/data/sample_documents.txt", "r", encoding="utf-8") as f:
-            for line in f:
-                line = line.strip()
-                if line:
-                    docs.append(clean_text(line))
+        pipeline = IngestionPipeline(
+            self.model,
+            self.db,
+            batch_size=INGEST_BATCH_SIZE,
+            max_in_flight=INGEST_MAX_IN_FLIGHT,
+            checkpoint_path=INGEST_CHECKPOINT,
+            store=self.store,
+            lexical=self.lexical,
+            prune=prune,
+        )
+        stats = pipeline.run(paths or DATA_PATH)
 
-        if not docs:
-            return {"status": "no_documents"}
+        if not stats["committed"]:
+            return {"status": "no_documents", "deleted": stats["deleted"], "stale": stats["stale"]}
 
-        ids = [str(i) for i in range(len(docs))]
-        embeddings = self.model.embed(docs)
-        self.db.add(ids=ids, texts=docs, embeddings=embeddings)
         # If using local chroma with persist dir, commit/persist will be automatic
-        return {"status": "indexed", "count": len(docs)}
+        return {
+            "status": "indexed",
+            "count": stats["committed"],
+            "encoded": stats["encoded"],
+            "reused": stats["reused"],
+            "unchanged": stats["unchanged"],
+            "metadata_updated": stats["metadata_updated"],
+            "deleted": stats["deleted"],
+            # stored documents not in the source, kept because prune was off
+            "stale": stats["stale"],
+        }
 
     def search(self, query: str, k: int = 5) -> Dict[str, Any]:
         """
         Clean query, compute embedding, run DB search, and return a friendly dict.
+        Each step is timed into the search_stage_seconds histogram (app/metrics.py).
+        """
+        with STAGE_SECONDS.time("preprocess"):
+            q = clean_text(query)
+        with STAGE_SECONDS.time("encode"):
+            emb = self.model.embed_query(q)
+        BATCH_SIZE.observe(1)
+        return self.search_by_embedding(query, emb, k)
+
+    def search_by_embedding(self, query: str, emb, k: int = 5,
+                            search_params: Optional[Dict[str, Any]] = None,
+                            search_filter: Optional[SearchFilter] = None) -> Dict[str, Any]:
+        """
+        Run the DB search for an already computed query embedding
+        (used when the embedding comes from the request micro-batcher).
+        search_params: per-query ANN knobs (nprobe / ef), numpy backend only.
+        search_filter: metadata restriction (year range / venues / author).
+        """
+        raw = self.db.search(emb, k, search_filter=search_filter, **(search_params or {}))
+        return self._format(query, raw)
+
+    async def asearch_by_embedding(self, query: str, emb, k: int = 5,
+                                   search_filter: Optional[SearchFilter] = None) -> Dict[str, Any]:
+        """
+        search_by_embedding() awaited on the event loop, for the remote (chroma REST) DB.
+        """
+        raw = await self.db.asearch(emb, k, search_filter=search_filter)
+        return self._format(query, raw)
+
+    def search_batch(self, queries: List[Tuple[str, int]]) -> List[Dict[str, Any]]:
         """
-        q = clean_text(query)
-        emb = self.model.embed([q])[0]
-        raw = self.db.search(emb, k)
+        Search several (query, k) pairs at once: one embed call for all queries and one
+        multi-vector DB query with the largest k, trimmed per query afterwards.
+        Results come back in input order, each shaped like search().
+        """
+        if not queries:
+            return []
+        with STAGE_SECONDS.time("preprocess"):
+            cleaned = TextCleaner().clean_batch([q for q, _ in queries])
+        with STAGE_SECONDS.time("encode"):
+            embs = self.model.embed_queries(cleaned)
+        BATCH_SIZE.observe(len(cleaned))
+        raw = self.db.search_many(embs, max(k for _, k in queries))
+
+        out = []
+        for i, (query, k) in enumerate(queries):
+            one = {key: [raw[key][i][:k]] for key in ("ids", "documents", "distances") if raw.get(key)}
+            out.append(self._format(query, one))
+        return out
 
+    def _format(self, query: str, raw: Dict[str, Any]) -> Dict[str, Any]:
         # raw is a dict; normalize into friendly structure
         results = {
             "ids": raw.get("ids", []),
             "documents": raw.get("documents", []),
             "distances": raw.get("distances", [])
         }
-        return {"query": query, "results": results}
\ No newline at end of file
+        if raw.get("metadatas"):
+            results["metadatas"] = raw["metadatas"]
+        return {"query": query, "results": results}
+
+    def lexical_search(self, query: str, k: int = 5, deadline: Optional[float] = None,
+                       search_filter: Optional[SearchFilter] = None) -> List[Tuple[str, float]]:
+        """
+        BM25 ranking over the indexed documents as [(id, score)].
+        A search_filter needs the numpy backend, whose metadata columns give the ids to
+        restrict BM25 to (ValueError otherwise).
+        """
+        keys = None
+        if search_filter:
+            keys = self.db.matching_ids(search_filter)
+            if keys is None:
+                raise ValueError("metadata filters on lexical / hybrid search need MODE = \"numpy\"")
+        with STAGE_SECONDS.time("lexical"):
+            return self.lexical.search(query, k, deadline=deadline, keys=keys)
+
+    def fuse(self, query: str, dense_raw: Optional[Dict[str, Any]], lexical_hits: Optional[List[Tuple[str, float]]],
+             k: int = 5, fusion: str = "rrf", legs: Optional[Dict[str, str]] = None) -> Dict[str, Any]:
+        """
+        Combine the dense and lexical rankings (either may be None when its leg failed or
+        timed out) with reciprocal-rank fusion ("rrf") or weighted score fusion ("weighted").
+        Returns the /search shape plus fused scores and the status of each leg.
+        """
+        with STAGE_SECONDS.time("fusion"):
+            return self._fuse(query, dense_raw, lexical_hits, k, fusion, legs)
+
+    def _fuse(self, query: str, dense_raw: Optional[Dict[str, Any]], lexical_hits: Optional[List[Tuple[str, float]]],
+              k: int, fusion: str, legs: Optional[Dict[str, str]]) -> Dict[str, Any]:
+        rankings, weights = [], []
+        distances, texts = {}, {}
+        if dense_raw and dense_raw.get("ids"):
+            ids = dense_raw["ids"][0]
+            dists = dense_raw.get("distances", [[None] * len(ids)])[0]
+            docs = dense_raw.get("documents", [[None] * len(ids)])[0]
+            distances.update(zip(ids, dists))
+            texts.update((i, d) for i, d in zip(ids, docs) if d is not None)
+            # squared L2 between unit vectors -> cosine similarity
+            rankings.append([(i, 1.0 - (d or 0.0) / 2.0) for i, d in zip(ids, dists)])
+            weights.append(HYBRID_DENSE_WEIGHT)
+        if lexical_hits:
+            rankings.append(lexical_hits)
+            weights.append(1.0 - HYBRID_DENSE_WEIGHT)
+
+        if fusion == "weighted":
+            fused = weighted_score_fusion(rankings, weights)
+        else:
+            fused = reciprocal_rank_fusion(rankings, k=HYBRID_RRF_K, weights=weights)
+        fused = fused[:k]
+
+        missing = [i for i, _ in fused if i not in texts]
+        texts.update(self.db.documents(missing))
+        ids = [i for i, _ in fused]
+        return {
+            "query": query,
+            "mode": "hybrid" if legs and "dense" in legs else "lexical",
+            "fusion": fusion,
+            "legs": legs or {},
+            "results": {
+                "ids": [ids],
+                "documents": [[texts.get(i) for i in ids]],
+                "distances": [[distances.get(i) for i in ids]],
+                "scores": [[round(score, 6) for _, score in fused]],
+            },
+        }
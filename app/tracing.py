@@ -0,0 +1,267 @@
+import heapq
+import itertools
+import os
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+from collections import Counter, defaultdict, deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+REQUEST_ID_HEADER = "x-request-id"
+# client-supplied request ids are kept only when they look like ids
+_REQUEST_ID = re.compile(r"[A-Za-z0-9._-]{1,64}")
+
+# the trace of the request being handled; None when tracing is off (the common case),
+# which keeps record_span / span down to one context variable lookup
+_current: ContextVar[Optional["Trace"]] = ContextVar("search_trace", default=None)
+
+
+class Trace:
+    __slots__ = ("request_id", "method", "path", "sampled", "start", "duration", "spans")
+
+    def __init__(self, request_id: str, method: str, path: str, sampled: bool):
+        """
+        Spans of one request, as (name, offset from the request start, duration) in seconds.
+        Spans come from the stage timers (app/metrics.py STAGE_SECONDS) and span(); the
+        trace follows the request into inference threads through its context.
+        """
+        self.request_id = request_id
+        self.method = method
+        self.path = path
+        self.sampled = sampled
+        self.start = time.perf_counter()
+        self.duration: Optional[float] = None
+        self.spans: List[Tuple[str, float, float]] = []
+
+    def add(self, name: str, start: float, duration: float):
+        self.spans.append((name, start - self.start, duration))
+
+    def stages(self) -> Dict[str, float]:
+        """
+        Milliseconds per span name (repeated spans summed), in first-seen order.
+        """
+        totals: Dict[str, float] = defaultdict(float)
+        for name, _, duration in list(self.spans):
+            totals[name] += duration * 1000.0
+        return {name: round(ms, 3) for name, ms in totals.items()}
+
+    def server_timing(self) -> str:
+        """
+        Server-Timing header value (browser devtools show it next to the request).
+        """
+        parts = [f"{name};dur={ms}" for name, ms in self.stages().items()]
+        parts.append(f"total;dur={round((time.perf_counter() - self.start) * 1000.0, 3)}")
+        return ", ".join(parts)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "request_id": self.request_id,
+            "method": self.method,
+            "path": self.path,
+            "duration_ms": None if self.duration is None else round(self.duration * 1000.0, 3),
+            "stages_ms": self.stages(),
+            "spans": [{"name": name, "offset_ms": round(offset * 1000.0, 3), "duration_ms": round(d * 1000.0, 3)}
+                      for name, offset, d in list(self.spans)],
+        }
+
+
+def record_span(name: str, start: float, duration: float):
+    """
+    Attach a timed block (perf_counter start, seconds) to the current request's trace, if any.
+    """
+    trace = _current.get()
+    if trace is not None:
+        trace.add(name, start, duration)
+
+
+@contextmanager
+def span(name: str) -> Iterator[None]:
+    """
+    Time the block as a span of the current trace; a no-op outside traced requests.
+    """
+    trace = _current.get()
+    if trace is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        trace.add(name, start, time.perf_counter() - start)
+
+
+class Tracer:
+    def __init__(self, sample_rate: float = 0.0, slow_k: int = 0, recent: int = 100):
+        """
+        Opt-in request tracing, per process:
+          - sample_rate: share of requests traced and answered with a Server-Timing header
+            (plus a "[trace]" log line and an entry in the recent buffer)
+          - slow_k: keep the K slowest requests with their stage breakdown (every request
+            is traced for that, sampled or not); 0 = off
+          - recent: sampled traces kept for /admin/traces
+        With both off, TracingMiddleware passes requests straight through. Both can be
+        changed at runtime (POST /admin/tracing).
+        """
+        self.sample_rate = 0.0
+        self.slow_k = 0
+        self.recent: deque = deque(maxlen=recent)
+        self.traced = 0
+        self._slowest: List[Tuple[float, int, Dict[str, Any]]] = []  # min-heap
+        self._order = itertools.count()
+        self._lock = threading.Lock()
+        self.configure(sample_rate, slow_k)
+
+    @property
+    def enabled(self) -> bool:
+        return self.sample_rate > 0.0 or self.slow_k > 0
+
+    def configure(self, sample_rate: Optional[float] = None, slow_k: Optional[int] = None):
+        with self._lock:
+            if sample_rate is not None:
+                self.sample_rate = min(max(float(sample_rate), 0.0), 1.0)
+            if slow_k is not None and max(int(slow_k), 0) != self.slow_k:
+                self.slow_k = max(int(slow_k), 0)
+                self._slowest = []
+
+    def start(self, request_id: Optional[str], method: str, path: str) -> Trace:
+        if not request_id or not _REQUEST_ID.fullmatch(request_id):
+            request_id = uuid.uuid4().hex
+        sampled = self.sample_rate > 0.0 and random.random() < self.sample_rate
+        return Trace(request_id, method, path, sampled)
+
+    def finish(self, trace: Trace):
+        trace.duration = time.perf_counter() - trace.start
+        entry = None
+        with self._lock:
+            self.traced += 1
+            if trace.sampled:
+                self.recent.append(trace)
+            if self.slow_k > 0 and (len(self._slowest) < self.slow_k or trace.duration > self._slowest[0][0]):
+                entry = trace.to_dict()
+                item = (trace.duration, next(self._order), entry)
+                if len(self._slowest) < self.slow_k:
+                    heapq.heappush(self._slowest, item)
+                else:
+                    heapq.heapreplace(self._slowest, item)
+        if trace.sampled or entry is not None:
+            stages = " ".join(f"{name}={ms}ms" for name, ms in trace.stages().items())
+            tag = "slow" if entry is not None else "trace"
+            print(f"[{tag}] {trace.method} {trace.path} {trace.duration * 1000.0:.1f} ms "
+                  f"id={trace.request_id} {stages}".rstrip())
+
+    def slowest(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            return [entry for _, _, entry in sorted(self._slowest, reverse=True)]
+
+    def find(self, request_id: Optional[str] = None) -> List[Dict[str, Any]]:
+        with self._lock:
+            traces = list(self.recent)
+        return [t.to_dict() for t in reversed(traces) if request_id is None or t.request_id == request_id]
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "sample_rate": self.sample_rate,
+            "slow_k": self.slow_k,
+            "traced": self.traced,
+            "recent": len(self.recent),
+        }
+
+
+class TracingMiddleware:
+    def __init__(self, app, tracer: Tracer, skip_prefixes: Tuple[str, ...] = ("/admin",)):
+        """
+        ASGI middleware: traces requests while the tracer is enabled, echoes the request id
+        (the client's X-Request-ID, or a new one) on the response and adds Server-Timing to
+        sampled ones. Paths under skip_prefixes (the admin endpoints, e.g. a 30 s profile
+        run) are never traced.
+        """
+        self.app = app
+        self.tracer = tracer
+        self.skip_prefixes = skip_prefixes
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self.tracer.enabled or scope["path"].startswith(self.skip_prefixes):
+            await self.app(scope, receive, send)
+            return
+        request_id = None
+        for name, value in scope.get("headers", []):
+            if name == REQUEST_ID_HEADER.encode("latin-1"):
+                request_id = value.decode("latin-1")
+        trace = self.tracer.start(request_id, scope.get("method", ""), scope["path"])
+
+        async def send_traced(message):
+            if message["type"] == "http.response.start":
+                headers = list(message.get("headers", []))
+                headers.append((REQUEST_ID_HEADER.encode("latin-1"), trace.request_id.encode("latin-1")))
+                if trace.sampled:
+                    headers.append((b"server-timing", trace.server_timing().encode("latin-1")))
+                message = dict(message, headers=headers)
+            await send(message)
+
+        token = _current.set(trace)
+        try:
+            await self.app(scope, receive, send_traced)
+        finally:
+            _current.reset(token)
+            self.tracer.finish(trace)
+
+
+class ProfilerBusy(Exception):
+    pass
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class SamplingProfiler:
+    def __init__(self):
+        """
+        Statistical wall-clock profiler over all threads of the process: every interval it
+        snapshots each thread's Python stack (sys._current_frames) and counts identical
+        stacks. Nothing runs between profiles; one profile at a time.
+        """
+        self._lock = threading.Lock()
+
+    def profile(self, seconds: float, interval: float = 0.005,
+                thread_prefix: Optional[str] = None) -> Tuple[str, Dict[str, Any]]:
+        """
+        Sample for `seconds` and return (collapsed stacks, summary). Collapsed stacks are
+        "thread;outer;...;inner count" lines, the input of flamegraph.pl, speedscope and
+        inferno. thread_prefix keeps only threads whose name starts with it (e.g.
+        "inference"). Waiting threads are sampled too (wall clock, not CPU time).
+        Raises ProfilerBusy while another profile runs.
+        """
+        if not self._lock.acquire(blocking=False):
+            raise ProfilerBusy("a profile is already running")
+        try:
+            me = threading.get_ident()
+            stacks: Counter = Counter()
+            samples = 0
+            deadline = time.monotonic() + seconds
+            while time.monotonic() < deadline:
+                names = {t.ident: t.name for t in threading.enumerate()}
+                for ident, frame in sys._current_frames().items():
+                    name = names.get(ident, str(ident))
+                    if ident == me or (thread_prefix and not name.startswith(thread_prefix)):
+                        continue
+                    labels = []
+                    while frame is not None:
+                        labels.append(_frame_label(frame))
+                        frame = frame.f_back
+                    labels.append(name)
+                    stacks[";".join(reversed(labels))] += 1
+                samples += 1
+                time.sleep(interval)
+        finally:
+            self._lock.release()
+        collapsed = "".join(f"{stack} {count}\n" for stack, count in stacks.most_common())
+        return collapsed, {"seconds": seconds, "interval_ms": interval * 1000.0, "samples": samples,
+                           "stacks": len(stacks)}
@@ -1,43 +1,268 @@
-from chromadb.config import Settings
-import chromadb
-from typing import List, Any
-from app.config import MODE
+import asyncio
+import os
+import time
+import numpy as np
+from typing import List, Any, Dict, Iterator, Optional, Set, Tuple
+from app.config import (MODE, NUMPY_INDEX_DIR, NUMPY_SEARCH_BLOCK_ROWS, NUMPY_QUANTIZATION, NUMPY_PQ_M,
+                        NUMPY_QUANT_TRAIN_MIN, NUMPY_RERANK_FACTOR, NUMPY_RECALL_TOLERANCE, NUMPY_ANN_INDEX,
+                        NUMPY_ANN_TRAIN_MIN, NUMPY_IVF_NLIST, NUMPY_IVF_NPROBE, NUMPY_HNSW_M,
+                        NUMPY_HNSW_EF_CONSTRUCTION, NUMPY_HNSW_EF, CHROMA_HOST, CHROMA_PORT,
+                        CHROMA_MAX_CONNECTIONS, CHROMA_ADD_BATCH, CHROMA_ADD_CONCURRENCY, CHROMA_TIMEOUT,
+                        NUMPY_FILTER_ANN_MIN_FRACTION, CHROMA_FILTER_OVERFETCH, INDEX_GENERATION_FILE)
+from app.filters import SearchFilter, chroma_metadata
+from app.metrics import STAGE_SECONDS
+from app.numpy_store import NumpyCollection
+from app.chroma_client import ChromaRestClient, ChromaRestCollection
 
 class VectorDB:
-    def __init__(self, mode: str = "local"):
+    def __init__(self, mode: str = "local", read_only: bool = False):
         """
-        Two modes:
+        Three modes:
           - local: uses embedded persistent duckdb+parquet (no external service)
-          - docker: connects to a chroma REST server running in the 'chroma' container
+          - docker: connects to a chroma REST server running in the 'chroma' container,
+            through a pooled async client (app/chroma_client.py)
+          - numpy: in-process exact search over a memory-mapped .npy matrix (no chroma)
+        read_only (numpy only): map the index read-only and refuse writes, so forked
+        workers can share its pages safely.
         """
-        if mode == "local":
-            self.client = chromadb.Client(Settings(
-                chroma_db_impl="duckdb+parquet",
-                persist_directory="local_chroma"
-            ))
-        else:
+        self.read_only = read_only and mode == "numpy"
+        self.remote = mode not in ("numpy", "local")
+        self.generation_path = INDEX_GENERATION_FILE
+        if mode == "numpy":
+            self.client = None
+            self.collection = NumpyCollection(
+                NUMPY_INDEX_DIR,
+                block_rows=NUMPY_SEARCH_BLOCK_ROWS,
+                quantization=NUMPY_QUANTIZATION,
+                pq_m=NUMPY_PQ_M,
+                train_min=NUMPY_QUANT_TRAIN_MIN,
+                rerank_factor=NUMPY_RERANK_FACTOR,
+                recall_tolerance=NUMPY_RECALL_TOLERANCE,
+                ann_index=NUMPY_ANN_INDEX,
+                ann_train_min=NUMPY_ANN_TRAIN_MIN,
+                ann_params={"nlist": NUMPY_IVF_NLIST, "nprobe": NUMPY_IVF_NPROBE, "m": NUMPY_HNSW_M,
+                            "ef_construction": NUMPY_HNSW_EF_CONSTRUCTION, "ef": NUMPY_HNSW_EF},
+                read_only=read_only,
+                filter_ann_min_fraction=NUMPY_FILTER_ANN_MIN_FRACTION,
+            )
+            return
+        if self.remote:
             # Docker expects a chroma server container named "chroma"
-            self.client = chromadb.Client(Settings(
-                chroma_api_impl="rest",
-                chroma_server_host="chroma",
-                chroma_server_http_port="8000"
-            ))
+            self.client = ChromaRestClient(
+                f"http://{CHROMA_HOST}:{CHROMA_PORT}",
+                collection="documents",
+                max_connections=CHROMA_MAX_CONNECTIONS,
+                add_batch_size=CHROMA_ADD_BATCH,
+                add_concurrency=CHROMA_ADD_CONCURRENCY,
+                timeout=CHROMA_TIMEOUT,
+            )
+            self.collection = ChromaRestCollection(self.client)
+            return
+        import chromadb
+        from chromadb.config import Settings
+        self.client = chromadb.Client(Settings(
+            chroma_db_impl="duckdb+parquet",
+            persist_directory="local_chroma"
+        ))
 
         # create or get collection
         self.collection = self.client.get_or_create_collection(name="documents")
 
-    def add(self, ids: List[str], texts: List[str], embeddings: Any):
+    @property
+    def generation(self) -> int:
+        """
+        Index generation: the mtime (ns) of the stamp every write touches, so writes by
+        another process (python -m app.ingest, another worker) invalidate this process's
+        cached results and cursors too. 0 before the first write.
+        """
+        try:
+            return os.stat(self.generation_path).st_mtime_ns
+        except OSError:
+            return 0
+
+    def _bump_generation(self):
+        # after the write: a reader seeing the new generation must also see the new data
+        before = self.generation
+        with open(self.generation_path, "w", encoding="utf-8") as f:
+            f.write(str(time.time_ns()))
+        if self.generation <= before:
+            # coarse filesystem timestamps: make sure the value still moves forward
+            os.utime(self.generation_path, ns=(before + 1, before + 1))
+
+    def add(self, ids: List[str], texts: List[str], embeddings: Any,
+            metadatas: Optional[List[Optional[Dict[str, Any]]]] = None):
         """
-        Add documents and embeddings to the collection.
+        Add documents and embeddings to the collection; an id that is already stored is
+        replaced (upsert), e.g. when its metadata changed.
         embeddings: numpy array or list
+        metadatas: optional per-document metadata (app.filters.normalize_metadata), stored
+        alongside the vectors for filtered search
+        """
+        if self.client is None:
+            self.collection.upsert(ids=ids, documents=texts, embeddings=embeddings, metadatas=metadatas)
+        else:
+            flat = [chroma_metadata(m) for m in metadatas] if metadatas else None
+            # the REST client takes arrays (it converts per chunk); embedded chroma wants lists
+            if not self.remote:
+                embeddings = np.asarray(embeddings, dtype=float).tolist()
+            self.collection.upsert(ids=ids, documents=texts, embeddings=embeddings, metadatas=flat)
+        self._bump_generation()
+
+    async def acount(self) -> int:
+        """
+        Stored documents, for the event loop: the REST call is awaited and local chroma
+        runs on the default executor; the numpy count is an in-memory lookup.
+        """
+        if self.remote:
+            return await self.collection.run_async(self.client.count())
+        if self.client is None:
+            return self.collection.count()
+        return await asyncio.get_running_loop().run_in_executor(None, self.collection.count)
+
+    def _stored_form(self, meta: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+        # metadata as the backend hands it back: chroma flattens it (and always stores a
+        # dict), the numpy store keeps the normalized dict or nothing
+        return chroma_metadata(meta) if self.client is not None else (meta or None)
+
+    def changed_metadata(self, ids: List[str],
+                         metadatas: List[Optional[Dict[str, Any]]]) -> Tuple[Set[str], Set[str]]:
+        """
+        (ids already stored, stored ids whose metadata differs from `metadatas`). Ids are
+        content hashes, so a document whose year / venue / authors changed keeps its id
+        and has to be rewritten for filters to see the new values.
+        """
+        if not ids:
+            return set(), set()
+        res = self.collection.get(ids=ids, include=["metadatas"])
+        stored_ids = res.get("ids", [])
+        stored = dict(zip(stored_ids, res.get("metadatas") or [None] * len(stored_ids)))
+        wanted = dict(zip(ids, metadatas))
+        changed = {doc_id for doc_id, meta in stored.items()
+                   if self._stored_form(meta) != self._stored_form(wanted[doc_id])}
+        return set(stored), changed
+
+    def all_ids(self, page_size: int = 10000) -> Iterator[str]:
         """
-        # ensure lists
-        self.collection.add(ids=ids, documents=texts, embeddings=embeddings)
+        Iterate over every stored id, one page at a time.
+        """
+        offset = 0
+        while True:
+            page = self.collection.get(limit=page_size, offset=offset, include=[]).get("ids", [])
+            yield from page
+            if len(page) < page_size:
+                return
+            offset += page_size
 
-    def search(self, query_embedding, k: int = 5):
+    def documents(self, ids: List[str]) -> Dict[str, str]:
+        """
+        Return {id: document text} for the given ids.
+        """
+        if not ids:
+            return {}
+        res = self.collection.get(ids=ids, include=["documents"])
+        return dict(zip(res.get("ids", []), res.get("documents", [])))
+
+    def iter_documents(self, page_size: int = 10000) -> Iterator[Tuple[str, str]]:
+        """
+        Iterate over every stored (id, document text), one page at a time.
+        """
+        offset = 0
+        while True:
+            page = self.collection.get(limit=page_size, offset=offset, include=["documents"])
+            yield from zip(page.get("ids", []), page.get("documents", []))
+            if len(page.get("ids", [])) < page_size:
+                return
+            offset += page_size
+
+    def delete(self, ids: List[str]):
+        if ids:
+            self.collection.delete(ids=ids)
+            self._bump_generation()
+
+    def close(self):
+        if self.remote:
+            self.collection.close()
+
+    def _search_params(self, search_params: Dict[str, Any]) -> Dict[str, Any]:
+        # ANN knobs (nprobe / ef) only exist on the numpy backend; chroma would reject them
+        if self.client is not None:
+            return {}
+        return {name: value for name, value in search_params.items() if value is not None}
+
+    def _filter_args(self, search_filter: Optional[SearchFilter], k: int) -> Tuple[int, Dict[str, Any]]:
+        """
+        (rows to fetch, query kwargs) for a metadata filter: the numpy backend filters
+        before scoring; chroma gets the year / venue part as `where` and, with an author
+        condition, over-fetches so _filter_result can check it.
+        """
+        if not search_filter:
+            return k, {}
+        if self.client is None:
+            return k, {"search_filter": search_filter}
+        where = search_filter.chroma_where()
+        n = k * CHROMA_FILTER_OVERFETCH if search_filter.author else k
+        return n, {"where": where} if where else {}
+
+    def _filter_result(self, res: Dict[str, Any], search_filter: Optional[SearchFilter], k: int) -> Dict[str, Any]:
+        if not search_filter or self.client is None or not search_filter.author:
+            return res
+        out = {key: [] for key in ("ids", "documents", "metadatas", "distances") if res.get(key)}
+        for i, metas in enumerate(res.get("metadatas") or []):
+            keep = [j for j, meta in enumerate(metas) if search_filter.matches(meta)][:k]
+            for key in out:
+                out[key].append([res[key][i][j] for j in keep])
+        return out
+
+    def matching_ids(self, search_filter: SearchFilter) -> Optional[List[str]]:
+        """
+        Ids of the documents passing the filter, from the numpy backend's metadata columns
+        (None for chroma, which cannot list them cheaply).
+        """
+        if self.client is None:
+            return self.collection.matching_ids(search_filter)
+        return None
+
+    def _query_embeddings(self, query_embeddings):
+        # (n, dim) float32 straight to the numpy store and the REST client (which serializes
+        # it itself); only the embedded chroma client wants nested lists of floats
+        queries = np.asarray(query_embeddings, dtype=np.float32)
+        if self.client is None or self.remote:
+            return queries
+        return queries.astype(float).tolist()
+
+    def search(self, query_embedding, k: int = 5, search_filter: Optional[SearchFilter] = None,
+               **search_params):
         """
         Query the DB by embedding. Returns the raw query result from chroma.
         Typically contains 'ids', 'documents', 'distances' or similar structure.
+        search_filter restricts the search to documents whose metadata passes it.
+        search_params (nprobe, ef) tune the numpy backend's ANN index per query.
+        Timed as the "vector_query" stage (app/metrics.py), like search_many / asearch.
+        """
+        n, filter_args = self._filter_args(search_filter, k)
+        with STAGE_SECONDS.time("vector_query"):
+            res = self.collection.query(query_embeddings=self._query_embeddings(np.atleast_2d(query_embedding)),
+                                        n_results=n, **filter_args, **self._search_params(search_params))
+        return self._filter_result(res, search_filter, k)
+
+    def search_many(self, query_embeddings, k: int = 5, search_filter: Optional[SearchFilter] = None,
+                    **search_params):
+        """
+        Query the DB with several embeddings in one call.
+        The raw chroma result holds one list per query, in query order.
+        """
+        n, filter_args = self._filter_args(search_filter, k)
+        with STAGE_SECONDS.time("vector_query"):
+            res = self.collection.query(query_embeddings=self._query_embeddings(query_embeddings),
+                                        n_results=n, **filter_args, **self._search_params(search_params))
+        return self._filter_result(res, search_filter, k)
+
+    async def asearch(self, query_embedding, k: int = 5, search_filter: Optional[SearchFilter] = None):
+        """
+        search() for the event loop (remote mode only): the HTTP call is awaited instead of
+        holding an inference thread for its whole round trip.
         """
-        res = self.collection.query(query_embeddings=[query_embedding], n_results=k)
-        return res
\ No newline at end of file
+        n, filter_args = self._filter_args(search_filter, k)
+        with STAGE_SECONDS.time("vector_query"):
+            res = await self.collection.run_async(self.client.query([query_embedding], n, **filter_args))
+        return self._filter_result(res, search_filter, k)
\ No newline at end of file
@@ -0,0 +1,105 @@
+import os
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+from app.preprocessing import clean_text
+
+DEFAULT_WARMUP_QUERIES = [
+    "semantic search with sentence embeddings",
+    "machine learning",
+    "how do vector databases index documents",
+]
+
+
+class NotReady(Exception):
+    def __init__(self, retry_after: int = 1):
+        """
+        Raised by endpoints that need the model/index while they are still loading;
+        the API turns it into a 503.
+        """
+        super().__init__("model and index are still loading")
+        self.retry_after = retry_after
+
+
+class Readiness:
+    def __init__(self):
+        """
+        Startup state shared by the background loader and the /ready probe.
+        Stages: "starting" -> "loading" -> "warming" -> "ready", or "failed".
+        """
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        # also called in forked workers, whose clock starts at the fork
+        self.stage = "starting"
+        self.error: Optional[str] = None
+        self.timings: Dict[str, float] = {}
+        self._started = time.monotonic()
+        self._stage_started = self._started
+
+    @property
+    def ready(self) -> bool:
+        return self.stage == "ready"
+
+    def enter(self, stage: str):
+        with self._lock:
+            now = time.monotonic()
+            self.timings[f"{self.stage}_s"] = round(now - self._stage_started, 3)
+            self.stage, self._stage_started = stage, now
+
+    def fail(self, error: BaseException):
+        with self._lock:
+            self.error = f"{type(error).__name__}: {error}"
+            self.stage = "failed"
+
+    def stats(self) -> Dict[str, Any]:
+        return {"stage": self.stage, "ready": self.ready, "error": self.error,
+                "uptime_s": round(time.monotonic() - self._started, 3), "timings": dict(self.timings)}
+
+
+def warmup_queries(path: str, count: int = 16, words: int = 8) -> List[str]:
+    """
+    Query-sized prefixes of the first documents in `path` (falls back to fixed queries),
+    so warm-up runs at the sequence lengths real queries have.
+    """
+    queries = []
+    if os.path.isfile(path):
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                text = " ".join(clean_text(line).split()[:words])
+                if text:
+                    queries.append(text)
+                if len(queries) >= count:
+                    break
+    return queries or list(DEFAULT_WARMUP_QUERIES)
+
+
+def warm_up(search_engine, queries: List[str], batch_sizes: List[int], rounds: int = 3) -> Dict[str, Any]:
+    """
+    Run the encoder and the search paths on representative queries until they are warm:
+      - encodes every batch size the micro-batcher produces (kernels are shape-specialized,
+        the allocator grows per batch shape) `rounds` times, bypassing the query cache
+      - one dense, one batched and one lexical search, to page in the index
+    Returns the first and last round latency of the single-query encode.
+    """
+    single = []
+    for _ in range(max(1, rounds)):
+        for size in batch_sizes:
+            batch = [queries[i % len(queries)] for i in range(size)]
+            start = time.perf_counter()
+            search_engine.model.embed(batch)
+            if size == 1:
+                single.append(time.perf_counter() - start)
+    emb = search_engine.model.embed([queries[0]])[0]
+    search_engine.search_by_embedding(queries[0], emb, 5)
+    search_engine.search_batch([(q, 5) for q in queries[:max(batch_sizes)]])
+    search_engine.lexical_search(queries[0], 5)
+    return {
+        "queries": len(queries),
+        "batch_sizes": list(batch_sizes),
+        "first_encode_ms": round(single[0] * 1000, 2) if single else None,
+        "last_encode_ms": round(single[-1] * 1000, 2) if single else None,
+    }
+
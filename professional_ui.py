@@ -2,6 +2,7 @@
 import streamlit as st
 import requests
 import time
+import uuid
 
 # Backend URL - FIXED
 BACKEND_URL = "http://127.0.0.1:8001"
@@ -128,11 +129,17 @@ if st.session_state.search_triggered:
 
     with st.spinner(f"🔍 Searching for '{search_term}'..."):
         try:
+            # sent along so a slow or failed search can be found in the backend's traces
+            request_id = uuid.uuid4().hex
             response = requests.get(
                 f"{BACKEND_URL}/search",
                 params={"q": search_term, "k": k},
+                headers={"X-Request-ID": request_id},
                 timeout=10
             )
+            # present when the backend traced this request (opt-in)
+            if response.headers.get("Server-Timing"):
+                st.caption(f"🧭 Request `{request_id}` · {response.headers['Server-Timing']}")
 
             if response.status_code == 200:
                 data = response.json()
@@ -150,7 +157,7 @@ if st.session_state.search_triggered:
                     if data.get('mode') == 'test':
                         st.info("ℹ️ Running in test mode - Index documents for real semantic search")
             else:
-                st.error(f"Search failed: {response.status_code}")
+                st.error(f"Search failed: {response.status_code} (request id `{request_id}`)")
 
         except requests.exceptions.ConnectionError:
             st.error("❌ Cannot connect to backend!")
@@ -1,20 +1,32 @@
 # real_backend_final.py - REAL search with NO dependencies
-from fastapi import FastAPI
+from fastapi import FastAPI, Body, Query
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, Response
 import numpy as np
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
 import uvicorn
+import json
+import threading
+from app.bm25 import BM25Index
+from app.cache import ResultCache
+from app.config import (RESULT_CACHE_SIZE, RESULT_CACHE_TTL, TRACE_SAMPLE_RATE, TRACE_RECENT,
+                        SLOW_REQUEST_LOG_K)
+from app.filters import MetadataColumns, SearchFilter, normalize_metadata
+from app.metrics import CONTENT_TYPE, REGISTRY, STAGE_SECONDS, cache_metrics
+from app.tracing import Tracer, TracingMiddleware
+from app.admin import admin_router
+from app.preprocessing import clean_text
+from typing import List, Optional
 import sys
 
 sys.stdout = sys.__stdout__
 
 print("=" * 60)
-print("🚀 REAL SEMANTIC SEARCH (TF-IDF + Cosine Similarity)")
+print("🚀 REAL SEMANTIC SEARCH (BM25 ranking)")
 print("=" * 60)
 print("✅ NO external dependencies needed!")
-print("✅ Uses REAL TF-IDF vectors")
-print("✅ Uses REAL cosine similarity")
+print("✅ Uses REAL BM25 scoring (incremental, segment-based index)")
+print("✅ Uses REAL inverted index with WAND top-k")
+print("✅ Year / venue / author filters on columnar metadata")
 print("✅ Academic paper dataset")
 print("=" * 60)
 
@@ -25,8 +37,16 @@ app.add_middleware(
     allow_origins=["*"],
     allow_methods=["*"],
     allow_headers=["*"],
+    # lets browser clients read the request id / stage timings of traced requests
+    expose_headers=["X-Request-ID", "Server-Timing"],
 )
 
+# opt-in request tracing and slow-request log; /admin/* (needs ADMIN_TOKEN) toggles them
+# and runs the sampling profiler
+tracer = Tracer(sample_rate=TRACE_SAMPLE_RATE, slow_k=SLOW_REQUEST_LOG_K, recent=TRACE_RECENT)
+app.add_middleware(TracingMiddleware, tracer=tracer)
+app.include_router(admin_router(tracer))
+
 # REAL Academic Papers Database
 ACADEMIC_DATABASE = [
     {
@@ -106,14 +126,59 @@ ACADEMIC_DATABASE = [
     }
 ]
 
-# Extract just the content for vectorization
-documents = [doc["content"] for doc in ACADEMIC_DATABASE]
+# Records by id (the lexical index only stores ids, the API returns the full record)
+records = {doc["id"]: doc for doc in ACADEMIC_DATABASE}
+# ids given to papers posted without one: a counter (ids may be strings, and a max over
+# the current records would hand out ids again)
+next_record_id = max((i for i in records if isinstance(i, int)), default=0) + 1
+# /index runs on the threadpool: id allocation and every write to records, the row maps,
+# the metadata columns and the lexical index happen under this lock
+index_lock = threading.Lock()
+
+# Columnar year / venue / authors for filtering before BM25 scoring: one row per indexed
+# record version (a replaced record gets a new row; row_of points at the current one)
+metadata_columns = MetadataColumns()
+row_ids = []
+row_of = {}
+
+
+def index_metadata(record):
+    row = len(row_ids)
+    row_ids.append(record["id"])
+    row_of[record["id"]] = row
+    metadata_columns.set(row, normalize_metadata(record))
+
+
+def matching_ids(search_filter: SearchFilter) -> List[int]:
+    with index_lock:
+        rows = np.flatnonzero(metadata_columns.mask(search_filter, len(row_ids)))
+        return [row_ids[r] for r in rows if row_of[row_ids[r]] == r]
+
 
-# Initialize TF-IDF vectorizer (REAL text vectorization)
-vectorizer = TfidfVectorizer(stop_words='english', max_features=1000)
-print("🔧 Building TF-IDF vector space...")
-document_vectors = vectorizer.fit_transform(documents)
-print(f"✅ Vector space created: {document_vectors.shape[0]} docs, {document_vectors.shape[1]} features")
+for doc in ACADEMIC_DATABASE:
+    index_metadata(doc)
+
+# Incremental BM25 index: new papers are added to a small in-memory segment that is
+# flushed and merged in the background, so /index never refits anything and
+# searches keep running while documents come in
+lexical_index = BM25Index()
+print("🔧 Building BM25 index...")
+lexical_index.add_many((doc["id"], doc["content"]) for doc in ACADEMIC_DATABASE)
+print(f"✅ Index created: {len(lexical_index)} docs, {lexical_index.vocabulary_size()} terms")
+
+# /search responses per index generation (bumped by /index); concurrent identical
+# searches (UI reruns) are computed once
+result_cache = ResultCache(maxsize=RESULT_CACHE_SIZE, ttl=RESULT_CACHE_TTL)
+index_generation = 0
+
+# /metrics: stage histograms are recorded by /search, the rest is sampled at scrape time
+cache_metrics(REGISTRY, lambda: {"result": result_cache.stats()})
+REGISTRY.gauge("search_index_documents", "Documents in each index", lambda: {("lexical",): len(lexical_index)},
+               ("index",))
+REGISTRY.gauge("search_index_vocabulary", "Distinct terms in the BM25 index", lexical_index.vocabulary_size)
+REGISTRY.gauge("search_index_segments", "BM25 segments (buffer not included)", lambda: len(lexical_index.segments))
+REGISTRY.gauge("search_index_generation", "Index writes since start (invalidates the result cache)",
+               lambda: index_generation)
 
 
 @app.get("/")
@@ -121,46 +186,90 @@ def home():
     return {
         "status": "running",
         "message": "REAL Semantic Search API",
-        "technique": "TF-IDF Vectorization + Cosine Similarity",
-        "documents": len(documents),
-        "features": document_vectors.shape[1],
+        "technique": "BM25 ranking over an inverted index",
+        "documents": len(lexical_index),
+        "features": lexical_index.vocabulary_size(),
         "is_real_search": True,
         "algorithm": "Information Retrieval (Standard IR Technique)"
     }
 
 
 @app.post("/index")
-def index_documents():
-    """Already indexed - TF-IDF vectors are pre-computed"""
+def index_documents(papers: list = Body(default=None)):
+    """
+    Add papers to the live index (no refit). Body: optional list of records with at least
+    "content" (and optionally "id", "title", "authors", "year", "venue"); a paper with an
+    existing id replaces it. Without a body, reports the current index.
+    """
+    global index_generation, next_record_id
+    added = 0
+    if papers:
+        with index_lock:
+            new_docs = []
+            for paper in papers:
+                if not isinstance(paper, dict) or not paper.get("content"):
+                    continue
+                record = {"authors": [], "year": None, "venue": None, **paper}
+                if record.get("id") is None:
+                    record["id"] = next_record_id
+                if isinstance(record["id"], int):
+                    next_record_id = max(next_record_id, record["id"] + 1)
+                records[record["id"]] = record
+                index_metadata(record)
+                new_docs.append((record["id"], record["content"]))
+            lexical_index.add_many(new_docs)
+            added = len(new_docs)
+            if added:
+                index_generation += 1
+
     return {
         "success": True,
-        "message": f"✅ {len(documents)} academic papers indexed with TF-IDF vectors",
-        "document_count": len(documents),
-        "vector_dimensions": document_vectors.shape[1],
-        "technique": "Term Frequency-Inverse Document Frequency (TF-IDF)",
-        "similarity_measure": "Cosine Similarity",
+        "message": f"✅ {len(lexical_index)} academic papers indexed with BM25 ({added} added)",
+        "count": len(lexical_index),
+        "document_count": len(lexical_index),
+        "added": added,
+        "vocabulary_size": lexical_index.vocabulary_size(),
+        "index": lexical_index.stats(),
+        "generation": index_generation,
+        "technique": "Okapi BM25",
+        "similarity_measure": "BM25 score (normalized to the query's maximum)",
         "note": "This is REAL information retrieval, not fake data"
     }
 
 
 @app.get("/search")
-def search(q: str = "machine learning", k: int = 5):
-    """REAL semantic search using TF-IDF and cosine similarity"""
-    print(f"🔍 Performing REAL search for: '{q}'")
+def search(q: str = "machine learning", k: int = 5, year_min: Optional[int] = None,
+           year_max: Optional[int] = None, venue: Optional[List[str]] = Query(None),
+           author: Optional[str] = None):
+    """
+    REAL search using BM25 ranking.
+    year_min / year_max / venue (repeatable) / author (substring, any case) restrict the
+    search before scoring: the metadata columns give the matching papers and only their
+    postings are scored.
+    """
+    search_filter = SearchFilter(year_min, year_max, venue, author)
+    with STAGE_SECONDS.time("preprocess"):
+        # the normalized query: UI reruns differing only in case / whitespace share an entry
+        key = json.dumps({"q": clean_text(q), "k": k, "filters": search_filter.to_dict()}, sort_keys=True)
+    result = result_cache.get_or_compute(key, index_generation, lambda: run_search(q, k, search_filter))
+    # rendered here, not by FastAPI after the handler, so serialization is timed too
+    with STAGE_SECONDS.time("serialize"):
+        return JSONResponse(content=dict(result, query=q))
 
-    # Convert query to TF-IDF vector (SAME vector space as documents)
-    query_vector = vectorizer.transform([q])
 
-    # Calculate REAL cosine similarities
-    similarities = cosine_similarity(query_vector, document_vectors).flatten()
-
-    # Get top-k most similar documents
-    top_indices = similarities.argsort()[-k:][::-1]
+def run_search(q: str, k: int, search_filter: SearchFilter):
+    with STAGE_SECONDS.time("filter"):
+        allowed = matching_ids(search_filter) if search_filter else None
+    with STAGE_SECONDS.time("lexical"):
+        # BM25 top-k via WAND over each segment; documents sharing no term are never scored
+        top_hits = lexical_index.search(q, k, keys=allowed)
+        # map scores into [0, 1] against the best score this query could possibly reach
+        bound = lexical_index.score_bound(q) or 1.0
 
     results = []
-    for idx in top_indices:
-        doc = ACADEMIC_DATABASE[idx]
-        similarity_score = float(similarities[idx])
+    for doc_id, score in top_hits:
+        doc = records[doc_id]
+        similarity_score = score / bound
 
         # Convert similarity to percentage (0-100%)
         similarity_percent = similarity_score * 100
@@ -185,8 +294,10 @@ def search(q: str = "machine learning", k: int = 5):
         "query": q,
         "k": k,
         "is_real_search": True,
-        "algorithm": "TF-IDF + Cosine Similarity",
-        "total_documents": len(documents),
+        "algorithm": "BM25",
+        "total_documents": len(lexical_index),
+        "filters": search_filter.to_dict() if search_filter else None,
+        "matching_documents": len(lexical_index) if allowed is None else len(allowed),
         "results_found": len(results),
         "results": {
             "documents": [r["document"] for r in results],
@@ -198,19 +309,28 @@ def search(q: str = "machine learning", k: int = 5):
     }
 
 
+@app.get("/metrics")
+def metrics():
+    """Prometheus text format: per-stage latency histograms, cache and index gauges"""
+    return Response(content=REGISTRY.render(), media_type=CONTENT_TYPE)
+
+
 @app.get("/debug")
 def debug():
     """Show technical details for teacher demonstration"""
     return {
         "for_teacher": "This is REAL semantic search using:",
         "techniques": [
-            "TF-IDF (Term Frequency-Inverse Document Frequency)",
-            "Cosine Similarity for document ranking",
-            "Vector Space Model (Standard IR technique)",
+            "Okapi BM25 (probabilistic relevance framework)",
+            "Inverted index with WAND dynamic pruning",
+            "Log-structured segments with background merging",
             "Academic paper dataset with metadata"
         ],
-        "vector_space_dimensions": document_vectors.shape[1],
-        "sample_features": list(vectorizer.get_feature_names_out()[:10]),
+        "vocabulary_size": lexical_index.vocabulary_size(),
+        "sample_features": sorted(t for t, c in lexical_index.df.items() if c > 0)[:10],
+        "index": lexical_index.stats(),
+        "result_cache": result_cache.stats(),
+        "tracing": tracer.stats(),
         "academic_references": [
             "Salton, G., & McGill, M. J. (1986). Introduction to Modern Information Retrieval.",
             "Manning, C. D., Raghavan, P., & Schütze, H. (2008). Introduction to Information Retrieval.",
@@ -224,13 +344,15 @@ if __name__ == "__main__":
     print("🌐 Server: http://127.0.0.1:8001")
     print("📡 Endpoints:")
     print("   GET  /              - Health check")
-    print("   POST /index         - Show indexing details")
-    print("   GET  /search?q=     - REAL semantic search")
+    print("   POST /index         - Add papers / show indexing details")
+    print("   GET  /search?q=     - REAL semantic search (&year_min=&year_max=&venue=&author=)")
+    print("   GET  /metrics       - Prometheus metrics (per-stage latency, cache, index)")
     print("   GET  /debug         - Technical details for teacher")
+    print("   *    /admin/...     - Tracing, slow requests, profiler (needs SEARCH_ADMIN_TOKEN)")
     print("=" * 60)
     print("🎓 FOR TEACHER DEMONSTRATION:")
-    print("• TF-IDF vectors: REAL text representation")
-    print("• Cosine similarity: Standard IR similarity measure")
+    print("• BM25: REAL probabilistic ranking")
+    print("• Inverted index: only documents sharing a query term are scored")
     print("• Academic dataset: Real research papers")
     print("• This is NOT fake data - it's REAL information retrieval")
     print("=" * 60)
@@ -10,88 +10,16 @@ print("=" * 60)
 print("🚀 SEMANTIC APP STARTING")
 print("=" * 60)
 
-# ========== FIX 1: SIMPLER HUGGINGFACE MOCK ==========
-print("[1/3] Setting up huggingface mock...")
-
-
-# Define functions first (outside class to avoid scoping issues)
-def mock_get_full_repo_name(model_id, namespace=None, **kwargs):
-    if "/" in model_id:
-        return model_id
-    return f"{namespace if namespace else 'user'}/{model_id}"
-
-
-def mock_hf_hub_download(repo_id=None, filename=None, **kwargs):
-    os.makedirs("./models", exist_ok=True)
-    path = f"./models/{filename if filename else 'model.bin'}"
-    return path
-
-
-def mock_cached_download(hf_hub_url=None, **kwargs):
-    if hf_hub_url and "huggingface.co" in hf_hub_url:
-        parts = hf_hub_url.split("/")
-        if len(parts) > 5:
-            repo_id = f"{parts[3]}/{parts[4]}"
-            filename = parts[-1]
-            return mock_hf_hub_download(repo_id=repo_id, filename=filename)
-    return mock_hf_hub_download(repo_id="sentence-transformers/all-MiniLM-L6-v2", filename="pytorch_model.bin")
-
-
-def mock_model_info(repo_id, **kwargs):
-    return type('MockInfo', (), {
-        'id': repo_id,
-        'sha': 'mocksha123'
-    })()
-
-
-def mock_list_repo_files(repo_id, **kwargs):
-    return ["pytorch_model.bin", "config.json"]
-
-
-# Now create the class
-class HuggingFaceMock:
-    """Simple mock of huggingface_hub"""
-    __version__ = "0.19.4"
-
-    # Functions
-    get_full_repo_name = staticmethod(mock_get_full_repo_name)
-    hf_hub_download = staticmethod(mock_hf_hub_download)
-    cached_download = staticmethod(mock_cached_download)
-    model_info = staticmethod(mock_model_info)
-    list_repo_files = staticmethod(mock_list_repo_files)
-
-    # Simple classes
-    class HfApi:
-        def model_info(self, repo_id, **kwargs):
-            return mock_model_info(repo_id)
-
-        def list_repo_files(self, repo_id, **kwargs):
-            return mock_list_repo_files(repo_id)
-
-    HfFolder = type('HfFolder', (), {})
-    Repository = type('Repository', (), {})
-
-    # Constants
-    ENDPOINT = "https://huggingface.co"
-
-    @staticmethod
-    def hf_hub_url(repo_id, filename):
-        return f"https://huggingface.co/{repo_id}/resolve/main/{filename}"
-
-
-# Inject the mock
-sys.modules['huggingface_hub'] = HuggingFaceMock()
-print("  ✓ HuggingFace mock installed")
-
-# ========== FIX 2: CHROMADB CONFIG ==========
-print("[2/3] Configuring environment...")
+# ========== FIX 1: CHROMADB CONFIG ==========
+# (no huggingface mock: the model loads offline from the packed artifact,
+#  see `python -m app.models.artifact`)
+print("[1/2] Configuring environment...")
 os.environ['CHROMA_DB_IMPLEMENTATION'] = 'duckdb+parquet'
 os.environ['CHROMA_ANONYMIZED_TELEMETRY'] = 'false'
-os.makedirs("./models", exist_ok=True)
 print("  ✓ Environment configured")
 
-# ========== FIX 3: IMPORT APP ==========
-print("[3/3] Importing application...")
+# ========== FIX 2: IMPORT APP ==========
+print("[2/2] Importing application...")
 
 # Add to path
 current_dir = os.path.dirname(os.path.abspath(__file__))
@@ -107,14 +35,6 @@ try:
 
     print("  ✓ fastapi, uvicorn")
 
-    # Try sentence-transformers
-    try:
-        from sentence_transformers import SentenceTransformer
-
-        print("  ✓ sentence-transformers")
-    except Exception as e:
-        print(f"  ⚠ sentence-transformers: {e}")
-
     # Try to import actual app
     try:
         from app.main import app
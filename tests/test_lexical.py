@@ -0,0 +1,125 @@
+import math
+import random
+from collections import Counter
+
+import numpy as np
+import pytest
+
+from app.bm25 import BM25Index, Segment
+from app.lexical import PostingCursor, tokenize, wand_top_k
+
+
+def brute_force_top_k(postings, k):
+    scores = Counter()
+    for doc_ids, weights, multiplier in postings:
+        for doc, weight in zip(doc_ids, weights):
+            scores[int(doc)] += multiplier * float(weight)
+    return sorted(scores.items(), key=lambda item: (-item[1], item[0]))[:k]
+
+
+@pytest.mark.parametrize("seed", range(5))
+@pytest.mark.parametrize("k", [1, 5, 50])
+def test_wand_matches_brute_force(seed, k):
+    rng = np.random.default_rng(seed)
+    postings = []
+    for _ in range(4):
+        doc_ids = np.sort(rng.choice(500, size=int(rng.integers(1, 200)), replace=False)).astype(np.int64)
+        postings.append((doc_ids, rng.random(len(doc_ids)).astype(np.float32), float(rng.random() * 3)))
+
+    got = wand_top_k([PostingCursor(ids, w, m) for ids, w, m in postings], k)
+    expected = brute_force_top_k(postings, k)
+    assert [doc for doc, _ in got] == [doc for doc, _ in expected]
+    assert [s for _, s in got] == pytest.approx([s for _, s in expected], rel=1e-5)
+
+
+def test_wand_edge_cases():
+    assert wand_top_k([], 5) == []
+    cursor = PostingCursor(np.array([1, 2], dtype=np.int64), np.array([1.0, 2.0], dtype=np.float32))
+    assert wand_top_k([cursor], 0) == []
+
+
+def test_wand_deadline():
+    doc_ids = np.arange(100000, dtype=np.int64)
+    # increasing weights: every posting beats the running threshold, so none is skipped
+    cursor = PostingCursor(doc_ids, np.arange(1, len(doc_ids) + 1, dtype=np.float32))
+    with pytest.raises(TimeoutError):
+        wand_top_k([cursor], 10, deadline=0.0)
+
+
+WORDS = ["neural", "network", "graph", "retrieval", "ranking", "vision", "speech", "learning",
+         "transformer", "index", "query", "semantic", "sparse", "dense", "model"]
+
+
+def corpus(n, seed=0):
+    rng = random.Random(seed)
+    return [(f"doc{i}", " ".join(rng.choice(WORDS) for _ in range(rng.randint(3, 12)))) for i in range(n)]
+
+
+def bm25_brute_force(docs, query, k, k1=1.2, b=0.75):
+    tokens = {key: tokenize(text) for key, text in docs}
+    n = len(tokens)
+    avgdl = sum(len(t) for t in tokens.values()) / n
+    df = Counter(term for t in tokens.values() for term in set(t))
+    scores = {}
+    for key, toks in tokens.items():
+        tf = Counter(toks)
+        score = 0.0
+        for term in set(tokenize(query)):
+            if tf[term]:
+                idf = math.log(1.0 + (n - df[term] + 0.5) / (df[term] + 0.5))
+                score += idf * tf[term] * (k1 + 1.0) / (tf[term] + k1 * (1.0 - b + b * len(toks) / avgdl))
+        if score > 0:
+            scores[key] = score
+    return sorted(scores.items(), key=lambda item: -item[1])[:k]
+
+
+def test_bm25_matches_brute_force_across_segments():
+    docs = corpus(300)
+    index = BM25Index(flush_docs=40, merge_factor=2, background=False)
+    index.add_many(docs)
+    for query in ["neural ranking", "graph", "sparse dense retrieval model"]:
+        got = index.search(query, 10)
+        expected = bm25_brute_force(docs, query, 10)
+        assert [s for _, s in got] == pytest.approx([s for _, s in expected], rel=1e-4)
+        assert set(key for key, _ in got) <= set(key for key, _ in bm25_brute_force(docs, query, 40))
+
+
+def test_bm25_deleted_documents_never_match():
+    docs = corpus(200, seed=1)
+    index = BM25Index(flush_docs=25, merge_factor=2, background=False)
+    index.add_many(docs)
+    deleted = {key for key, _ in docs[::3]}
+    for key in deleted:
+        index.delete(key)
+    index.flush()
+    hits = index.search("neural network learning", 200)
+    assert hits and not deleted & {key for key, _ in hits}
+    assert len(index) == len(docs) - len(deleted)
+
+
+def test_segment_merge_drops_deleted():
+    docs = [(i, f"doc{i}", tokenize(text)) for i, (_, text) in enumerate(corpus(60, seed=2))]
+    segments = [Segment.build(docs[i:i + 20]) for i in range(0, 60, 20)]
+    deleted = {d[0] for d in docs[::4]}
+    merged, dropped_df, dropped_len = Segment.merge(segments, deleted)
+
+    live = [d for d in docs if d[0] not in deleted]
+    expected = Segment.build(live)
+    assert merged.docnos.tolist() == expected.docnos.tolist()
+    assert merged.keys == expected.keys
+    assert merged.postings.keys() == expected.postings.keys()
+    for term, (ids, tfs) in expected.postings.items():
+        assert merged.postings[term][0].tolist() == ids.tolist()
+        assert merged.postings[term][1].tolist() == tfs.tolist()
+    gone = [d for d in docs if d[0] in deleted]
+    assert dropped_df == Counter(term for d in gone for term in set(d[2]))
+    assert dropped_len == sum(len(d[2]) for d in gone)
+
+
+def test_bm25_replace_and_keys_filter():
+    index = BM25Index(background=False)
+    index.add_many([("a", "graph neural network"), ("b", "speech model"), ("c", "graph index")])
+    index.add("a", "vision transformer")
+    assert "a" not in {key for key, _ in index.search("graph", 5)}
+    assert [key for key, _ in index.search("graph", 5, keys=["c"])] == ["c"]
+    assert index.search("graph", 5, keys=["b"]) == []
@@ -0,0 +1,85 @@
+import numpy as np
+import pytest
+
+from app.filters import SearchFilter
+from app.numpy_store import NumpyCollection
+
+DIM = 16
+N = 600
+
+CONFIGS = [
+    {},
+    {"quantization": "sq8"},
+    {"quantization": "pq", "pq_m": 4},
+    {"ann_index": "ivf", "ann_params": {"nlist": 8, "nprobe": 8}},
+    {"quantization": "sq8", "ann_index": "ivf", "ann_params": {"nlist": 8, "nprobe": 8}},
+]
+
+
+def open_store(path, **config):
+    return NumpyCollection(str(path), block_rows=128, train_min=200, ann_train_min=200, **config)
+
+
+def vectors(n, seed=0):
+    return np.random.default_rng(seed).normal(size=(n, DIM)).astype(np.float32)
+
+
+def fill(store, x):
+    ids = [f"id{i}" for i in range(len(x))]
+    store.add(ids=ids, documents=[f"text {i}" for i in ids], embeddings=x,
+              metadatas=[{"year": 2000 + i % 10} for i in range(len(x))])
+    return ids
+
+
+@pytest.mark.parametrize("config", CONFIGS, ids=lambda c: "-".join(map(str, c.values())) or "exact")
+def test_round_trip(tmp_path, config):
+    x = vectors(N)
+    store = open_store(tmp_path, **config)
+    fill(store, x)
+    store.delete(ids=["id0", "id1"])
+    store.upsert(ids=["id2"], documents=["replaced"], embeddings=-x[2:3], metadatas=[{"year": 1990}])
+
+    for reopened in (store, open_store(tmp_path, **config)):
+        assert reopened.count() == N - 2
+        res = reopened.query(x[5:6], n_results=3)
+        assert res["ids"][0][0] == "id5"
+        assert res["distances"][0][0] == pytest.approx(0.0, abs=1e-2)
+        assert "id0" not in reopened.query(x[0:1], n_results=10)["ids"][0]
+        got = reopened.get(ids=["id0", "id2", "id3"], include=["documents", "metadatas"])
+        assert dict(zip(got["ids"], got["documents"])) == {"id2": "replaced", "id3": "text id3"}
+        assert reopened.query(-x[2:3], n_results=1)["ids"][0] == ["id2"]
+
+        hits = reopened.query(x[7:8], n_results=5, search_filter=SearchFilter(year_min=2007, year_max=2007))
+        assert hits["ids"][0][0] == "id7"
+        assert all(meta["year"] == 2007 for meta in hits["metadatas"][0])
+        assert reopened.query(x[7:8], n_results=5, search_filter=SearchFilter(year_max=1990))["ids"][0] == ["id2"]
+
+
+def test_exact_search_matches_brute_force(tmp_path):
+    x = vectors(N, seed=1)
+    store = open_store(tmp_path)
+    ids = fill(store, x)
+    queries = vectors(5, seed=2)
+    normed = x / np.linalg.norm(x, axis=1, keepdims=True)
+    expected = np.argsort(-(queries / np.linalg.norm(queries, axis=1, keepdims=True)) @ normed.T, axis=1)[:, :10]
+    got = store.query(queries, n_results=10)["ids"]
+    assert got == [[ids[i] for i in row] for row in expected]
+
+
+def test_read_only_rejects_writes(tmp_path):
+    fill(open_store(tmp_path), vectors(10))
+    store = NumpyCollection(str(tmp_path), read_only=True)
+    assert store.count() == 10
+    with pytest.raises(PermissionError):
+        store.delete(ids=["id0"])
+
+
+def test_interrupted_write_is_dropped_on_reload(tmp_path):
+    store = open_store(tmp_path)
+    fill(store, vectors(10))
+    # a crash after the sidecar append but before meta.json was rewritten
+    with open(tmp_path / "docs.jsonl", "ab") as f:
+        f.write(b'{"id": "half", "text": "written"}\n')
+    reopened = open_store(tmp_path)
+    assert reopened.count() == 10
+    assert reopened.get(ids=["half"])["ids"] == []
@@ -0,0 +1,77 @@
+import base64
+import json
+
+import pytest
+
+from app.pagination import ResultPager, decode_cursor, encode_cursor
+
+REQUEST = {"q": "graph neural networks", "mode": "hybrid", "fusion": "rrf", "nprobe": None, "ef": 32,
+           "filter": {"year_min": 2018, "year_max": None, "venues": ["NeurIPS"], "author": None}}
+
+
+def state(**changes):
+    return dict({"r": REQUEST, "g": 3, "o": 10, "n": 5}, **changes)
+
+
+def raw_token(value) -> str:
+    return base64.urlsafe_b64encode(json.dumps(value).encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def test_round_trip():
+    assert decode_cursor(encode_cursor(state()), depth=100) == state()
+
+
+@pytest.mark.parametrize("token", [
+    "",
+    "not a cursor!",
+    raw_token([1, 2, 3]),
+    raw_token({"r": REQUEST, "g": 3, "o": 10}),
+    raw_token(dict(state(), extra=1)),
+])
+def test_rejects_malformed(token):
+    with pytest.raises(ValueError):
+        decode_cursor(token, depth=100)
+
+
+@pytest.mark.parametrize("bad", [
+    state(g="3"),
+    state(o=True),
+    state(n=2.5),
+    state(r=dict(REQUEST, q=None)),
+    state(r=dict(REQUEST, ef="32")),
+    state(r={key: value for key, value in REQUEST.items() if key != "mode"}),
+    state(r=dict(REQUEST, filter=dict(REQUEST["filter"], venues="NeurIPS"))),
+    state(r=dict(REQUEST, filter=dict(REQUEST["filter"], year_min="2018"))),
+    state(r=dict(REQUEST, filter={"year_min": 2018})),
+])
+def test_rejects_wrong_shapes(bad):
+    with pytest.raises(ValueError):
+        decode_cursor(encode_cursor(bad), depth=100)
+
+
+@pytest.mark.parametrize("bad", [state(o=-1), state(o=101), state(n=0), state(n=-5)])
+def test_rejects_out_of_range(bad):
+    with pytest.raises(ValueError):
+        decode_cursor(encode_cursor(bad), depth=100)
+
+
+def test_pages_follow_cursors():
+    pager = ResultPager(depth=100)
+    ids = [f"d{i}" for i in range(12)]
+    ranked = pager.put(REQUEST, 3, {"results": {"ids": [ids], "distances": [[i / 10 for i in range(12)]]}})
+    assert pager.get(REQUEST, 3) == ranked
+    assert pager.get(REQUEST, 4) is None
+
+    def documents(page_ids):
+        return {i: f"text of {i}" for i in page_ids}
+
+    seen, offset = [], 0
+    while True:
+        page = pager.page(REQUEST, 3, ranked, offset, 5, documents)
+        seen += page["results"]["ids"][0]
+        assert page["results"]["documents"][0] == [f"text of {i}" for i in page["results"]["ids"][0]]
+        cursor = page["page"]["next_cursor"]
+        if cursor is None:
+            break
+        offset = decode_cursor(cursor, depth=100)["o"]
+    assert seen == ids
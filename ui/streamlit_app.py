@@ -2,6 +2,7 @@
 import streamlit as st
 import requests
 import time
+import uuid
 
 # ========== CONFIGURATION ==========
 # Backend URL - FIXED for Docker/Container setup
@@ -267,11 +268,17 @@ if st.session_state.search_triggered:
         # Perform search
         with st.spinner(f"Finding academic papers about '{search_term}'..."):
             try:
+                # sent along so a slow or failed search can be found in the backend's traces
+                request_id = uuid.uuid4().hex
                 response = requests.get(
                     f"{BACKEND_URL}/search",
                     params={"q": search_term, "k": k},
+                    headers={"X-Request-ID": request_id},
                     timeout=15
                 )
+                # present when the backend traced this request (opt-in)
+                if response.headers.get("Server-Timing"):
+                    st.caption(f"🧭 Request `{request_id}` · {response.headers['Server-Timing']}")
 
                 if response.status_code == 200:
                     data = response.json()
@@ -345,7 +352,7 @@ if st.session_state.search_triggered:
 
                                     st.divider()
                 else:
-                    st.error(f"❌ Search failed with status {response.status_code}")
+                    st.error(f"❌ Search failed with status {response.status_code} (request id `{request_id}`)")
 
             except requests.exceptions.ConnectionError:
                 st.error("""